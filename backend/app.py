@@ -1,5 +1,7 @@
 import os
 import warnings
+import threading
+import multiprocessing
 
 # Set environment variables before any other imports to suppress TensorFlow warnings
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
@@ -30,57 +32,83 @@ from routes.search import search_bp
 from routes.flashcards import flashcards_bp
 from routes.auth import auth_bp
 from routes.folders import folders_bp
+from routes.jobs import jobs_bp
+from routes.health import health_bp
+from services.embedding_service import warmup
+from services.document_processor import resume_pending_summaries
 
-app = Flask(__name__)
-app.config.from_object(Config)
-CORS(app, origins=["http://localhost:5173"], supports_credentials=True, allow_headers=["Content-Type", "Authorization"], methods=["GET", "POST", "OPTIONS"])
-
-@app.before_request
-def handle_options():
-    if request.method == 'OPTIONS':
-        response = make_response()
-        response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-        return response
-
-# Initialize extensions
-db.init_app(app)
-print(f"DEBUG: JWT_SECRET_KEY: {app.config.get('JWT_SECRET_KEY')}")
-print(f"DEBUG: SECRET_KEY: {app.config.get('SECRET_KEY')}")
-jwt = JWTManager(app)
-
-@jwt.invalid_token_loader
-def invalid_token_callback(error):
-    print(f"DEBUG: Invalid token error: {repr(error)}")
-    return jsonify({'error': 'Invalid token'}), 422
-
-@jwt.expired_token_loader
-def expired_token_callback(error):
-    print(f"DEBUG: Expired token error: {repr(error)}")
-    return jsonify({'error': 'Token expired'}), 401
-
-@jwt.unauthorized_loader
-def unauthorized_callback(error):
-    print(f"DEBUG: Unauthorized error: {repr(error)}")
-    return jsonify({'error': 'Missing token'}), 401
-
-# Create database tables
-with app.app_context():
-    db.create_all()
-
-app.register_blueprint(upload_bp)
-app.register_blueprint(chat_bp)
-app.register_blueprint(summaries_bp)
-app.register_blueprint(quiz_bp)
-app.register_blueprint(documents_bp)
-app.register_blueprint(topics_bp)
-app.register_blueprint(progress_bp)
-app.register_blueprint(search_bp)
-app.register_blueprint(flashcards_bp)
-app.register_blueprint(auth_bp)
-app.register_blueprint(folders_bp)
+def create_app(config_class=Config):
+    """
+    Build and configure the Flask app. Embedding model and vector store clients are created
+    lazily by the services, so this stays cheap; set WARMUP_ON_START to load them in the
+    background as soon as the app starts.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    CORS(app, origins=["http://localhost:5173"], supports_credentials=True, allow_headers=["Content-Type", "Authorization"], methods=["GET", "POST", "OPTIONS"])
+
+    @app.before_request
+    def handle_options():
+        if request.method == 'OPTIONS':
+            response = make_response()
+            response.headers['Access-Control-Allow-Origin'] = 'http://localhost:5173'
+            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+            response.headers['Access-Control-Allow-Credentials'] = 'true'
+            return response
+
+    # Initialize extensions
+    db.init_app(app)
+    print(f"DEBUG: JWT_SECRET_KEY: {app.config.get('JWT_SECRET_KEY')}")
+    print(f"DEBUG: SECRET_KEY: {app.config.get('SECRET_KEY')}")
+    jwt = JWTManager(app)
+
+    @jwt.invalid_token_loader
+    def invalid_token_callback(error):
+        print(f"DEBUG: Invalid token error: {repr(error)}")
+        return jsonify({'error': 'Invalid token'}), 422
+
+    @jwt.expired_token_loader
+    def expired_token_callback(error):
+        print(f"DEBUG: Expired token error: {repr(error)}")
+        return jsonify({'error': 'Token expired'}), 401
+
+    @jwt.unauthorized_loader
+    def unauthorized_callback(error):
+        print(f"DEBUG: Unauthorized error: {repr(error)}")
+        return jsonify({'error': 'Missing token'}), 401
+
+    # Create database tables
+    with app.app_context():
+        db.create_all()
+
+    app.register_blueprint(upload_bp)
+    app.register_blueprint(chat_bp)
+    app.register_blueprint(summaries_bp)
+    app.register_blueprint(quiz_bp)
+    app.register_blueprint(documents_bp)
+    app.register_blueprint(topics_bp)
+    app.register_blueprint(progress_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(flashcards_bp)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(folders_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(health_bp)
+
+    # Spawned PDF extraction workers re-import this module; only the server process warms
+    # up and resumes work
+    if multiprocessing.parent_process() is None:
+        if app.config.get('WARMUP_ON_START'):
+            threading.Thread(target=warmup, name='warmup', daemon=True).start()
+
+        # Summaries a previous run started but never stored
+        if app.config.get('SUMMARY_RESUME_ON_START'):
+            resume_pending_summaries(app)
+
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Write file_type, folder_id and topic flags onto chunks indexed before those fields were
+stored at ingest, so search filters apply to every document. Safe to re-run.
+
+Usage (from the backend directory): python backfill_chunk_metadata.py
+"""
+
+from app import app
+from models import Document
+from services.embedding_service import get_client, set_document_metadata
+from services.document_processor import document_filter_metadata
+
+with app.app_context():
+    for collection in get_client().list_collections():
+        if not collection.name.startswith('user_'):
+            continue
+        user_id = collection.name[len('user_'):]
+        filenames = sorted({metadata['filename'] for metadata in collection.get(include=['metadatas'])['metadatas']})
+
+        # Folder assignments only exist for database users; default_user documents stay unfiled
+        folders = {}
+        if user_id.isdigit():
+            for document in Document.query.filter_by(user_id=int(user_id)).all():
+                folders[document.filename] = document.folder_id
+
+        updated = 0
+        for filename in filenames:
+            updated += set_document_metadata(filename, user_id, document_filter_metadata(filename, user_id, folders.get(filename)))
+        print(f'{collection.name}: {len(filenames)} documents, {updated} chunks updated')
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Compare the original decode-per-window chunker with services.chunking.TextChunker
+on the extracted texts in processed/.
+
+Run from the backend directory: python benchmarks/bench_chunker.py [--repeat N]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tiktoken
+from config import Config
+from services.chunking import TextChunker
+
+
+def legacy_chunk_text(text, chunk_size=512, overlap=100):
+    # The chunker as it was before services/chunking.py, kept verbatim for comparison
+    encoding = tiktoken.get_encoding("cl100k_base")
+    tokens = encoding.encode(text)
+
+    if len(tokens) <= chunk_size:
+        return [text]
+
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = min(start + chunk_size, len(tokens))
+        chunk_tokens = tokens[start:end]
+        chunk_text = encoding.decode(chunk_tokens)
+
+        if end < len(tokens) and not chunk_text.endswith(('.', '!', '?', '\n')):
+            last_period = max(chunk_text.rfind('.'), chunk_text.rfind('!'), chunk_text.rfind('?'))
+            if last_period > chunk_size * 0.7:
+                chunk_text = chunk_text[:last_period + 1]
+
+        chunks.append(chunk_text.strip())
+        start += chunk_size - overlap
+
+        if start >= end:
+            break
+
+    return chunks
+
+
+def time_it(func, text, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(text)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def bench_chunker(repeat=5):
+    files = sorted(f for f in os.listdir(Config.PROCESSED_FOLDER) if f.endswith('.txt'))
+    if not files:
+        print(f"No processed texts found in {Config.PROCESSED_FOLDER}")
+        return
+
+    # Warm the tiktoken registry so neither side pays the one-off BPE load
+    tiktoken.get_encoding("cl100k_base")
+    chunker = TextChunker()
+    new_chunk_text = lambda text: [chunk['text'] for chunk in chunker.chunk(text)]
+
+    print(f"{'file':<55} {'KB':>6} {'chunks':>6} {'legacy ms':>10} {'new ms':>8} {'speedup':>8} {'same':>5}")
+    total_legacy = total_new = 0.0
+    for filename in files:
+        with open(os.path.join(Config.PROCESSED_FOLDER, filename), 'r', encoding='utf-8') as f:
+            text = f.read()
+
+        legacy_time, legacy_chunks = time_it(legacy_chunk_text, text, repeat)
+        new_time, new_chunks = time_it(new_chunk_text, text, repeat)
+        total_legacy += legacy_time
+        total_new += new_time
+
+        # Differences are only expected where a window boundary splits a multi-byte character
+        same = sum(1 for a, b in zip(legacy_chunks, new_chunks) if a == b)
+        print(f"{filename[:55]:<55} {len(text) / 1024:>6.1f} {len(new_chunks):>6} "
+              f"{legacy_time * 1000:>10.2f} {new_time * 1000:>8.2f} {legacy_time / new_time:>7.1f}x "
+              f"{same:>2}/{len(legacy_chunks):<2}")
+
+    print(f"\nTotal (best of {repeat}): legacy {total_legacy * 1000:.2f} ms, new {total_new * 1000:.2f} ms, "
+          f"speedup {total_legacy / total_new:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    bench_chunker(args.repeat)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Load-test query embedding with N concurrent client threads, comparing one model.encode
+call per query ("direct") with the cross-request EmbeddingBatcher ("batched").
+Every query is unique, so the query-embedding LRU cache never hides model cost.
+
+Run from the backend directory:
+    python benchmarks/bench_embed_batcher.py [--clients 1 8 32] [--seconds 5]
+                                             [--max-batch 32] [--max-wait-ms 5]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import itertools
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+from services.embedding_service import get_model, EmbeddingBatcher
+
+
+def load_queries():
+    processed = os.path.join(BACKEND_DIR, 'processed')
+    sentences = []
+    if os.path.isdir(processed):
+        for name in sorted(os.listdir(processed)):
+            with open(os.path.join(processed, name), 'r', encoding='utf-8') as f:
+                sentences.extend(s.strip() for s in f.read().split('.') if len(s.strip()) > 20)
+    return sentences or ['what is the main idea of this lecture']
+
+
+def run_load(encode, clients, seconds, queries):
+    counter = itertools.count()
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def client():
+        local = []
+        while time.perf_counter() < stop_at:
+            n = next(counter)
+            # Suffix keeps every query distinct while staying realistic in length
+            query = f"{queries[n % len(queries)][:200]} ({n})"
+            started = time.perf_counter()
+            encode(query)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+    return len(latencies) / elapsed, p50, p95
+
+
+def bench_embed_batcher(client_counts, seconds, max_batch, max_wait_ms):
+    model = get_model()
+    model.encode(['warmup'])
+    queries = load_queries()
+    batcher = EmbeddingBatcher(max_batch=max_batch, max_wait_ms=max_wait_ms)
+
+    print(f"{'clients':>7}  {'mode':>8}  {'queries/sec':>11}  {'p50 ms':>7}  {'p95 ms':>7}")
+    for clients in client_counts:
+        for mode, encode in (('direct', lambda q: model.encode([q])[0].tolist()), ('batched', batcher.encode)):
+            qps, p50, p95 = run_load(encode, clients, seconds, queries)
+            print(f"{clients:>7}  {mode:>8}  {qps:>11.1f}  {p50 * 1000:>7.1f}  {p95 * 1000:>7.1f}")
+    print(f"batcher: {batcher.get_stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+    bench_embed_batcher(args.clients, args.seconds, args.max_batch, args.max_wait_ms)
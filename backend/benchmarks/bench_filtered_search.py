@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Compare document-scoped search strategies on a synthetic collection (default 10k chunks
+across 200 documents, 384-dim vectors clustered per document):
+
+  overfetch  the old approach: query top_k * 3 over everything, filter filenames in Python
+  where      always a filename $in filter inside the vector query
+  search     search_collection: $in filter for small scopes, unfiltered probe first for
+             scopes over SEARCH_FILTER_MAX_DOCUMENTS documents
+
+Half the queries sit next to an in-scope chunk and half next to a random chunk anywhere
+in the collection (a question the selected documents only partly cover).
+
+For each scope size it reports how many in-scope chunks came back (out of top_k), recall
+against exact brute-force neighbours within the scope, and median query latency.
+The collection is built in a temporary directory; nothing touches chromadb_data/.
+
+Run from the backend directory:
+    python benchmarks/bench_filtered_search.py [--chunks 10000] [--documents 200] [--top-k 5]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+from config import Config
+
+DIM = 384
+
+
+def build_collection(client, chunks, documents, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(documents, DIM))
+    doc_of_chunk = rng.integers(0, documents, size=chunks)
+    vectors = centroids[doc_of_chunk] + rng.normal(scale=1.5, size=(chunks, DIM))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    collection = client.get_or_create_collection(name='user_bench')
+    filenames = [f"doc_{d:04d}.pdf" for d in doc_of_chunk]
+    for start in range(0, chunks, 2000):
+        end = min(start + 2000, chunks)
+        collection.add(
+            ids=[f"chunk_{i}" for i in range(start, end)],
+            embeddings=vectors[start:end].tolist(),
+            documents=[f"chunk {i}" for i in range(start, end)],
+            metadatas=[{'filename': filenames[i], 'chunk_index': i} for i in range(start, end)]
+        )
+    return vectors, np.array(filenames)
+
+
+def overfetch_search(collection, query, top_k, selected):
+    results = collection.query(query_embeddings=[query], n_results=top_k * 3, include=['metadatas', 'distances'])
+    hits = [
+        (results['ids'][0][i], metadata['filename'])
+        for i, metadata in enumerate(results['metadatas'][0])
+        if metadata['filename'] in selected
+    ]
+    return [chunk_id for chunk_id, _ in hits[:top_k]]
+
+
+def bench_filtered_search(chunks, documents, top_k, queries, scopes):
+    from services import embedding_service
+
+    directory = tempfile.mkdtemp(prefix='bench-chroma-')
+    try:
+        Config.CHROMADB_PATH = directory
+        client = embedding_service.get_client()
+        started = time.perf_counter()
+        vectors, filenames = build_collection(client, chunks, documents)
+        print(f"Built {chunks} chunks across {documents} documents in {time.perf_counter() - started:.1f}s")
+        collection = client.get_collection(name='user_bench')
+
+        rng = np.random.default_rng(1)
+        all_documents = sorted(set(filenames))
+        print(f"{'scope':>5}  {'method':>9}  {'returned/top_k':>14}  {'recall':>6}  {'p50 ms':>7}")
+        for scope in scopes:
+            stats = {method: [[], [], []] for method in ('overfetch', 'where', 'search')}
+            for _ in range(queries):
+                selected = set(rng.choice(all_documents, size=scope, replace=False))
+                in_scope = np.where(np.isin(filenames, list(selected)))[0]
+                anchor = rng.choice(in_scope) if rng.random() < 0.5 else rng.integers(0, len(vectors))
+                query = vectors[anchor] + rng.normal(scale=0.02, size=DIM)
+                query = (query / np.linalg.norm(query)).tolist()
+
+                distances = np.linalg.norm(vectors[in_scope] - np.array(query), axis=1)
+                exact = {f"chunk_{i}" for i in in_scope[np.argsort(distances)[:top_k]]}
+                expected = min(top_k, len(in_scope))
+
+                for method in stats:
+                    started = time.perf_counter()
+                    if method == 'overfetch':
+                        ids = overfetch_search(collection, query, top_k, selected)
+                    elif method == 'where':
+                        ids = collection.query(
+                            query_embeddings=[query], n_results=top_k,
+                            where={'filename': {'$in': sorted(selected)}}, include=[]
+                        )['ids'][0]
+                    else:
+                        results = embedding_service.search_collection('user_bench', query, top_k, selected)
+                        ids = [f"chunk_{result['chunk_index']}" for result in results]
+                    elapsed = time.perf_counter() - started
+                    stats[method][0].append(len(ids) / expected)
+                    stats[method][1].append(len(exact & set(ids)) / expected)
+                    stats[method][2].append(elapsed)
+
+            for method, (returned, recall, latencies) in stats.items():
+                print(f"{scope:>5}  {method:>9}  {np.mean(returned):>14.2f}  {np.mean(recall):>6.2f}  "
+                      f"{np.median(latencies) * 1000:>7.1f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=10000)
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--scopes', type=int, nargs='+', default=[1, 5, 20, 100])
+    args = parser.parse_args()
+    bench_filtered_search(args.chunks, args.documents, args.top_k, args.queries, args.scopes)
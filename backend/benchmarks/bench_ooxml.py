@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Compare the direct zipfile/iterparse OOXML extractors with the python-pptx/python-docx
+object-model path on the .pptx/.docx files in documents/ (or the paths given).
+
+Each run happens in a fresh process so peak RSS reflects only that extractor.
+Run from the backend directory: python benchmarks/bench_ooxml.py [files...] [--repeat N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import resource
+import multiprocessing
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+
+def run_extractor(method, filepath, repeat, results):
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Import inside the child so library import cost shows up in the measurement
+    from services import extractors
+
+    ext = filepath.rsplit('.', 1)[-1].lower()
+    if method == 'library':
+        func = extractors._extract_pptx_with_library if ext == 'pptx' else extractors._extract_docx_with_library
+    else:
+        func = extractors.extract_pptx_text if ext == 'pptx' else extractors.extract_docx_text
+
+    best = float('inf')
+    text = ''
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text = func(filepath)
+        best = min(best, time.perf_counter() - started)
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((best, peak_kb - baseline_kb, len(text)))
+
+
+def measure(method, filepath, repeat):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_extractor, args=(method, filepath, repeat, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def bench_ooxml(files, repeat=3):
+    if not files:
+        documents_folder = os.path.join(BACKEND_DIR, 'documents')
+        files = sorted(
+            os.path.join(documents_folder, f) for f in os.listdir(documents_folder)
+            if f.lower().endswith(('.pptx', '.docx'))
+        )
+    if not files:
+        print("No .pptx/.docx files to benchmark")
+        return
+
+    print(f"{'file':<50} {'method':<8} {'ms':>9} {'MB/s':>7} {'peak RSS MB':>12} {'chars':>8}")
+    for filepath in files:
+        size_mb = os.path.getsize(filepath) / (1024 * 1024)
+        for method in ('library', 'direct'):
+            seconds, rss_kb, chars = measure(method, filepath, repeat)
+            print(f"{os.path.basename(filepath)[:50]:<50} {method:<8} {seconds * 1000:>9.1f} "
+                  f"{size_mb / seconds:>7.1f} {rss_kb / 1024:>12.1f} {chars:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    bench_ooxml(args.files, args.repeat)
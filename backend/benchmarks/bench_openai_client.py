@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Exercise the shared OpenAI client against a local stand-in for the chat completions API.
+The stand-in answers after --latency-ms, fails a share of requests with 429 or 500, and
+counts the TCP connections it sees, so pooling (keep-alive), jittered retries and the
+concurrency limit can be checked without network access or an API key.
+
+Run from the backend directory:
+    python benchmarks/bench_openai_client.py [--requests 64] [--clients 16] [--latency-ms 200]
+                                             [--fail-rate 0.2] [--max-concurrency 4] [--stream]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    latency = 0.2
+    fail_rate = 0.0
+    lock = threading.Lock()
+    connections = set()
+    status_counts = {}
+    active = 0
+    peak_active = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _count(self, status):
+        with StandIn.lock:
+            StandIn.status_counts[status] = StandIn.status_counts.get(status, 0) + 1
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with StandIn.lock:
+            StandIn.connections.add(self.client_address)
+            StandIn.active += 1
+            StandIn.peak_active = max(StandIn.peak_active, StandIn.active)
+        try:
+            time.sleep(StandIn.latency)
+            roll = random.random()
+            if roll < StandIn.fail_rate / 2:
+                return self._error(429, 'rate_limit_exceeded', {'retry-after': '0.05'})
+            if roll < StandIn.fail_rate:
+                return self._error(500, 'server_error')
+            if body.get('stream'):
+                return self._stream(body)
+            self._json(200, {
+                'id': 'chatcmpl-standin', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': 'stand-in answer'}}],
+                'usage': {'prompt_tokens': 1, 'completion_tokens': 2, 'total_tokens': 3}
+            })
+        finally:
+            with StandIn.lock:
+                StandIn.active -= 1
+
+    def _json(self, status, payload, headers=None):
+        self._count(status)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, code, headers=None):
+        self._json(status, {'error': {'message': code, 'type': code, 'code': code}}, headers)
+
+    def _stream(self, body):
+        self._count(200)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send(text):
+            data = text.encode()
+            self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+            self.wfile.flush()
+
+        for word in ['stand-in ', 'streamed ', 'answer']:
+            chunk = {'id': 'chatcmpl-standin', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': body.get('model'),
+                     'choices': [{'index': 0, 'delta': {'content': word}, 'finish_reason': None}]}
+            send(f'data: {json.dumps(chunk)}\n\n')
+        send('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent caller threads')
+    parser.add_argument('--latency-ms', type=float, default=200)
+    parser.add_argument('--fail-rate', type=float, default=0.2, help='Share of requests answered 429/500')
+    parser.add_argument('--max-concurrency', type=int, default=4)
+    parser.add_argument('--stream', action='store_true')
+    args = parser.parse_args()
+
+    StandIn.latency = args.latency_ms / 1000
+    StandIn.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Settings are read when the client module is imported
+    os.environ.update({
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{server.server_port}/v1',
+        'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY') or 'sk-standin',
+        'OPENAI_MAX_CONCURRENCY': str(args.max_concurrency),
+        'OPENAI_RETRY_BASE_DELAY': '0.05',
+        'OPENAI_MAX_RETRIES': '5'
+    })
+    from services.openai_client import call_chat_completion, stream_chat_completion_chunks, get_openai_metrics
+
+    def one(i):
+        messages = [{'role': 'user', 'content': f'question {i}'}]
+        try:
+            if args.stream:
+                chunks = list(stream_chat_completion_chunks('stream', model='gpt-3.5-turbo', messages=messages))
+                return bool(chunks)
+            return call_chat_completion('qa', model='gpt-3.5-turbo', messages=messages).choices[0].message.content is not None
+        except Exception as e:
+            print(f"Request {i} failed: {type(e).__name__}: {e}")
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        ok = sum(executor.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    print(f"{ok}/{args.requests} succeeded in {elapsed:.2f}s ({args.requests / elapsed:.1f} req/s)")
+    print(f"stand-in: responses by status {StandIn.status_counts}, "
+          f"peak concurrent requests {StandIn.peak_active} (limit {args.max_concurrency}), "
+          f"TCP connections opened {len(StandIn.connections)}")
+    print(json.dumps(get_openai_metrics(), indent=2))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
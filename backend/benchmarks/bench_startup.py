@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Measure process startup cost: importing the app (create_app) in a fresh interpreter, and
+what a warmup then adds. Also reports which heavy libraries the plain import pulled in,
+which should be none now that the model, vector store and OpenAI clients load lazily.
+
+Run from the backend directory: python benchmarks/bench_startup.py [--repeat N] [--warmup]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY_MODULES = ['sentence_transformers', 'torch', 'tensorflow', 'transformers', 'chromadb', 'openai']
+
+CHILD_SCRIPT = '''
+import sys, time, json, io, contextlib
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+result = {'import_app': time.perf_counter() - started}
+result['heavy_loaded'] = [name for name in %(heavy)r if name in sys.modules]
+if %(warmup)r:
+    from services.embedding_service import warmup
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        timings = warmup()
+    result['warmup'] = time.perf_counter() - started
+    result['warmup_steps'] = timings
+print(json.dumps(result))
+'''
+
+
+def run_child(warmup):
+    script = CHILD_SCRIPT % {'heavy': HEAVY_MODULES, 'warmup': warmup}
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=BACKEND_DIR,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_startup(repeat=5, warmup=False):
+    runs = [run_child(warmup) for _ in range(repeat)]
+    imports = sorted(run['import_app'] for run in runs)
+    print(f"import app (create_app): best {imports[0] * 1000:.0f} ms, "
+          f"median {imports[len(imports) // 2] * 1000:.0f} ms over {repeat} fresh processes")
+    print(f"heavy modules loaded by import: {runs[-1]['heavy_loaded'] or 'none'}")
+    if warmup:
+        warmups = sorted(run['warmup'] for run in runs)
+        print(f"warmup: median {warmups[len(warmups) // 2] * 1000:.0f} ms, steps {runs[-1]['warmup_steps']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', action='store_true', help='Also time warmup() after the import')
+    args = parser.parse_args()
+    bench_startup(args.repeat, args.warmup)
@@ -26,6 +26,8 @@ class Config:
     CHROMADB_PATH = os.path.join(os.path.dirname(__file__), 'chromadb_data')
     DOCUMENTS_FOLDER = os.path.join(os.path.dirname(__file__), 'documents')
     PROCESSED_FOLDER = os.path.join(os.path.dirname(__file__), 'processed')
+    BLOBS_FOLDER = os.path.join(os.path.dirname(__file__), 'blobs')
+    BLOB_INDEX_FILE = os.path.join(os.path.dirname(__file__), 'blobs.json')
     SUMMARIES_FILE = os.path.join(os.path.dirname(__file__), 'summaries.json')
     QUIZZES_FILE = os.path.join(os.path.dirname(__file__), 'quizzes.json')
     TOPICS_FILE = os.path.join(os.path.dirname(__file__), 'topics.json')
@@ -34,3 +36,66 @@ class Config:
     CHATS_FILE = os.path.join(os.path.dirname(__file__), 'chats.json')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'pdf', 'docx', 'pptx', 'txt'}
+    INGEST_MAX_WORKERS = int(os.getenv('INGEST_MAX_WORKERS', '2'))  # Concurrent document ingestion jobs
+    INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '32'))  # Jobs allowed to wait for a worker
+    PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))  # 0 = in-process
+    PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '8'))
+    PDF_PAGE_TIMEOUT = int(os.getenv('PDF_PAGE_TIMEOUT', '30'))  # Seconds before a page is skipped
+    PDF_POOL_MIN_PAGES = int(os.getenv('PDF_POOL_MIN_PAGES', '24'))  # Smaller PDFs are extracted in-process
+    EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+    EMBEDDING_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'embedding_cache', 'embeddings.sqlite3')  # Chunk vectors by (model, text hash)
+    EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+    KEYWORD_INDEX_PATH = os.path.join(os.path.dirname(__file__), 'keyword_index', 'keyword_index.sqlite3')  # Per-user BM25 index over chunks
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024'))  # Cached query vectors (LRU)
+    EMBED_BATCH_MAX_SIZE = int(os.getenv('EMBED_BATCH_MAX_SIZE', '32'))  # Queries per batched encode; 1 disables batching
+    EMBED_BATCH_MAX_WAIT_MS = float(os.getenv('EMBED_BATCH_MAX_WAIT_MS', '5'))  # How long a batch waits to fill
+    SEARCH_FILTER_MAX_DOCUMENTS = int(os.getenv('SEARCH_FILTER_MAX_DOCUMENTS', '10'))  # Larger document scopes probe unfiltered first
+    HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))  # Reciprocal rank fusion damping constant
+    HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '20'))  # Results taken from each retriever before fusing
+    HYBRID_SEARCH_WORKERS = int(os.getenv('HYBRID_SEARCH_WORKERS', '4'))  # Threads running the keyword side of hybrid search
+    HYBRID_QA_TOP_K = int(os.getenv('HYBRID_QA_TOP_K', '5'))  # Chunks sent to the model when /api/ask uses hybrid retrieval
+    QA_INPUT_TOKEN_BUDGET = int(os.getenv('QA_INPUT_TOKEN_BUDGET', '3000'))  # Prompt + history + context tokens sent per question
+    QA_HISTORY_BUDGET_SHARE = float(os.getenv('QA_HISTORY_BUDGET_SHARE', '0.25'))  # Share of the non-prompt budget chat history may use
+    CONTEXT_MMR_LAMBDA = float(os.getenv('CONTEXT_MMR_LAMBDA', '0.7'))  # Relevance vs. novelty when picking context chunks
+    CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', '0.8'))  # Word overlap at which a chunk counts as a duplicate
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')  # e.g. a local stand-in server; defaults to the OpenAI API
+    OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))  # Pooled HTTP connections kept alive to the API
+    OPENAI_KEEPALIVE_SECONDS = float(os.getenv('OPENAI_KEEPALIVE_SECONDS', '60'))
+    OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '8'))  # LLM requests in flight across the process
+    OPENAI_QUEUE_TIMEOUT = float(os.getenv('OPENAI_QUEUE_TIMEOUT', '30'))  # Seconds to wait for a free request slot
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+    OPENAI_TIMEOUTS = {  # Read timeout in seconds per call type (for streams, between chunks)
+        'default': 60, 'qa': 45, 'stream': 20, 'categorize': 15, 'summary': 30,
+        'detailed_summary': 90, 'section_summary': 45, 'quiz': 90, 'question_bank': 60, 'knowledge_graph': 90, 'flashcards': 60
+    }
+    OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '3'))  # Retries on 429, 5xx and connection errors
+    OPENAI_RETRY_BASE_DELAY = float(os.getenv('OPENAI_RETRY_BASE_DELAY', '0.5'))  # Seconds; doubles per attempt, with full jitter
+    OPENAI_RETRY_MAX_DELAY = float(os.getenv('OPENAI_RETRY_MAX_DELAY', '8'))
+    LLM_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'llm_cache', 'llm_cache.sqlite3')  # Completions by (model, messages, params) hash
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))  # Seconds a cached completion is served
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000'))  # Least recently used entries are evicted past this
+    ANSWER_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'answer_cache', 'answers.sqlite3')  # Answers by context, matched on query embedding
+    ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+    ANSWER_CACHE_MAX_DISTANCE = float(os.getenv('ANSWER_CACHE_MAX_DISTANCE', '0.1'))  # Cosine distance within which two questions count as the same
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '10000'))  # Least recently used answers are evicted past this
+    SECTION_SUMMARY_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'summary_cache', 'sections.sqlite3')  # Section summaries by content hash
+    SECTION_SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv('SECTION_SUMMARY_CACHE_MAX_ENTRIES', '20000'))  # Least recently used entries are evicted past this
+    DETAILED_SUMMARY_SECTION_TOKENS = int(os.getenv('DETAILED_SUMMARY_SECTION_TOKENS', '1500'))  # Largest section summarized in one call
+    DETAILED_SUMMARY_REDUCE_TOKENS = int(os.getenv('DETAILED_SUMMARY_REDUCE_TOKENS', '6000'))  # Section summaries combined per call
+    DETAILED_SUMMARY_MAP_WORKERS = int(os.getenv('DETAILED_SUMMARY_MAP_WORKERS', '8'))  # Sections of one document summarized in parallel
+    CATEGORIZE_MIN_SIMILARITY = float(os.getenv('CATEGORIZE_MIN_SIMILARITY', '0.5'))  # Centroid match needed to skip the LLM
+    CATEGORIZE_MIN_MARGIN = float(os.getenv('CATEGORIZE_MIN_MARGIN', '0.05'))  # Lead over the runner-up topic needed to skip the LLM
+    CATEGORIZE_LLM_CONCURRENCY = int(os.getenv('CATEGORIZE_LLM_CONCURRENCY', '4'))  # Parallel LLM calls for low-confidence documents
+    QUESTION_BANK_PATH = os.path.join(os.path.dirname(__file__), 'question_bank', 'questions.sqlite3')  # Pre-generated quiz questions per document
+    QUESTION_BANK_ENABLED = os.getenv('QUESTION_BANK_ENABLED', 'true').lower() == 'true'
+    QUESTION_BANK_RANGE_CHUNKS = int(os.getenv('QUESTION_BANK_RANGE_CHUNKS', '4'))  # Consecutive chunks each batch of questions is written from
+    QUESTION_BANK_QUESTIONS_PER_RANGE = int(os.getenv('QUESTION_BANK_QUESTIONS_PER_RANGE', '4'))  # Questions asked for per chunk range (one LLM call)
+    QUESTION_BANK_TARGET = int(os.getenv('QUESTION_BANK_TARGET', '24'))  # Questions generated per document at ingest
+    QUESTION_BANK_MIN_FRESH = int(os.getenv('QUESTION_BANK_MIN_FRESH', '10'))  # Unserved questions below which a document is topped up
+    QUESTION_BANK_TOP_UP_RANGES = int(os.getenv('QUESTION_BANK_TOP_UP_RANGES', '3'))  # Chunk ranges generated per top-up
+    QUESTION_BANK_MAX_QUESTIONS = int(os.getenv('QUESTION_BANK_MAX_QUESTIONS', '200'))  # Top-ups stop once a document has this many
+    QUESTION_BANK_WORKERS = int(os.getenv('QUESTION_BANK_WORKERS', '2'))  # Documents filled or topped up in the background at once
+    QUESTION_BANK_RANGE_WORKERS = int(os.getenv('QUESTION_BANK_RANGE_WORKERS', '4'))  # Chunk ranges of one document generated in parallel
+    SUMMARY_RESUME_ON_START = os.getenv('SUMMARY_RESUME_ON_START', 'true').lower() == 'true'  # Re-queue summaries left pending by a previous run
+    WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'false').lower() == 'true'  # Load the model in the background at startup
@@ -1,43 +1,140 @@
+#!/usr/bin/env python3
+"""
+Generate the short document summaries missing from summaries.json, from the processed text
+ingestion already saved, so no document is extracted again.
+
+Documents are summarized concurrently, with LLM calls started at no more than
+--rate-per-minute. Each summary is written to summaries.json (and its owner's Document row)
+as soon as it's ready, and documents whose content hash already has a summary are skipped,
+so an interrupted run resumes where it stopped.
+
+Usage (from the backend directory):
+    python generate_missing_summaries.py [--user-id default_user] [--workers 4] [--rate-per-minute 60]
+"""
+
 import os
-import json
+import sys
 import time
-from services.qa_service import generate_single_summary
-from services.document_processor import extract_text
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Summaries a previous run left pending are picked up by this run, not re-queued by the app
+os.environ['SUMMARY_RESUME_ON_START'] = 'false'
+
+from app import app
 from config import Config
+from services.document_processor import chunk_text, run_summary_stage, save_document_summary
+from services.summary_store import summary_source_hash, get_summary_entries, COMPLETED
+
+
+class RateLimiter:
+    """
+    Spaces calls evenly so no more than per_minute start in any minute (0 = unlimited).
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        time.sleep(start - now)
+
+
+class Stats:
+    def __init__(self, total):
+        self.total = total
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.generated = 0
+        self.reused = 0
+        self.skipped = 0
+        self.unprocessed = 0
+        self.failed = 0
+
+    def add(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def report(self, final=False):
+        minutes = max(time.perf_counter() - self.started, 1e-9) / 60
+        done = self.generated + self.reused + self.skipped + self.unprocessed + self.failed
+        label = 'Done' if final else 'Progress'
+        print(f"{label}: {done}/{self.total} documents ({self.generated} summarized, {self.reused} reused, "
+              f"{self.skipped} already summarized, {self.unprocessed} not processed, {self.failed} failed) | "
+              f"{done / minutes:.1f} docs/min, {self.generated / minutes:.1f} summaries/min")
+
+
+def summarize_document(filename, entry, default_user_id, limiter, stats):
+    # Summaries from before content hashes were recorded are kept as they are
+    if entry and entry.get('summary') is not None and 'source_hash' not in entry:
+        stats.add('skipped')
+        return
+
+    processed_file = os.path.join(Config.PROCESSED_FOLDER, f"{filename}.txt")
+    if not os.path.exists(processed_file):
+        stats.add('unprocessed')
+        return
+    with open(processed_file, 'r', encoding='utf-8') as f:
+        chunks = chunk_text(f.read())
+    if not chunks:
+        stats.add('unprocessed')
+        return
+
+    if entry and entry.get('source_hash') == summary_source_hash(chunks) and entry.get('status', COMPLETED) == COMPLETED:
+        stats.add('skipped')
+        return
+
+    user_id = entry['user_id'] if entry and entry.get('user_id') else default_user_id
+    summary, status = run_summary_stage(chunks, filename, user_id, throttle=limiter.wait)
+    if summary:
+        save_document_summary(app, filename, user_id, summary)
+    stats.add({'generated': 'generated', 'reused': 'reused'}.get(status, 'failed'))
+
+
+def run(user_id, workers, rate_per_minute, report_every):
+    documents = sorted(
+        f for f in os.listdir(Config.DOCUMENTS_FOLDER)
+        if '.' in f and f.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
+    )
+    entries = get_summary_entries()
+    print(f'Found {len(documents)} documents, {len(entries)} existing summaries')
+
+    stats = Stats(len(documents))
+    limiter = RateLimiter(rate_per_minute)
+    completed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(summarize_document, filename, entries.get(filename), user_id, limiter, stats)
+            for filename in documents
+        ]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error summarizing document: {str(e)}")
+                stats.add('failed')
+            completed += 1
+            if completed % report_every == 0:
+                stats.report()
+
+    stats.report(final=True)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate missing document summaries from processed text.")
+    parser.add_argument('--user-id', default='default_user', help='Owner recorded for documents without a summary entry')
+    parser.add_argument('--workers', type=int, default=4, help='Documents summarized concurrently')
+    parser.add_argument('--rate-per-minute', type=float, default=60, help='Most LLM calls started per minute (0 = no limit)')
+    parser.add_argument('--report-every', type=int, default=10, help='Print progress every N documents')
+    args = parser.parse_args()
 
-# Load existing summaries
-summaries_file = Config.SUMMARIES_FILE
-if os.path.exists(summaries_file):
-    with open(summaries_file, 'r') as f:
-        summaries = json.load(f)
-else:
-    summaries = {}
-
-# Get list of documents
-documents_folder = Config.DOCUMENTS_FOLDER
-documents = [f for f in os.listdir(documents_folder) if f.endswith(tuple(Config.ALLOWED_EXTENSIONS))]
-
-print(f'Found {len(documents)} documents')
-print(f'Existing summaries: {len(summaries)}')
-
-for filename in documents:
-    if filename not in summaries:
-        print(f'Generating summary for {filename}')
-        filepath = os.path.join(documents_folder, filename)
-        try:
-            text = extract_text(filepath)
-            summary = generate_single_summary(text, filename)
-            summaries[filename] = {
-                'summary': summary,
-                'timestamp': str(int(time.time())),
-                'user_id': 'default_user'
-            }
-            print(f'Summary generated for {filename}')
-        except Exception as e:
-            print(f'Error generating summary for {filename}: {str(e)}')
-
-# Save the updated summaries
-with open(summaries_file, 'w') as f:
-    json.dump(summaries, f, indent=2)
-
-print('Summary generation complete')
+    stats = run(args.user_id, args.workers, args.rate_per_minute, max(1, args.report_every))
+    sys.exit(1 if stats.failed else 0)
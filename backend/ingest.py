@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Bulk-index a directory of documents, or a manifest listing them, into a user's collection.
+
+Runs a staged pipeline: a process pool extracts text, the main thread chunks and diffs each
+document against what is already indexed, and a single embedding thread batches new chunks
+across documents into large model.encode calls and bulk collection writes.
+Once a document's chunks are written, its summary and quiz question bank are generated on a
+small thread pool. Progress is checkpointed per document, so an interrupted run picks up where
+it stopped.
+
+Usage (from the backend directory):
+    python ingest.py <directory | manifest.txt> [--user-id default_user] [--batch-size 256]
+                     [--workers N] [--summary-workers 4] [--checkpoint ingest_checkpoint.json]
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from werkzeug.utils import secure_filename
+from config import Config
+from services.blob_store import file_sha256, save_upload, get_indexed_source, mark_indexed
+
+# Heavy modules (sentence-transformers, chromadb) are imported in run_ingest so that
+# extraction workers, which re-import this file under spawn, stay lightweight.
+
+
+def _init_extract_worker():
+    # Workers are already one process per document; don't fan PDFs out again from inside them
+    Config.PDF_EXTRACT_WORKERS = 0
+
+
+def _extract_worker(filepath):
+    from services.extractors import extract_document_text
+    return extract_document_text(filepath)
+
+
+def collect_paths(source):
+    """
+    Files to ingest: every supported file under a directory, or the paths listed one per
+    line in a manifest file (blank lines and '#' comments ignored).
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                paths.append(os.path.join(root, name))
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+        paths = [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+    return [
+        os.path.abspath(path) for path in paths
+        if '.' in path and path.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
+    ]
+
+
+def unique_filenames(paths):
+    """
+    Stored filename for each path: its secure basename, or, where several paths share a
+    basename, their path relative to the common directory (cs101/lecture1.pdf becomes
+    cs101_lecture1.pdf). Paths whose names still collide map to None.
+    """
+    by_name = {}
+    for path in paths:
+        by_name.setdefault(secure_filename(os.path.basename(path)), []).append(path)
+
+    names = {}
+    for name, group in by_name.items():
+        if len(group) == 1:
+            names[group[0]] = name
+            continue
+        base = os.path.commonpath([os.path.dirname(path) for path in group])
+        for path in group:
+            names[path] = secure_filename(os.path.relpath(path, base))
+
+    counts = Counter(names.values())
+    return {path: name if counts[name] == 1 else None for path, name in names.items()}
+
+
+class Checkpoint:
+    """
+    Maps each ingested source path to the content hash it was ingested with.
+    Saved atomically after every update so a crash loses at most the in-flight batch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.completed = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.completed = json.load(f).get('completed', {})
+
+    def is_done(self, filepath, content_hash):
+        with self.lock:
+            return self.completed.get(filepath) == content_hash
+
+    def mark_done(self, filepath, content_hash):
+        with self.lock:
+            self.completed[filepath] = content_hash
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.ingest-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'completed': self.completed}, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class Stats:
+    def __init__(self, total):
+        self.total = total
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.docs = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.skipped = 0
+        self.linked = 0
+        self.failed = 0
+        self.summarized = 0
+        self.summary_failed = 0
+        self.cache = {'hits': 0, 'misses': 0}
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def report(self, final=False):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        lookups = self.cache['hits'] + self.cache['misses']
+        label = 'Done' if final else 'Progress'
+        print(f"{label}: {self.docs + self.skipped + self.failed}/{self.total} files "
+              f"({self.docs} indexed, {self.linked} linked, {self.skipped} unchanged, {self.failed} failed) | "
+              f"{self.chunks} chunks, {self.embedded} embedded, {self.summarized} summarized "
+              f"({self.summary_failed} failed) | "
+              f"{self.docs / elapsed:.2f} docs/sec, {self.chunks / elapsed:.1f} chunks/sec | "
+              f"embedding cache hit ratio {self.cache['hits'] / lookups if lookups else 0:.0%}")
+
+
+def run_ingest(paths, user_id, batch_size=256, workers=None, checkpoint_path=None, summary_workers=4):
+    from services.document_processor import chunk_document, link_duplicate_document, document_filter_metadata, run_summary_stage
+    from services.embedding_service import (
+        make_chunk_ids, build_chunk_metadatas, get_document_chunk_ids,
+        update_chunk_metadata, delete_chunks, encode_chunks, add_chunks, get_document_chunks
+    )
+    from services.question_bank import fill_document_bank
+
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    checkpoint = Checkpoint(checkpoint_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ingest_checkpoint.json'))
+    stats = Stats(len(paths))
+    filenames = unique_filenames(paths)
+    os.makedirs(Config.DOCUMENTS_FOLDER, exist_ok=True)
+    os.makedirs(Config.PROCESSED_FOLDER, exist_ok=True)
+
+    # --- Stage 4: summary and question bank of each written document, on a thread pool ---
+    post_executor = ThreadPoolExecutor(max_workers=max(1, summary_workers), thread_name_prefix='ingest-summary')
+
+    def post_index(filename, chunks):
+        # chunks: the document's chunk dicts in chunk order, or None to read them back from the index
+        try:
+            if chunks is None:
+                chunks = get_document_chunks(filename, user_id)
+            _, status = run_summary_stage([chunk['chunk'] for chunk in chunks], filename, user_id)
+            stats.add(**{'summary_failed' if status == 'failed' else 'summarized': 1})
+            if Config.QUESTION_BANK_ENABLED:
+                fill_document_bank(filename, user_id, chunks)
+        except Exception as e:
+            print(f"Error summarizing {filename}: {str(e)}")
+            stats.add(summary_failed=1)
+
+    # --- Stage 3: batched embedding and bulk writes, on its own thread ---
+    embed_queue = queue.Queue(maxsize=8)
+
+    def finish(doc):
+        mark_indexed(doc['content_hash'], user_id, doc['filename'], doc['chunks_count'], doc['text_length'])
+        checkpoint.mark_done(doc['path'], doc['content_hash'])
+        stats.add(docs=1, chunks=doc['chunks_count'])
+        post_executor.submit(post_index, doc['filename'], doc['all_chunks'])
+
+    def flush(docs):
+        ids, chunks, metadatas = [], [], []
+        for doc in docs:
+            ids.extend(doc['ids'])
+            chunks.extend(doc['chunks'])
+            metadatas.extend(doc['metadatas'])
+        if chunks:
+            add_chunks(user_id, ids, chunks, encode_chunks(chunks, batch_size=batch_size, cache_stats=stats.cache), metadatas)
+            stats.add(embedded=len(chunks))
+        for doc in docs:
+            finish(doc)
+
+    def embed_stage():
+        buffered, buffered_chunks = [], 0
+        while True:
+            doc = embed_queue.get()
+            if doc is not None:
+                buffered.append(doc)
+                buffered_chunks += len(doc['chunks'])
+                if buffered_chunks < batch_size:
+                    continue
+            if buffered:
+                try:
+                    flush(buffered)
+                except Exception as e:
+                    print(f"Error embedding batch of {len(buffered)} documents: {str(e)}")
+                    stats.add(failed=len(buffered))
+                buffered, buffered_chunks = [], 0
+                stats.report()
+            if doc is None:
+                return
+
+    embedder = threading.Thread(target=embed_stage, name='ingest-embed', daemon=True)
+    embedder.start()
+
+    # --- Stage 2: chunk and diff against the stored chunks, in the main thread ---
+    def prepare(job, text):
+        filename = job['filename']
+        processed_filepath = os.path.join(Config.PROCESSED_FOLDER, f"{filename}.txt")
+        with open(processed_filepath, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+        chunked = chunk_document(text)
+        chunks = [chunk['text'] for chunk in chunked]
+        document_metadata = document_filter_metadata(filename, user_id)
+        ids = make_chunk_ids(filename, chunks)
+        existing = set(get_document_chunk_ids(filename, user_id))
+        added = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+        unchanged = [i for i, chunk_id in enumerate(ids) if chunk_id in existing]
+        stale = existing - set(ids)
+
+        if unchanged:
+            update_chunk_metadata([ids[i] for i in unchanged], unchanged, filename, user_id,
+                                  content_hash=job['content_hash'], chunk_metadatas=[chunked[i] for i in unchanged],
+                                  document_metadata=document_metadata)
+        if stale:
+            delete_chunks(stale, user_id)
+
+        embed_queue.put({
+            **job,
+            'ids': [ids[i] for i in added],
+            'chunks': [chunks[i] for i in added],
+            'metadatas': build_chunk_metadatas(filename, added, job['content_hash'], [chunked[i] for i in added], document_metadata),
+            'chunks_count': len(chunks),
+            'text_length': len(text),
+            'all_chunks': [
+                {'chunk': chunk['text'], 'chunk_index': i, 'char_start': chunk['char_start'], 'char_end': chunk['char_end']}
+                for i, chunk in enumerate(chunked)
+            ]
+        })
+
+    # --- Stage 1: extraction on a process pool, at most two files per worker in flight ---
+    def jobs():
+        for path in paths:
+            try:
+                content_hash = file_sha256(path)
+                if checkpoint.is_done(path, content_hash):
+                    stats.add(skipped=1)
+                    continue
+
+                filename = filenames[path]
+                if filename is None:
+                    print(f"Error preparing {path}: its stored filename collides with another file's, rename one of them")
+                    stats.add(failed=1)
+                    continue
+                with open(path, 'rb') as f:
+                    save_upload(f, os.path.join(Config.DOCUMENTS_FOLDER, filename))
+
+                # Identical bytes already indexed somewhere: link the stored vectors instead
+                if get_indexed_source(content_hash):
+                    linked = link_duplicate_document(content_hash, filename, user_id, document_filter_metadata(filename, user_id))
+                    if linked:
+                        checkpoint.mark_done(path, content_hash)
+                        stats.add(docs=1, linked=1, chunks=linked['chunks_count'])
+                        post_executor.submit(post_index, filename, None)
+                        continue
+
+                yield {'path': path, 'filename': filename, 'content_hash': content_hash}
+            except Exception as e:
+                print(f"Error preparing {path}: {str(e)}")
+                stats.add(failed=1)
+
+    pending = {}
+    job_iter = jobs()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_extract_worker) as executor:
+        def submit_next():
+            job = next(job_iter, None)
+            if job:
+                pending[executor.submit(_extract_worker, job['path'])] = job
+            return job is not None
+
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                try:
+                    prepare(job, future.result())
+                except Exception as e:
+                    print(f"Error ingesting {job['path']}: {str(e)}")
+                    stats.add(failed=1)
+                submit_next()
+
+    embed_queue.put(None)
+    embedder.join()
+    print('Waiting for summaries and question banks...')
+    post_executor.shutdown(wait=True)
+    stats.report(final=True)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-index documents into a user's collection.")
+    parser.add_argument('source', help='Directory to scan, or a manifest file with one path per line')
+    parser.add_argument('--user-id', default='default_user')
+    parser.add_argument('--batch-size', type=int, default=256, help='Chunks per model.encode call')
+    parser.add_argument('--workers', type=int, default=None, help='Extraction processes')
+    parser.add_argument('--summary-workers', type=int, default=4, help='Documents summarized concurrently after indexing')
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default: ingest_checkpoint.json)')
+    args = parser.parse_args()
+
+    paths = collect_paths(args.source)
+    print(f'Found {len(paths)} documents')
+    stats = run_ingest(paths, args.user_id, args.batch_size, args.workers, args.checkpoint, args.summary_workers)
+    sys.exit(1 if stats.failed else 0)
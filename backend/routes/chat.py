@@ -1,6 +1,7 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from services.chat_service import get_user_chats, save_chat, get_chat_by_id, delete_chat
-from services.qa_service import ask_question
+from services.qa_service import ask_question, stream_question
+import json
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 chat_bp = Blueprint('chat', __name__)
@@ -69,11 +70,49 @@ def ask_question_route():
         user_id = data.get('user_id', 'default_user')
         selected_documents = data.get('selected_documents', [])
         chat_history = data.get('chat_history', [])
+        mode = data.get('mode', 'dense')
 
         if not query:
             return jsonify({'error': 'Query is required'}), 400
+        if mode not in ('dense', 'hybrid'):
+            return jsonify({'error': 'mode must be "dense" or "hybrid"'}), 400
 
-        result = ask_question(query, user_id, selected_documents, chat_history)
+        result = ask_question(query, user_id, selected_documents, chat_history, mode)
         return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@chat_bp.route('/api/ask/stream', methods=['POST'])
+def ask_question_stream_route():
+    """
+    Same request body as /api/ask, answered as Server-Sent Events: 'sources' once
+    retrieval is done, 'token' events as the answer is generated, then 'answer' with
+    the final text (diagram fallback applied), or 'error' if generation fails.
+    """
+    data = request.get_json() or {}
+    query = data.get('query')
+    user_id = data.get('user_id', 'default_user')
+    selected_documents = data.get('selected_documents', [])
+    chat_history = data.get('chat_history', [])
+    mode = data.get('mode', 'dense')
+
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    if mode not in ('dense', 'hybrid'):
+        return jsonify({'error': 'mode must be "dense" or "hybrid"'}), 400
+
+    def generate():
+        try:
+            for event, payload in stream_question(query, user_id, selected_documents, chat_history, mode):
+                yield _sse(event, payload)
+        except Exception as e:
+            print(f"Error streaming answer: {str(e)}")
+            yield _sse('error', {'error': str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Keep reverse proxies from buffering the stream
+    })
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models import db, Folder, Document
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.embedding_service import set_document_metadata, NO_FOLDER_ID
 
 folders_bp = Blueprint('folders', __name__)
 
@@ -119,4 +120,29 @@ def get_folder_documents(folder_id):
         'summary': d.summary,
         'detailed_summary': d.detailed_summary,
         'processing_status': d.processing_status
-    } for d in documents]), 200
\ No newline at end of file
+    } for d in documents]), 200
+
+@folders_bp.route('/api/documents/<int:document_id>/folder', methods=['PUT'])
+@jwt_required()
+def move_document(document_id):
+    user_id = int(get_jwt_identity())
+    document = Document.query.filter_by(id=document_id, user_id=user_id).first()
+    if not document:
+        return jsonify({'error': 'Document not found'}), 404
+
+    data = request.get_json() or {}
+    folder_id = data.get('folder_id')  # None moves the document out of its folder
+    if folder_id is not None and not Folder.query.filter_by(id=folder_id, user_id=user_id).first():
+        return jsonify({'error': 'Folder not found'}), 404
+
+    document.folder_id = folder_id
+    db.session.commit()
+
+    # Keep the chunks' folder_id in step so folder-filtered search sees the move
+    set_document_metadata(document.filename, user_id, {'folder_id': folder_id if folder_id is not None else NO_FOLDER_ID})
+
+    return jsonify({
+        'id': document.id,
+        'filename': document.filename,
+        'folder_id': document.folder_id
+    }), 200
@@ -0,0 +1,40 @@
+from flask import Blueprint, jsonify
+from services.embedding_service import warmup, get_readiness, get_query_cache_stats, get_batcher_stats
+from services.llm_gateway import get_llm_cache_stats
+from services.answer_cache import get_answer_cache_stats
+from services.openai_client import get_openai_metrics
+from services.summary_service import get_summary_stats
+from services.question_bank import get_question_bank_stats
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('/api/health', methods=['GET'])
+def health():
+    # Liveness only: the process is up and serving requests
+    return jsonify({'status': 'ok'}), 200
+
+@health_bp.route('/api/ready', methods=['GET'])
+def ready():
+    # Readiness: the embedding model and vector store are loaded, so search/ask won't stall
+    readiness = get_readiness()
+    return jsonify(readiness), 200 if readiness['ready'] else 503
+
+@health_bp.route('/api/warmup', methods=['POST'])
+def warm():
+    timings = warmup()
+    if 'error' in timings:
+        return jsonify(timings), 500
+
+    return jsonify({'message': 'Warmed up', 'timings': timings, **get_readiness()}), 200
+
+@health_bp.route('/api/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        'query_embedding_cache': get_query_cache_stats(),
+        'embedding_batcher': get_batcher_stats(),
+        'llm_cache': get_llm_cache_stats(),
+        'answer_cache': get_answer_cache_stats(),
+        'openai': get_openai_metrics(),
+        'section_summaries': get_summary_stats(),
+        'question_bank': get_question_bank_stats()
+    }), 200
@@ -0,0 +1,13 @@
+from flask import Blueprint, jsonify
+from services.job_service import get_job, STAGES
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    job['stages'] = STAGES
+    return jsonify(job), 200
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from services.embedding_service import search_similar_chunks
+from services.embedding_service import search_similar_chunks, topic_metadata_key
 from services.topic_service import get_user_topics
+from services.keyword_index import keyword_search
 import os
 import json
 
@@ -15,62 +16,46 @@ def search():
         query = request.args.get('q', '')
         topic_filter = request.args.get('topic')
         file_type_filter = request.args.get('file_type')
+        folder_filter = request.args.get('folder_id')
         limit = int(request.args.get('limit', 10))
+        mode = request.args.get('mode', 'dense')
 
         if not query:
             return jsonify({'error': 'Query parameter "q" is required'}), 400
-
-        # Get semantic search results
-        semantic_results = search_similar_chunks(query, user_id, top_k=limit)
-
-        # Apply filters
-        filtered_results = []
-        for result in semantic_results:
-            # Topic filter
-            if topic_filter:
-                user_topics = get_user_topics(user_id)
-                topic_docs = set()
-                for topic in user_topics:
-                    if topic['name'] == topic_filter:
-                        topic_docs.update(topic['documents'])
-                if result['filename'] not in topic_docs:
-                    continue
-
-            # File type filter
-            if file_type_filter:
-                if not result['filename'].lower().endswith(f'.{file_type_filter.lower()}'):
-                    continue
-
-            filtered_results.append(result)
-
-        # Keyword search fallback (simple text search in processed files)
+        if mode not in ('dense', 'hybrid'):
+            return jsonify({'error': 'mode must be "dense" or "hybrid"'}), 400
+        if folder_filter and not folder_filter.isdigit():
+            return jsonify({'error': 'folder_id must be a folder id number'}), 400
+
+        # Filters are stored as chunk metadata at ingest, so they're applied inside the
+        # vector query and a filtered search still returns a full page of results
+        filters = {}
+        if topic_filter:
+            filters[topic_metadata_key(topic_filter)] = True
+        if file_type_filter:
+            filters['file_type'] = file_type_filter.lower().lstrip('.')
+        if folder_filter:
+            filters['folder_id'] = int(folder_filter)
+
+        filtered_results = search_similar_chunks(query, user_id, top_k=limit, filters=filters or None, mode=mode)
+
+        # Keyword (BM25) fallback when semantic hits don't fill the page; it honours the
+        # same filters, and chunks already returned semantically aren't repeated.
+        # Hybrid results already include the keyword matches.
         keyword_results = []
-        if len(filtered_results) < limit:
-            processed_dir = os.path.join(os.path.dirname(__file__), '..', 'processed')
-            if os.path.exists(processed_dir):
-                for filename in os.listdir(processed_dir):
-                    if filename.endswith('.txt'):
-                        file_path = os.path.join(processed_dir, filename)
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read().lower()
-                                if query.lower() in content:
-                                    # Check if already in semantic results
-                                    if not any(r['filename'] == filename for r in filtered_results):
-                                        keyword_results.append({
-                                            'filename': filename,
-                                            'chunk': f"Contains keyword: {query}",
-                                            'similarity_score': 0.5  # Lower score for keyword matches
-                                        })
-                        except Exception as e:
-                            continue
-
-        # Combine and sort results
+        if mode == 'dense' and len(filtered_results) < limit:
+            seen = {(r['filename'], r['chunk_index']) for r in filtered_results}
+            keyword_results = [
+                r for r in keyword_search(query, user_id, top_k=limit, filters=filters or None)
+                if (r['filename'], r['chunk_index']) not in seen
+            ]
+
+        # Semantic hits first (already ranked by similarity), then keyword hits by BM25 score
         all_results = filtered_results + keyword_results[:limit - len(filtered_results)]
-        all_results.sort(key=lambda x: x.get('similarity_score', 0), reverse=True)
 
         return jsonify({
             'query': query,
+            'mode': mode,
             'results': all_results[:limit],
             'total_results': len(all_results)
         }), 200
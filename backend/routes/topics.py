@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify
 from services.topic_service import (
     get_user_topics, create_topic, add_document_to_topic,
-    get_topic_documents, delete_topic, categorize_document,
+    remove_document_from_topic, get_topic_documents, delete_topic, categorize_document,
     auto_categorize_all_documents
 )
 
@@ -53,6 +53,18 @@ def add_document_to_topic_endpoint(topic_name):
 
     return jsonify(result), 200
 
+@topics_bp.route('/api/topics/<topic_name>/documents/<filename>', methods=['DELETE'])
+def remove_document_from_topic_endpoint(topic_name, filename):
+    """
+    Remove a document from a topic.
+    """
+    user_id = request.args.get('user_id', 'default_user')
+    result = remove_document_from_topic(user_id, topic_name, filename)
+    if result.get('error'):
+        return jsonify(result), 400
+
+    return jsonify(result), 200
+
 @topics_bp.route('/api/topics/<topic_name>/documents', methods=['GET'])
 def get_topic_documents_endpoint(topic_name):
     """
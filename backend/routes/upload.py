@@ -1,7 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 import os
-from services.document_processor import process_document
+from services.document_processor import ingest_document
+from services.job_service import submit_job
+from services.blob_store import save_upload
 from services.topic_service import add_document_to_topic
 from config import Config
 from models import db, Document
@@ -41,36 +43,44 @@ def upload_file():
         # Ensure folder exists
         os.makedirs(Config.DOCUMENTS_FOLDER, exist_ok=True)
 
-        # Get file size
-        file.seek(0, os.SEEK_END)
-        size = file.tell()
-        file.seek(0)
+        # Save file into the content-addressed store, hashing it as it streams to disk
+        content_hash, size = save_upload(file.stream, filepath)
 
-        # Save file
-        file.save(filepath)
-
-        # Process the document
-        result = process_document(filepath, filename, user_id)
-
-        if 'error' in result:
-            return jsonify(result), 500
-
-        # Save document to database
+        # Save document to database; the ingestion job flips the status when it finishes
         document = Document(
             user_id=user_id,
             filename=filename,
             folder_id=folder_id,
-            size=size
+            size=size,
+            processing_status='processing'
         )
         db.session.add(document)
         db.session.commit()
 
-        result['document_id'] = document.id
+        # Add to topic if requested, before ingestion so the chunks are stored with it
+        topic_result = add_document_to_topic(user_id, topic_name, filename) if topic_name else None
+
+        # Process the document on the ingestion worker pool
+        job_id = submit_job(
+            ingest_document,
+            args=(current_app._get_current_object(), document.id, filepath, filename, user_id, content_hash),
+            metadata={'document_id': document.id, 'filename': filename, 'user_id': user_id, 'content_hash': content_hash}
+        )
+
+        if job_id is None:
+            document.processing_status = 'failed'
+            db.session.commit()
+            return jsonify({'error': 'Ingestion queue is full, please retry shortly'}), 503
 
-        # Add to topic if requested
-        if topic_name:
-            topic_result = add_document_to_topic(user_id, topic_name, filename)
+        result = {
+            'message': 'Document accepted for processing',
+            'document_id': document.id,
+            'content_hash': content_hash,
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}'
+        }
 
+        if topic_result is not None:
             if 'error' in topic_result:
                 result['topic_added'] = False
                 result['topic_error'] = topic_result['error']
@@ -78,7 +88,7 @@ def upload_file():
                 result['topic_added'] = True
                 result['topic_name'] = topic_name
 
-        return jsonify(result), 200
+        return jsonify(result), 202
 
     return jsonify({'error': 'File type not allowed'}), 400
 
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from config import Config
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stored': 0, 'invalidated': 0, 'evicted': 0, 'tokens_saved': 0}
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(Config.ANSWER_CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(Config.ANSWER_CACHE_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, context_key TEXT NOT NULL, embedding BLOB NOT NULL,
+                query TEXT NOT NULL, answer TEXT NOT NULL, tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL, last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS answers_by_context ON answers (context_key);
+            CREATE TABLE IF NOT EXISTS answer_sources (
+                answer_id INTEGER NOT NULL, user_id TEXT NOT NULL, filename TEXT NOT NULL,
+                PRIMARY KEY (user_id, filename, answer_id)
+            ) WITHOUT ROWID;
+        ''')
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'answer_documents'").fetchone():
+            # Sources used to be recorded by filename alone; answers without an owner
+            # recorded couldn't be invalidated, so they are dropped
+            with conn:
+                conn.execute('DELETE FROM answers')
+                conn.execute('DROP TABLE answer_documents')
+        _local.conn = conn
+    return conn
+
+
+def _count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def context_key(chunk_ids, history):
+    """
+    What an answer depends on besides the question: the exact chunks sent as context
+    (chunk ids are content hashes) and the chat history included in the prompt.
+    """
+    payload = json.dumps({'chunks': sorted(chunk_ids), 'history': history}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _enabled():
+    return Config.ANSWER_CACHE_ENABLED and Config.ANSWER_CACHE_MAX_ENTRIES > 0
+
+
+def lookup_answer(key, query_embedding):
+    """
+    Cached answer for a question asked with the same context whose embedding is within
+    ANSWER_CACHE_MAX_DISTANCE (cosine distance) of query_embedding, or None.
+    Returns {'answer', 'query', 'distance'} on a hit.
+    """
+    if not _enabled():
+        return None
+    try:
+        conn = _connect()
+        rows = conn.execute(
+            'SELECT id, embedding, query, answer, tokens FROM answers WHERE context_key = ?', (key,)
+        ).fetchall()
+        best = None
+        if rows:
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+            for answer_id, blob, query, answer, tokens in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                distance = 1.0 - float(np.dot(query_vector, vector / (np.linalg.norm(vector) or 1.0)))
+                if distance <= Config.ANSWER_CACHE_MAX_DISTANCE and (best is None or distance < best[0]):
+                    best = (distance, answer_id, query, answer, tokens)
+
+        if best is None:
+            _count('misses')
+            return None
+
+        distance, answer_id, query, answer, tokens = best
+        with conn:
+            conn.execute('UPDATE answers SET last_used = ? WHERE id = ?', (time.time(), answer_id))
+        _count('hits')
+        _count('tokens_saved', tokens)
+        return {'answer': answer, 'query': query, 'distance': round(distance, 4)}
+    except Exception as e:
+        print(f"Error reading answer cache: {str(e)}")
+        return None
+
+
+def store_answer(key, query_embedding, query, answer, sources, tokens):
+    """
+    Cache an answer under its context key. sources are the (user_id, filename) of the
+    documents it was built from, whose re-indexing or deletion invalidates it; tokens is
+    what producing it cost (prompt plus completion), counted as saved on each hit.
+    """
+    if not _enabled():
+        return
+    try:
+        conn = _connect()
+        now = time.time()
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO answers (context_key, embedding, query, answer, tokens, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, np.asarray(query_embedding, dtype=np.float32).tobytes(), query, answer, tokens, now, now)
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO answer_sources VALUES (?, ?, ?)',
+                [(cursor.lastrowid, str(user_id), filename) for user_id, filename in set(sources)]
+            )
+            excess = conn.execute('SELECT COUNT(*) FROM answers').fetchone()[0] - Config.ANSWER_CACHE_MAX_ENTRIES
+            if excess > 0:
+                evicted = [row[0] for row in conn.execute(
+                    'SELECT id FROM answers ORDER BY last_used LIMIT ?', (excess,)
+                )]
+                _delete(conn, evicted)
+                _count('evicted', len(evicted))
+        _count('stored')
+    except Exception as e:
+        print(f"Error writing answer cache: {str(e)}")
+
+
+def _delete(conn, answer_ids):
+    conn.executemany('DELETE FROM answers WHERE id = ?', [(answer_id,) for answer_id in answer_ids])
+    conn.executemany('DELETE FROM answer_sources WHERE answer_id = ?', [(answer_id,) for answer_id in answer_ids])
+
+
+def invalidate_documents(user_id, filenames):
+    """
+    Drop every cached answer that used any of these documents of user_id's collection as
+    a source. Another user's document with the same name is a different source; answers
+    built on identical content elsewhere share chunk ids (content hashes) in their context
+    key, so they stay valid. Returns the number of answers removed.
+    """
+    filenames = list(set(filenames))
+    if not filenames or not os.path.exists(Config.ANSWER_CACHE_PATH):
+        return 0
+    conn = _connect()
+    placeholders = ','.join('?' * len(filenames))
+    with conn:
+        answer_ids = [row[0] for row in conn.execute(
+            f'SELECT DISTINCT answer_id FROM answer_sources WHERE user_id = ? AND filename IN ({placeholders})',
+            [str(user_id)] + filenames
+        )]
+        _delete(conn, answer_ids)
+    _count('invalidated', len(answer_ids))
+    return len(answer_ids)
+
+
+def get_answer_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    try:
+        stats['entries'] = _connect().execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+    except Exception:
+        stats['entries'] = None
+    stats['max_entries'] = Config.ANSWER_CACHE_MAX_ENTRIES
+    stats['max_distance'] = Config.ANSWER_CACHE_MAX_DISTANCE
+    return stats
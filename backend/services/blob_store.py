@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+from config import Config
+
+# Read size when streaming uploads to disk
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+_index_lock = threading.Lock()
+
+
+def blob_path(content_hash):
+    """
+    Location of a blob in the content-addressed layout: <BLOBS_FOLDER>/<first 2 hex chars>/<sha256>.
+    """
+    return os.path.join(Config.BLOBS_FOLDER, content_hash[:2], content_hash)
+
+
+def save_upload(stream, filepath):
+    """
+    Stream an upload into the blob store while hashing it, then expose it at filepath.
+    filepath is hard-linked to the blob (copied if the filesystem can't link), so code that
+    reads DOCUMENTS_FOLDER/<filename> keeps working. Returns (content_hash, size).
+    """
+    os.makedirs(Config.BLOBS_FOLDER, exist_ok=True)
+    sha256 = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=Config.BLOBS_FOLDER, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                block = stream.read(STREAM_CHUNK_SIZE)
+                if not block:
+                    break
+                sha256.update(block)
+                f.write(block)
+                size += len(block)
+
+        content_hash = sha256.hexdigest()
+        target = blob_path(content_hash)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            os.remove(tmp_path)  # Same bytes already stored
+        else:
+            os.replace(tmp_path, target)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _link(target, filepath)
+    return content_hash, size
+
+
+def file_sha256(filepath):
+    """
+    SHA-256 of a file on disk, read in STREAM_CHUNK_SIZE blocks.
+    """
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _link(source, destination):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def _load_index():
+    if not os.path.exists(Config.BLOB_INDEX_FILE):
+        return {}
+    with open(Config.BLOB_INDEX_FILE, 'r') as f:
+        return json.load(f)
+
+
+def _save_index(index):
+    directory = os.path.dirname(Config.BLOB_INDEX_FILE)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.blobs-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, Config.BLOB_INDEX_FILE)
+
+
+def get_indexed_source(content_hash):
+    """
+    Return where this content was already extracted and embedded, as a dict with
+    user_id, filename, chunks_count and text_length, or None if it has never been indexed.
+    """
+    try:
+        with _index_lock:
+            entry = _load_index().get(content_hash)
+        return entry.get('indexed') if entry else None
+    except Exception as e:
+        print(f"Error reading blob index for {content_hash}: {str(e)}")
+        return None
+
+
+def mark_indexed(content_hash, user_id, filename, chunks_count, text_length):
+    """
+    Record that the chunks for this content live under (user_id, filename).
+    """
+    try:
+        with _index_lock:
+            index = _load_index()
+            entry = index.setdefault(content_hash, {'created_at': str(int(time.time()))})
+            entry['indexed'] = {
+                'user_id': user_id,
+                'filename': filename,
+                'chunks_count': chunks_count,
+                'text_length': text_length
+            }
+            _save_index(index)
+    except Exception as e:
+        print(f"Error updating blob index for {content_hash}: {str(e)}")
+
+
+def forget_indexed(content_hash):
+    """
+    Drop the indexed source for this content, e.g. when its chunks have disappeared.
+    """
+    try:
+        with _index_lock:
+            index = _load_index()
+            if content_hash in index:
+                index[content_hash].pop('indexed', None)
+                _save_index(index)
+    except Exception as e:
+        print(f"Error updating blob index for {content_hash}: {str(e)}")
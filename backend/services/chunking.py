@@ -0,0 +1,124 @@
+import tiktoken
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+
+SENTENCE_ENDINGS = ('.', '!', '?', '\n')
+UTF8_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name="cl100k_base"):
+    """
+    Build a tiktoken encoding once per process; constructing it loads the BPE ranks.
+    """
+    return tiktoken.get_encoding(name)
+
+
+@lru_cache(maxsize=None)
+def get_token_byte_lengths(name="cl100k_base"):
+    """
+    Byte length of every token id in the vocabulary, built once so per-document offset
+    maps are a table lookup per token rather than a decode.
+    """
+    encoding = get_encoding(name)
+    lengths = []
+    for token in range(encoding.n_vocab):
+        try:
+            lengths.append(len(encoding.decode_single_token_bytes(token)))
+        except KeyError:
+            lengths.append(0)  # Unused id in the vocabulary
+    return lengths
+
+
+class TextChunker:
+    """
+    Token-window chunker that tokenizes a document once, maps token boundaries to
+    character offsets in a single pass, and cuts chunks by slicing the original string
+    instead of decoding every window.
+    Produces the same chunk boundaries as the original decode-based chunker.
+    """
+
+    def __init__(self, chunk_size=512, overlap=100, encoding_name="cl100k_base"):
+        if overlap >= chunk_size:
+            raise ValueError("overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.encoding = get_encoding(encoding_name)
+        self.token_byte_lengths = get_token_byte_lengths(encoding_name)
+
+    def _char_offsets(self, text, byte_starts, boundaries):
+        """
+        Map each token index in boundaries (sorted) to the character index in text where that
+        token starts. A token that starts inside a multi-byte character maps to the next
+        whole character.
+        """
+        if text.isascii():
+            return {boundary: byte_starts[boundary] for boundary in boundaries}
+
+        text_bytes = text.encode('utf-8')
+        offsets = {}
+        char_offset = previous = 0
+        for boundary in boundaries:
+            # Characters starting in the span = bytes that are not UTF-8 continuation bytes
+            span = text_bytes[previous:byte_starts[boundary]]
+            char_offset += len(span.translate(None, UTF8_CONTINUATION_BYTES))
+            offsets[boundary] = char_offset
+            previous = byte_starts[boundary]
+        return offsets
+
+    def chunk(self, text):
+        """
+        Split text into overlapping token windows that prefer to end on a sentence boundary.
+        Returns a list of dicts with text, token_count, char_start and char_end
+        (char_end exclusive, so text[char_start:char_end] == chunk text).
+        """
+        tokens = self.encoding.encode(text)
+        total = len(tokens)
+
+        if total <= self.chunk_size:
+            return [{'text': text, 'token_count': total, 'char_start': 0, 'char_end': len(text)}]
+
+        # byte_starts[i] is the byte offset where token i starts; one pass over the tokens
+        byte_starts = [0]
+        byte_starts.extend(accumulate(map(self.token_byte_lengths.__getitem__, tokens)))
+
+        step = self.chunk_size - self.overlap
+        starts = list(range(0, total, step))
+        boundaries = sorted(set(starts) | {min(start + self.chunk_size, total) for start in starts})
+        offsets = self._char_offsets(text, byte_starts, boundaries)
+
+        chunks = []
+        for start in starts:
+            end = min(start + self.chunk_size, total)
+            char_start = offsets[start]
+            char_end = offsets[end] if end < total else len(text)
+            token_count = end - start
+
+            # Ensure chunks end at sentence boundaries when possible
+            if end < total and not text.endswith(SENTENCE_ENDINGS, char_start, char_end):
+                last_period = max(
+                    text.rfind('.', char_start, char_end),
+                    text.rfind('!', char_start, char_end),
+                    text.rfind('?', char_start, char_end)
+                )
+                # Only if we're not losing too much content
+                if last_period - char_start > self.chunk_size * 0.7:
+                    char_end = last_period + 1
+                    kept_end = byte_starts[start] + len(text[char_start:char_end].encode('utf-8'))
+                    token_count = bisect_left(byte_starts, kept_end, start, end) - start
+
+            # Strip surrounding whitespace by moving the bounds rather than copying
+            while char_start < char_end and text[char_start].isspace():
+                char_start += 1
+            while char_end > char_start and text[char_end - 1].isspace():
+                char_end -= 1
+
+            chunks.append({
+                'text': text[char_start:char_end],
+                'token_count': token_count,
+                'char_start': char_start,
+                'char_end': char_end
+            })
+
+        return chunks
@@ -0,0 +1,181 @@
+import re
+from config import Config
+from services.chunking import get_encoding
+
+# Tokens chat models add around each message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+CHUNK_SEPARATOR = '\n\n'
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def count_tokens(text):
+    return len(get_encoding().encode(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    tokens = get_encoding().encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding().decode(tokens[:max_tokens])
+
+
+def _relevance(chunks):
+    """
+    Retrieval score of each chunk scaled to [0, 1]. Uses whichever score the search
+    produced (rrf_score for hybrid results, similarity_score for dense, bm25_score for keyword).
+    """
+    for key in ('rrf_score', 'similarity_score', 'bm25_score'):
+        if chunks and all(key in chunk for chunk in chunks):
+            scores = [chunk[key] for chunk in chunks]
+            break
+    else:
+        # No common score: fall back to the order the search returned
+        scores = [len(chunks) - i for i in range(len(chunks))]
+    low, high = min(scores), max(scores)
+    return [(score - low) / (high - low) if high > low else 1.0 for score in scores]
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _overlap_chars(earlier, later):
+    """
+    Characters at the start of `later` already contained in `earlier`, for consecutive
+    chunks of the same file. Uses the chunker's char offsets when the chunks carry them,
+    otherwise looks for the end of `earlier` near the start of `later`.
+    """
+    if all(key in chunk for chunk in (earlier, later) for key in ('char_start', 'char_end')):
+        return max(0, min(earlier['char_end'] - later['char_start'], len(later['chunk'])))
+
+    tail = earlier['chunk'][-50:]
+    position = later['chunk'].find(tail) if len(tail) == 50 else -1
+    if position == -1:
+        return 0
+    end = position + len(tail)
+    return end if earlier['chunk'].endswith(later['chunk'][:end]) else 0
+
+
+def join_chunks(chunks):
+    """
+    Text of a document's chunks (in chunk order) with the overlap between consecutive
+    chunks included once. Chunks that aren't contiguous (a gap in chunk_index, or in the
+    char offsets) are joined with a blank line.
+    """
+    parts = []
+    for position, chunk in enumerate(chunks):
+        previous = chunks[position - 1] if position else None
+        contiguous = previous is not None and previous['chunk_index'] == chunk['chunk_index'] - 1 and (
+            'char_start' not in chunk or 'char_end' not in previous or chunk['char_start'] <= previous['char_end']
+        )
+        if contiguous:
+            parts[-1] += chunk['chunk'][_overlap_chars(previous, chunk):]
+        else:
+            parts.append(chunk['chunk'])
+    return CHUNK_SEPARATOR.join(parts)
+
+
+def build_context(chunks, budget_tokens, mmr_lambda=None, duplicate_threshold=None):
+    """
+    Pick and join retrieved chunks into a context of at most budget_tokens tokens.
+
+    Chunks are chosen greedily by maximal marginal relevance: retrieval score, minus a
+    penalty for word overlap with chunks already chosen, and near-duplicates
+    (word Jaccard >= duplicate_threshold) are dropped outright. Consecutive chunks of
+    the same file are joined in document order with their shared overlap text removed.
+    Chunks that don't fit the remaining budget are skipped, except that a first chunk
+    larger than the whole budget is cut to it.
+
+    Returns {'context', 'chunks' (the ones used, in context order), 'tokens',
+    'dropped_duplicates', 'dropped_for_budget', 'trimmed_overlap_chars'}.
+    """
+    mmr_lambda = Config.CONTEXT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    duplicate_threshold = Config.CONTEXT_DUPLICATE_THRESHOLD if duplicate_threshold is None else duplicate_threshold
+    separator_tokens = count_tokens(CHUNK_SEPARATOR)
+
+    relevance = _relevance(chunks)
+    words = [set(WORD_PATTERN.findall(chunk['chunk'].lower())) for chunk in chunks]
+    remaining = list(range(len(chunks)))
+    selected = []
+    positions = {}  # (filename, chunk_index) -> candidate index, for overlap lookups
+    used_tokens = 0
+    dropped_duplicates = dropped_for_budget = 0
+
+    def marginal(i):
+        redundancy = max((_jaccard(words[i], words[j]) for j in selected), default=0.0)
+        return mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+
+    while remaining and used_tokens < budget_tokens:
+        best = max(remaining, key=marginal)
+        remaining.remove(best)
+        chunk = chunks[best]
+        if any(_jaccard(words[best], words[j]) >= duplicate_threshold for j in selected):
+            dropped_duplicates += 1
+            continue
+
+        # Text shared with an already chosen neighbour is only sent once
+        text = chunk['chunk']
+        previous = positions.get((chunk['filename'], chunk['chunk_index'] - 1))
+        following = positions.get((chunk['filename'], chunk['chunk_index'] + 1))
+        start = _overlap_chars(chunks[previous], chunk) if previous is not None else 0
+        end = len(text) - (_overlap_chars(chunk, chunks[following]) if following is not None else 0)
+        cost = count_tokens(text[start:max(start, end)]) + (separator_tokens if selected else 0)
+
+        if used_tokens + cost > budget_tokens and selected:
+            dropped_for_budget += 1
+            continue
+        selected.append(best)
+        positions[(chunk['filename'], chunk['chunk_index'])] = best
+        used_tokens += cost
+
+    dropped_for_budget += len(remaining)
+
+    # Files in order of their best chunk; chunks within a file in document order
+    file_rank = {}
+    for i in selected:
+        file_rank.setdefault(chunks[i]['filename'], len(file_rank))
+    ordered = sorted(selected, key=lambda i: (file_rank[chunks[i]['filename']], chunks[i]['chunk_index']))
+
+    parts = []
+    trimmed_overlap_chars = 0
+    for position, i in enumerate(ordered):
+        text = chunks[i]['chunk']
+        if position:
+            previous = chunks[ordered[position - 1]]
+            if previous['filename'] == chunks[i]['filename'] and previous['chunk_index'] == chunks[i]['chunk_index'] - 1:
+                overlap = _overlap_chars(previous, chunks[i])
+                if overlap:
+                    trimmed_overlap_chars += overlap
+                    # Continue the previous part instead of starting a new block
+                    parts[-1] += text[overlap:]
+                    continue
+        parts.append(text)
+
+    # Token counts of pieces aren't exactly additive, so enforce the budget on the final text
+    context = truncate_to_tokens(CHUNK_SEPARATOR.join(parts), budget_tokens)
+    return {
+        'context': context,
+        'chunks': [chunks[i] for i in ordered],
+        'tokens': count_tokens(context),
+        'dropped_duplicates': dropped_duplicates,
+        'dropped_for_budget': dropped_for_budget,
+        'trimmed_overlap_chars': trimmed_overlap_chars
+    }
+
+
+def fit_history(messages, budget_tokens):
+    """
+    Most recent chat messages whose tokens (with per-message overhead) fit budget_tokens,
+    oldest dropped first. Returns (messages, tokens).
+    """
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        cost = count_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget_tokens:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return kept, used
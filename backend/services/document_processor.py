@@ -1,98 +1,213 @@
 import os
 import json
-import pdfplumber
-from docx import Document
-from pptx import Presentation
-import tiktoken
-import threading
-from services.embedding_service import store_embeddings
-from services.qa_service import generate_single_summary
+import shutil
+from services.chunking import TextChunker
+from services.extractors import extract_document_text
+from services.embedding_service import (
+    store_embeddings, make_chunk_ids, get_document_chunk_ids,
+    update_chunk_metadata, delete_chunks, get_content_embeddings, get_document_chunks,
+    topic_metadata_key, NO_FOLDER_ID
+)
+from services.embedding_cache import cache_report
+from services.blob_store import get_indexed_source, mark_indexed, forget_indexed
+from services.job_service import submit_job
+from services.qa_service import summarize_chunks
+from services.summary_store import summary_source_hash, claim_summary, complete_summary, fail_summary, get_pending_summaries
+from services.topic_service import get_user_topics
+from services.question_bank import schedule_bank_fill
 from config import Config
+from models import db, Document
 
 def extract_text(filepath):
-    ext = filepath.split('.')[-1].lower()
-    if ext == 'pdf':
-        with pdfplumber.open(filepath) as pdf:
-            text = ''
-            for page in pdf.pages:
-                text += page.extract_text() or ''
-    elif ext == 'docx':
-        doc = Document(filepath)
-        text = '\n'.join([para.text for para in doc.paragraphs])
-    elif ext == 'pptx':
-        prs = Presentation(filepath)
-        text = ''
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + '\n'
-    elif ext == 'txt':
-        with open(filepath, 'r', encoding='utf-8') as f:
-            text = f.read()
-    else:
-        raise ValueError("Unsupported file type")
-    # Basic cleanup
-    text = text.replace('\n\n', '\n').strip()
-    return text
+    return extract_document_text(filepath)
+
+def chunk_document(text, chunk_size=512, overlap=100):
+    """
+    Chunk text into overlapping token windows, returning dicts with the chunk text
+    plus token_count, char_start and char_end metadata.
+    """
+    return TextChunker(chunk_size, overlap).chunk(text)
 
 def chunk_text(text, chunk_size=512, overlap=100):
     """
     Optimized chunking for better retrieval quality and minimal AI usage.
     Uses larger chunks with overlap to maintain context while reducing total chunks.
     """
-    encoding = tiktoken.get_encoding("cl100k_base")  # For GPT-3.5/4
-    tokens = encoding.encode(text)
+    return [chunk['text'] for chunk in chunk_document(text, chunk_size, overlap)]
 
-    if len(tokens) <= chunk_size:
-        return [text]  # Return whole text if it's small enough
+def document_filter_metadata(filename, user_id, folder_id=None):
+    """
+    Document-level chunk metadata used by search filters: file_type, folder_id
+    (NO_FOLDER_ID if unfiled) and a True 'topic:<name>' key per topic the document is in.
+    """
+    metadata = {
+        'file_type': filename.rsplit('.', 1)[-1].lower(),
+        'folder_id': folder_id if folder_id is not None else NO_FOLDER_ID
+    }
+    # topics.json is keyed by the user id as a string
+    for topic in get_user_topics(str(user_id)):
+        if filename in topic['documents']:
+            metadata[topic_metadata_key(topic['name'])] = True
+    return metadata
 
-    chunks = []
-    start = 0
-    while start < len(tokens):
-        end = min(start + chunk_size, len(tokens))
-        chunk_tokens = tokens[start:end]
-        chunk_text = encoding.decode(chunk_tokens)
+def run_summary_stage(chunks, filename, user_id, throttle=None):
+    """
+    Summary stage of ingestion: summarize the document from its chunk texts and persist the
+    result in summaries.json. Content that already has a summary (under any filename) is
+    reused, and content being summarized by another job is waited for rather than
+    summarized again. throttle, if given, is called just before the LLM call.
+    Returns (summary or None, status) with status 'generated', 'reused' or 'failed'.
+    """
+    source_hash = summary_source_hash(chunks)
+    # Long enough for the other job's call, including its wait for a request slot
+    wait_seconds = Config.OPENAI_TIMEOUTS['summary'] + Config.OPENAI_QUEUE_TIMEOUT
+    try:
+        state, value = claim_summary(filename, user_id, source_hash)
+        if state == 'in_progress':
+            value.wait(wait_seconds)
+            state, value = claim_summary(filename, user_id, source_hash)
+    except Exception as e:
+        print(f"Error reading summaries for {filename}: {str(e)}")
+        return None, 'failed'
+    if state == 'completed':
+        return value, 'reused'
+    if state == 'in_progress':
+        return None, 'failed'
+
+    try:
+        if throttle:
+            throttle()
+        summary = summarize_chunks(chunks, filename)
+    except Exception as e:
+        print(f"Error generating summary for {filename}: {str(e)}")
+        fail_summary(filename, source_hash, str(e))
+        return None, 'failed'
+    complete_summary(filename, source_hash, summary)
+    print(f"Summary generated for {filename}")
+    return summary, 'generated'
 
-        # Ensure chunks end at sentence boundaries when possible
-        if end < len(tokens) and not chunk_text.endswith(('.', '!', '?', '\n')):
-            # Find last sentence ending in chunk
-            last_period = max(chunk_text.rfind('.'), chunk_text.rfind('!'), chunk_text.rfind('?'))
-            if last_period > chunk_size * 0.7:  # Only if we're not losing too much content
-                chunk_text = chunk_text[:last_period + 1]
+def reindex_document(chunks, filename, user_id, content_hash=None, embeddings=None, chunk_metadatas=None, cache_stats=None, document_metadata=None):
+    """
+    Bring a document's stored chunks in line with a new chunk_text output.
+    Chunk ids are deterministic, so only new or changed chunks are embedded,
+    unchanged chunks just get their position metadata refreshed, and chunks
+    that no longer exist are deleted. embeddings and chunk_metadatas, if given,
+    line up with chunks; embeddings are used instead of encoding. cache_stats, if given,
+    accumulates embedding cache hits and misses for the chunks that had to be embedded.
+    document_metadata is written to every chunk, new or unchanged.
+    Returns counts of added, unchanged and removed chunks.
+    """
+    ids = make_chunk_ids(filename, chunks)
+    existing = set(get_document_chunk_ids(filename, user_id))
 
-        chunks.append(chunk_text.strip())
-        start += chunk_size - overlap
+    added = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+    unchanged = [i for i, chunk_id in enumerate(ids) if chunk_id in existing]
+    stale = existing - set(ids)
 
-        # Prevent infinite loop
-        if start >= end:
-            break
+    if added:
+        store_embeddings(
+            [chunks[i] for i in added], filename, user_id,
+            content_hash=content_hash,
+            ids=[ids[i] for i in added],
+            chunk_indexes=added,
+            embeddings=[embeddings[i] for i in added] if embeddings is not None else None,
+            chunk_metadatas=[chunk_metadatas[i] for i in added] if chunk_metadatas else None,
+            cache_stats=cache_stats,
+            document_metadata=document_metadata
+        )
+    if unchanged:
+        update_chunk_metadata(
+            [ids[i] for i in unchanged], unchanged, filename, user_id,
+            content_hash=content_hash,
+            chunk_metadatas=[chunk_metadatas[i] for i in unchanged] if chunk_metadatas else None,
+            document_metadata=document_metadata
+        )
+    if stale:
+        delete_chunks(stale, user_id)
 
-    return chunks
+    return {'added': len(added), 'unchanged': len(unchanged), 'removed': len(stale)}
 
-def generate_summary_background(text, filename, user_id):
+def link_duplicate_document(content_hash, filename, user_id, document_metadata=None):
     """
-    Background task to generate summary for a document.
+    If identical content was already ingested, reuse its chunks and processed text
+    instead of extracting and embedding again. Returns a result dict, or None if
+    the content has to be processed from scratch.
     """
-    try:
-        generate_single_summary(text, filename)
-        print(f"Summary generated for {filename}")
-    except Exception as e:
-        print(f"Error generating summary for {filename}: {str(e)}")
+    source = get_indexed_source(content_hash)
+    if not source:
+        return None
+
+    stored = get_content_embeddings(content_hash, source['user_id'])
+    if not stored:
+        # The source chunks were deleted since; fall back to a full ingest
+        forget_indexed(content_hash)
+        return None
+
+    chunks, embeddings, chunk_metadatas = stored
+    changes = reindex_document(
+        chunks, filename, user_id,
+        content_hash=content_hash, embeddings=embeddings, chunk_metadatas=chunk_metadatas,
+        document_metadata=document_metadata
+    )
+
+    source_processed = os.path.join('processed', f"{source['filename']}.txt")
+    processed_filepath = os.path.join('processed', f"{filename}.txt")
+    if os.path.exists(source_processed) and source_processed != processed_filepath:
+        shutil.copyfile(source_processed, processed_filepath)
 
-def process_document(filepath, filename, user_id):
+    return {
+        'message': 'Document already indexed, reused existing chunks',
+        'chunks_count': len(chunks),
+        'text_length': source.get('text_length', 0),
+        'deduplicated': True,
+        'index_changes': changes
+    }
+
+def process_document(filepath, filename, user_id, on_stage=None, content_hash=None, folder_id=None):
     """
-    Process a document: extract text, chunk it, store embeddings, and generate summary in background.
+    Process a document: extract text, chunk it, store embeddings, and generate summary.
+    on_stage, if given, is called with each stage name as the pipeline advances.
+    content_hash is the SHA-256 of the file; content that was already ingested is linked
+    to the new owner instead of being processed again. folder_id is recorded on the chunks
+    for search filtering.
     Returns a dictionary with processing results.
     """
+    def report(stage):
+        if on_stage:
+            on_stage(stage)
+
     try:
+        document_metadata = document_filter_metadata(filename, user_id, folder_id)
+        if content_hash:
+            linked = link_duplicate_document(content_hash, filename, user_id, document_metadata)
+            if linked:
+                report('summarizing')
+                stored_chunks = get_document_chunks(filename, user_id)
+                chunks = [chunk['chunk'] for chunk in stored_chunks]
+                linked['summary'], linked['summary_status'] = run_summary_stage(chunks, filename, user_id)
+                linked['question_bank_scheduled'] = schedule_bank_fill(filename, user_id, stored_chunks)
+                return linked
+
         # Extract text from the document
+        report('extracting')
         text = extract_text(filepath)
 
         # Chunk the text
-        chunks = chunk_text(text)
+        report('chunking')
+        chunked = chunk_document(text)
+        chunks = [chunk['text'] for chunk in chunked]
 
-        # Store embeddings
-        store_embeddings(chunks, filename, user_id)
+        # Store embeddings, re-using the vectors of chunks that are already indexed
+        report('embedding')
+        cache_stats = {'hits': 0, 'misses': 0}
+        changes = reindex_document(
+            chunks, filename, user_id,
+            content_hash=content_hash, chunk_metadatas=chunked, cache_stats=cache_stats,
+            document_metadata=document_metadata
+        )
+        embedding_cache = cache_report(cache_stats)
+        print(f"Embedding cache for {filename}: {embedding_cache['hits']} hits, "
+              f"{embedding_cache['misses']} misses ({embedding_cache['hit_ratio']:.0%})")
 
         # Save processed text to file
         processed_filepath = os.path.join('processed', f"{filename}.txt")
@@ -100,17 +215,99 @@ def process_document(filepath, filename, user_id):
         with open(processed_filepath, 'w', encoding='utf-8') as f:
             f.write(text)
 
-        # Generate summary in background thread
-        summary_thread = threading.Thread(target=generate_summary_background, args=(text, filename, user_id))
-        summary_thread.daemon = True
-        summary_thread.start()
+        if content_hash:
+            mark_indexed(content_hash, user_id, filename, len(chunks), len(text))
+
+        # Already running off the request thread, so summarize inline from the chunks above
+        report('summarizing')
+        summary, summary_status = run_summary_stage(chunks, filename, user_id)
+
+        # Quiz questions are pre-generated off the ingest job, so it isn't held up by them
+        question_bank_scheduled = schedule_bank_fill(filename, user_id, [
+            {'chunk': chunk['text'], 'chunk_index': i, 'char_start': chunk['char_start'], 'char_end': chunk['char_end']}
+            for i, chunk in enumerate(chunked)
+        ])
 
         return {
             'message': 'Document processed successfully',
             'chunks_count': len(chunks),
-            'text_length': len(text)
+            'text_length': len(text),
+            'index_changes': changes,
+            'embedding_cache': embedding_cache,
+            'summary': summary,
+            'summary_status': summary_status,
+            'question_bank_scheduled': question_bank_scheduled
         }
     except Exception as e:
         return {
             'error': f'Failed to process document: {str(e)}'
         }
+
+def ingest_document(app, document_id, filepath, filename, user_id, content_hash=None, on_stage=None):
+    """
+    Ingestion job body: process the document and record the outcome on its Document row.
+    Runs on a job worker thread, so it needs the app passed in to push an app context.
+    """
+    with app.app_context():
+        document = Document.query.get(document_id)
+        folder_id = document.folder_id if document else None
+
+    result = process_document(filepath, filename, user_id, on_stage=on_stage, content_hash=content_hash, folder_id=folder_id)
+
+    with app.app_context():
+        document = Document.query.get(document_id)
+        if document:
+            document.processing_status = 'failed' if 'error' in result else 'completed'
+            if result.get('summary'):
+                document.summary = result['summary']
+            db.session.commit()
+
+    result['document_id'] = document_id
+    return result
+
+def save_document_summary(app, filename, user_id, summary):
+    """
+    Record a summary on the user's Document rows for filename ('default_user' has none).
+    """
+    if not str(user_id).isdigit():
+        return
+    with app.app_context():
+        for document in Document.query.filter_by(filename=filename, user_id=int(user_id)).all():
+            document.summary = summary
+        db.session.commit()
+
+def resume_summary(app, filename, user_id, on_stage=None):
+    """
+    Job body finishing a summary left pending by a previous run, from the document's
+    stored chunks, and recording it on the user's Document row.
+    """
+    if on_stage:
+        on_stage('summarizing')
+    chunks = [chunk['chunk'] for chunk in get_document_chunks(filename, user_id)]
+    if not chunks:
+        return {'error': f'No chunks found for {filename}'}
+
+    summary, summary_status = run_summary_stage(chunks, filename, user_id)
+    if summary:
+        save_document_summary(app, filename, user_id, summary)
+    return {'filename': filename, 'summary_status': summary_status}
+
+def resume_pending_summaries(app):
+    """
+    Queue a resume_summary job for every summary a previous run claimed but never
+    stored. Returns the number of jobs queued.
+    """
+    queued = 0
+    for filename, user_id in get_pending_summaries():
+        job_id = submit_job(
+            resume_summary,
+            args=(app, filename, user_id),
+            metadata={'filename': filename, 'user_id': user_id, 'kind': 'summary'}
+        )
+        if job_id is None:
+            print(f"Ingestion queue full, {filename} stays pending until the next start")
+            break
+        queued += 1
+    if queued:
+        print(f"Resuming {queued} pending document summaries")
+    return queued
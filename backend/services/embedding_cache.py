@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from config import Config
+
+# SQLite caps bound parameters per statement (999 on older builds)
+_LOOKUP_BATCH = 500
+
+_local = threading.local()
+
+
+def _connect():
+    # One connection per thread; WAL lets ingestion threads read while another writes
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(Config.EMBEDDING_CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(Config.EMBEDDING_CACHE_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            'model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, '
+            'PRIMARY KEY (model, text_hash)) WITHOUT ROWID'
+        )
+        _local.conn = conn
+    return conn
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def get_cached_embeddings(model_name, hashes):
+    """
+    Look up stored vectors for the given text hashes. Returns {text_hash: vector list}
+    for the hits only.
+    """
+    hashes = list(hashes)
+    found = {}
+    conn = _connect()
+    for start in range(0, len(hashes), _LOOKUP_BATCH):
+        batch = hashes[start:start + _LOOKUP_BATCH]
+        placeholders = ','.join('?' * len(batch))
+        rows = conn.execute(
+            f'SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})',
+            [model_name, *batch]
+        )
+        for key, blob in rows:
+            found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+    return found
+
+
+def put_cached_embeddings(model_name, vectors):
+    """
+    Store {text_hash: vector} as float32 blobs. Existing entries are left as they are.
+    """
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            'INSERT OR IGNORE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)',
+            [(model_name, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()]
+        )
+
+
+def cache_report(stats):
+    """
+    Hit/miss counts accumulated by encode_chunks, with the hit ratio.
+    """
+    total = stats['hits'] + stats['misses']
+    return {**stats, 'hit_ratio': round(stats['hits'] / total, 3) if total else 0.0}
@@ -1,117 +1,620 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
 from config import Config
+from services.embedding_cache import text_hash, get_cached_embeddings, put_cached_embeddings
+from services.keyword_index import (
+    index_chunks, update_indexed_metadata, delete_indexed_chunks, set_indexed_document_metadata, keyword_search
+)
+from services.answer_cache import invalidate_documents
 import os
+import re
+import time
+import queue
+import hashlib
+import threading
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# The model and Chroma client are created on first use (or by warmup()), not at import,
+# so processes that never embed or search don't pay for loading them.
+_model = None
+_client = None
+_model_lock = threading.Lock()
+_client_lock = threading.Lock()
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(Config.EMBEDDING_MODEL)
+    return _model
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import chromadb
+                _client = chromadb.PersistentClient(path=Config.CHROMADB_PATH)
+    return _client
+
+def is_ready():
+    """
+    True once both the embedding model and the Chroma client are loaded.
+    """
+    return _model is not None and _client is not None
+
+def get_readiness():
+    return {
+        'ready': is_ready(),
+        'model_loaded': _model is not None,
+        'chroma_loaded': _client is not None,
+        'warmup': dict(_warmup_state)
+    }
+
+_warmup_state = {'status': 'idle', 'timings': None, 'error': None}
+
+def warmup():
+    """
+    Load the model and Chroma client and run one encode, so the first real request
+    doesn't pay for it. Returns the seconds spent on each step, or {'error': ...}.
+    """
+    _warmup_state.update(status='running', error=None)
+    timings = {}
+    try:
+        started = time.perf_counter()
+        get_client()
+        timings['chroma_client'] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        get_model()
+        timings['model_load'] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        get_model().encode(['warmup'])
+        timings['first_encode'] = round(time.perf_counter() - started, 3)
+    except Exception as e:
+        print(f"Error warming up embedding service: {str(e)}")
+        _warmup_state.update(status='failed', error=str(e))
+        return {'error': str(e)}
+
+    _warmup_state.update(status='done', timings=timings)
+    return timings
+
+def make_chunk_ids(filename, chunks):
+    """
+    Deterministic chunk ids derived from the document (its filename within the user's
+    collection) and a hash of the chunk text, so an unchanged chunk keeps its id across
+    re-uploads. Repeated identical chunks within one document get an occurrence suffix.
+    """
+    ids = []
+    occurrences = {}
+    for chunk in chunks:
+        digest = hashlib.sha256(chunk.encode('utf-8')).hexdigest()[:32]
+        count = occurrences.get(digest, 0)
+        occurrences[digest] = count + 1
+        ids.append(f"{filename}_{digest}" if count == 0 else f"{filename}_{digest}_{count}")
+    return ids
+
+CHUNK_ID_PATTERN = re.compile(r'^(.*)_[0-9a-f]{32}(?:_\d+)?$')
+
+def chunk_id_filename(chunk_id):
+    """
+    The document a chunk id from make_chunk_ids belongs to.
+    """
+    match = CHUNK_ID_PATTERN.match(chunk_id)
+    return match.group(1) if match else chunk_id
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
-client = chromadb.PersistentClient(path=Config.CHROMADB_PATH)
+# Per-chunk fields recorded by the chunker (see services/chunking.py)
+CHUNK_METADATA_FIELDS = ('token_count', 'char_start', 'char_end')
 
-def store_embeddings(chunks, filename, user_id):
+# Document-level fields copied onto every chunk so search filters run inside the vector query.
+# Topic membership is one boolean key per topic, since metadata values must be scalars.
+NO_FOLDER_ID = 0  # folder_id stored for documents that aren't in a folder
+
+def topic_metadata_key(topic_name):
+    return f"topic:{topic_name}"
+
+def build_chunk_metadatas(filename, chunk_indexes, content_hash=None, chunk_metadatas=None, document_metadata=None):
+    metadatas = [{'filename': filename, 'chunk_index': i, **(document_metadata or {})} for i in chunk_indexes]
+    for position, metadata in enumerate(metadatas):
+        if content_hash:
+            metadata['content_hash'] = content_hash
+        if chunk_metadatas:
+            metadata.update({key: chunk_metadatas[position][key] for key in CHUNK_METADATA_FIELDS if key in chunk_metadatas[position]})
+    return metadatas
+
+def store_embeddings(chunks, filename, user_id, content_hash=None, ids=None, chunk_indexes=None, embeddings=None, chunk_metadatas=None, cache_stats=None, document_metadata=None):
+    """
+    Add chunks to the user's collection. ids and chunk_indexes default to the deterministic
+    ids and positions 0..n-1; precomputed embeddings skip encoding. chunk_metadatas,
+    aligned with chunks, carries the chunker's token_count/char_start/char_end.
+    cache_stats is passed through to encode_chunks; document_metadata (file_type, folder_id,
+    topic keys) is added to every chunk.
+    """
     collection_name = f"user_{user_id}"
-    collection = client.get_or_create_collection(name=collection_name)
+    collection = get_client().get_or_create_collection(name=collection_name)
 
-    embeddings = model.encode(chunks)
-    # Generate truly unique IDs to avoid conflicts when re-uploading same file
-    import uuid
-    import time
-    timestamp = str(int(time.time() * 1000000))  # Microsecond precision timestamp
-    ids = [f"{filename}_{timestamp}_{uuid.uuid4().hex}_{i}" for i in range(len(chunks))]
-    metadatas = [{'filename': filename, 'chunk_index': i} for i in range(len(chunks))]
+    if embeddings is None:
+        embeddings = encode_chunks(chunks, cache_stats=cache_stats)
+    if ids is None:
+        ids = make_chunk_ids(filename, chunks)
+    if chunk_indexes is None:
+        chunk_indexes = list(range(len(chunks)))
+    metadatas = build_chunk_metadatas(filename, chunk_indexes, content_hash, chunk_metadatas, document_metadata)
 
     collection.add(
-        embeddings=embeddings.tolist(),
+        embeddings=embeddings,
         documents=chunks,
         metadatas=metadatas,
         ids=ids
     )
+    _sync_keyword_index(index_chunks, user_id, ids, chunks, metadatas)
+    _invalidate_answers(user_id, [filename])
 
-def search_similar_chunks(query, user_id, top_k=5, selected_documents=None):
+def encode_chunks(chunks, batch_size=64, cache_stats=None):
     """
-    Optimized similarity search using cosine similarity.
-    Returns most relevant chunks for effective AI explanations.
-    If selected_documents is provided, only search within those documents.
-    For logged-in users, also searches in 'default_user' collection if no results found.
+    Embed a list of chunk texts, returned as plain lists. Vectors already in the on-disk
+    embedding cache (keyed by model name and chunk text hash) are reused, and only the
+    misses go through one model.encode call. cache_stats, if given, accumulates
+    'hits' and 'misses' per chunk.
     """
-    collection_name = f"user_{user_id}"
-    query_embedding = model.encode([query])[0]
+    if cache_stats is None:
+        cache_stats = {'hits': 0, 'misses': 0}
+    if not Config.EMBEDDING_CACHE_ENABLED:
+        cache_stats['misses'] += len(chunks)
+        return get_model().encode(chunks, batch_size=batch_size).tolist()
 
-    def search_collection(collection_name, query_embedding, top_k, selected_documents):
+    hashes = [text_hash(chunk) for chunk in chunks]
+    try:
+        vectors = get_cached_embeddings(Config.EMBEDDING_MODEL, set(hashes))
+    except Exception as e:
+        print(f"Error reading embedding cache: {str(e)}")
+        vectors = {}
+
+    missing = {}
+    for key, chunk in zip(hashes, chunks):
+        if key not in vectors:
+            missing.setdefault(key, chunk)
+    if missing:
+        encoded = dict(zip(missing, get_model().encode(list(missing.values()), batch_size=batch_size).tolist()))
+        vectors.update(encoded)
         try:
-            collection = client.get_collection(name=collection_name)
-        except:
-            return []
+            put_cached_embeddings(Config.EMBEDDING_MODEL, encoded)
+        except Exception as e:
+            print(f"Error writing embedding cache: {str(e)}")
 
-        # If selected_documents is specified, we need to filter results
-        if selected_documents:
-            # Get more results initially since we'll filter them
-            initial_results = collection.query(
-                query_embeddings=[query_embedding.tolist()],
-                n_results=top_k * 3,  # Get more results to account for filtering
-                include=['documents', 'metadatas', 'distances']
-            )
-
-            if not initial_results.get('documents') or not initial_results['documents'][0]:
-                return []
-
-            # Filter results to only include selected documents
-            filtered_chunks = []
-            for i, doc in enumerate(initial_results['documents'][0]):
-                filename = initial_results['metadatas'][0][i]['filename']
-                if filename in selected_documents:
-                    similarity_score = 1 - (initial_results['distances'][0][i] ** 2) / 2
-                    filtered_chunks.append({
-                        'chunk': doc,
-                        'filename': filename,
-                        'chunk_index': initial_results['metadatas'][0][i]['chunk_index'],
-                        'similarity_score': similarity_score
-                    })
+    misses = sum(1 for key in hashes if key in missing)
+    cache_stats['hits'] += len(hashes) - misses
+    cache_stats['misses'] += misses
+    return [vectors[key] for key in hashes]
 
-            # Sort by similarity score and take top_k
-            filtered_chunks.sort(key=lambda x: x['similarity_score'], reverse=True)
-            return filtered_chunks[:top_k]
-        else:
-            # Original behavior when no documents are selected (search all)
-            results = collection.query(
-                query_embeddings=[query_embedding.tolist()],
-                n_results=top_k,
-                include=['documents', 'metadatas', 'distances']
-            )
-
-            if not results.get('documents') or not results['documents'][0]:
-                return []
-
-            similar_chunks = []
-            for i, doc in enumerate(results['documents'][0]):
-                similarity_score = 1 - results['distances'][0][i]
-
-                similar_chunks.append({
-                    'chunk': doc,
-                    'filename': results['metadatas'][0][i]['filename'],
-                    'chunk_index': results['metadatas'][0][i]['chunk_index'],
-                    'similarity_score': similarity_score
-                })
+def add_chunks(user_id, ids, chunks, embeddings, metadatas):
+    """
+    Bulk-write prepared chunks (possibly from many documents) to the user's collection.
+    """
+    collection = get_client().get_or_create_collection(name=f"user_{user_id}")
+    collection.add(embeddings=embeddings, documents=chunks, metadatas=metadatas, ids=ids)
+    _sync_keyword_index(index_chunks, user_id, ids, chunks, metadatas)
+    _invalidate_answers(user_id, (metadata['filename'] for metadata in metadatas))
+
+def get_document_chunk_ids(filename, user_id):
+    """
+    Ids of every chunk currently stored for a document in the user's collection.
+    """
+    try:
+        collection = get_client().get_collection(name=f"user_{user_id}")
+    except Exception:
+        return []
+    return collection.get(where={'filename': filename}, include=[])['ids']
+
+def _sync_keyword_index(func, *args):
+    # The keyword index mirrors every collection write; a failure there shouldn't fail the
+    # write itself (build_keyword_index can always rebuild it from the collection)
+    try:
+        func(*args)
+    except Exception as e:
+        print(f"Error updating keyword index: {str(e)}")
+
+def _invalidate_answers(user_id, filenames):
+    # Cached answers built from a user's document are stale once its chunks are rewritten
+    try:
+        invalidate_documents(user_id, filenames)
+    except Exception as e:
+        print(f"Error invalidating cached answers: {str(e)}")
 
-            # Sort by similarity score (highest first) for better relevance
-            similar_chunks.sort(key=lambda x: x['similarity_score'], reverse=True)
-            return similar_chunks
+def update_chunk_metadata(ids, chunk_indexes, filename, user_id, content_hash=None, chunk_metadatas=None, document_metadata=None):
+    """
+    Rewrite position metadata for chunks whose text (and so embedding) is unchanged.
+    """
+    collection = get_client().get_or_create_collection(name=f"user_{user_id}")
+    metadatas = build_chunk_metadatas(filename, chunk_indexes, content_hash, chunk_metadatas, document_metadata)
+    collection.update(ids=ids, metadatas=metadatas)
+    _sync_keyword_index(update_indexed_metadata, user_id, ids, metadatas)
+    _invalidate_answers(user_id, [filename])
+
+def set_document_metadata(filename, user_id, fields):
+    """
+    Merge fields into the metadata of every stored chunk of a document, e.g. after it moves
+    to another folder or joins or leaves a topic. Returns the number of chunks updated.
+    """
+    try:
+        collection = get_client().get_collection(name=f"user_{user_id}")
+    except Exception:
+        return 0
+    ids = collection.get(where={'filename': filename}, include=[])['ids']
+    if ids:
+        collection.update(ids=ids, metadatas=[dict(fields) for _ in ids])
+    _sync_keyword_index(set_indexed_document_metadata, user_id, filename, fields)
+    return len(ids)
+
+def delete_chunks(ids, user_id):
+    try:
+        collection = get_client().get_collection(name=f"user_{user_id}")
+    except Exception:
+        return
+    collection.delete(ids=list(ids))
+    _sync_keyword_index(delete_indexed_chunks, user_id, ids)
+    _invalidate_answers(user_id, (chunk_id_filename(chunk_id) for chunk_id in ids))
+
+def get_content_embeddings(content_hash, user_id):
+    """
+    Fetch the stored chunks and vectors of previously ingested content, in chunk order,
+    so identical content can be linked to a new owner without re-encoding.
+    Returns (chunks, embeddings, chunk_metadatas), or None if nothing is stored for that hash.
+    """
+    try:
+        source = get_client().get_collection(name=f"user_{user_id}")
+        results = source.get(
+            where={'content_hash': content_hash},
+            include=['embeddings', 'documents', 'metadatas']
+        )
+    except Exception:
+        return None
+
+    if not results['ids']:
+        return None
+
+    # The content may be stored under several filenames; take one copy per chunk index
+    first_filename = results['metadatas'][0]['filename']
+    by_index = {}
+    for i, metadata in enumerate(results['metadatas']):
+        if metadata['filename'] == first_filename:
+            by_index.setdefault(metadata['chunk_index'], i)
+    order = [by_index[chunk_index] for chunk_index in sorted(by_index)]
+
+    chunks = [results['documents'][i] for i in order]
+    embeddings = [list(results['embeddings'][i]) for i in order]
+    chunk_metadatas = [
+        {key: results['metadatas'][i][key] for key in CHUNK_METADATA_FIELDS if key in results['metadatas'][i]}
+        for i in order
+    ]
+    return chunks, embeddings, chunk_metadatas
+
+def get_document_centroids(user_id, filenames=None, page_size=5000):
+    """
+    Mean chunk embedding (unit length) of each document, read page by page from the
+    user's collection with 'default_user' documents filling in for logged-in users, as in
+    get_all_chunks. filenames, if given, limits which documents are averaged.
+    Returns {filename: numpy vector}.
+    """
+    import numpy as np
+
+    wanted = set(filenames) if filenames is not None else None
+    sums = {}
+    counts = {}
+    collection_names = [f"user_{user_id}"] + (["user_default_user"] if user_id != 'default_user' else [])
+    for collection_name in collection_names:
+        try:
+            collection = get_client().get_collection(name=collection_name)
+        except Exception:
+            continue
+        seen_here = set()
+        offset = 0
+        while True:
+            page = collection.get(include=['embeddings', 'metadatas'], limit=page_size, offset=offset)
+            if not page['ids']:
+                break
+            offset += len(page['ids'])
+            for embedding, metadata in zip(page['embeddings'], page['metadatas']):
+                filename = metadata['filename']
+                if wanted is not None and filename not in wanted:
+                    continue
+                if filename in counts and filename not in seen_here:
+                    continue  # Already averaged from the user's own collection
+                seen_here.add(filename)
+                vector = np.asarray(embedding, dtype=np.float32)
+                sums[filename] = sums[filename] + vector if filename in sums else vector
+                counts[filename] = counts.get(filename, 0) + 1
+
+    centroids = {}
+    for filename, total in sums.items():
+        norm = np.linalg.norm(total)
+        centroids[filename] = total / norm if norm else total
+    return centroids
+
+class EmbeddingBatcher:
+    """
+    Coalesces single-text encode requests from concurrent threads into batched
+    model.encode calls. A dispatcher thread takes the first waiting request, collects more
+    for up to max_wait_ms (when there's concurrent load) or until max_batch texts, encodes
+    them together and resolves each caller's future. Identical texts in a batch are encoded once.
+    """
+
+    def __init__(self, max_batch=32, max_wait_ms=5):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.last_batch_size = 0
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_started(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                    self.thread.start()
+
+    def encode(self, text):
+        """
+        Embed one text as part of the next batch; blocks until its vector (a list) is ready.
+        """
+        future = Future()
+        self._ensure_started()
+        self.requests.put((text, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        # A lone client shouldn't pay max_wait on every query: only hold the batch open once
+        # the previous one showed concurrent callers. Anything already queued is always taken.
+        deadline = time.monotonic() + (self.max_wait if self.last_batch_size > 1 else 0)
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                # Past the deadline, still take whatever is already queued
+                batch.append(self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.last_batch_size = len(batch)
+            waiting = {}
+            for text, future in batch:
+                waiting.setdefault(text, []).append(future)
+            texts = list(waiting)
+            try:
+                vectors = get_model().encode(texts, batch_size=len(texts)).tolist()
+            except Exception as e:
+                print(f"Error encoding batch of {len(texts)} queries: {str(e)}")
+                for futures in waiting.values():
+                    for future in futures:
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            for text, vector in zip(texts, vectors):
+                for future in waiting[text]:
+                    future.set_result(vector)
+
+    def get_stats(self):
+        return {
+            'batches': self.batches,
+            'texts': self.texts,
+            'avg_batch_size': round(self.texts / self.batches, 2) if self.batches else 0.0,
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000
+        }
+
+_query_batcher = EmbeddingBatcher(Config.EMBED_BATCH_MAX_SIZE, Config.EMBED_BATCH_MAX_WAIT_MS)
+
+def encode_query_text(text):
+    """
+    Embed a single query through the shared batcher, or directly if batching is disabled
+    (EMBED_BATCH_MAX_SIZE <= 1).
+    """
+    if _query_batcher.max_batch <= 1:
+        return get_model().encode([text])[0].tolist()
+    return _query_batcher.encode(text)
+
+def get_batcher_stats():
+    return _query_batcher.get_stats()
+
+def normalize_query(query):
+    # The default MiniLM tokenizer lowercases its input, so case and spacing don't change the vector
+    return ' '.join(query.split()).lower()
+
+@lru_cache(maxsize=Config.QUERY_EMBEDDING_CACHE_SIZE)
+def _encode_query(normalized_query):
+    return tuple(encode_query_text(normalized_query))
+
+def embed_query(query):
+    """
+    Embedding of a search query, served from a bounded LRU cache keyed by the normalized
+    query text so repeated questions skip model inference.
+    """
+    return list(_encode_query(normalize_query(query)))
+
+def get_query_cache_stats():
+    info = _encode_query.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_ratio': round(info.hits / lookups, 3) if lookups else 0.0
+    }
+
+def chunk_offsets(metadata):
+    """
+    char_start/char_end of a chunk within its document, when the chunker recorded them;
+    the context builder uses them to trim the overlap between consecutive chunks.
+    """
+    return {key: metadata[key] for key in ('char_start', 'char_end') if key in metadata}
+
+def build_where(selected_documents=None, filters=None):
+    """
+    Chroma where clause restricting a query to the selected filenames and to chunks whose
+    metadata equals every value in filters (e.g. file_type, folder_id, topic keys).
+    """
+    conditions = []
+    if selected_documents:
+        conditions.append({'filename': {'$in': sorted(set(selected_documents))}})
+    for key, value in (filters or {}).items():
+        conditions.append({key: value})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+def search_collection(collection_name, query_embedding, top_k=5, selected_documents=None, filters=None):
+    """
+    Nearest chunks to query_embedding in one collection. With selected_documents and/or
+    metadata filters, returns the top_k nearest in-scope chunks (fewer only if the scope
+    holds fewer), filtering inside the vector query rather than over-fetching and
+    filtering afterwards.
+    """
+    try:
+        collection = get_client().get_collection(name=collection_name)
+    except:
+        return []
+
+    include = ['documents', 'metadatas', 'distances']
+    where = build_where(selected_documents, filters)
+    results = None
+    if where and not (selected_documents and len(set(selected_documents)) <= Config.SEARCH_FILTER_MAX_DOCUMENTS):
+        # Chroma applies a where filter by loading every matching record, which gets slow
+        # for broad scopes. Probe without it first: the in-scope chunks among the global
+        # nearest neighbours are exactly the nearest in-scope chunks, so if there are
+        # top_k of them the filtered query isn't needed.
+        selected = set(selected_documents or [])
+
+        def in_scope(metadata):
+            if selected and metadata['filename'] not in selected:
+                return False
+            return all(metadata.get(key) == value for key, value in (filters or {}).items())
+
+        probe = collection.query(query_embeddings=[query_embedding], n_results=top_k * 3, include=include)
+        keep = [i for i, metadata in enumerate(probe['metadatas'][0]) if in_scope(metadata)][:top_k]
+        if len(keep) == top_k:
+            results = {key: [[probe[key][0][i] for i in keep]] for key in ('ids', 'documents', 'metadatas', 'distances')}
+    if results is None:
+        results = collection.query(query_embeddings=[query_embedding], n_results=top_k, where=where, include=include)
+
+    if not results.get('documents') or not results['documents'][0]:
+        return []
+
+    similar_chunks = []
+    for i, doc in enumerate(results['documents'][0]):
+        similarity_score = 1 - results['distances'][0][i]
+        metadata = results['metadatas'][0][i]
+
+        similar_chunks.append({
+            'chunk': doc,
+            'chunk_id': results['ids'][0][i],
+            'filename': metadata['filename'],
+            'user_id': collection_name[len('user_'):],  # Whose collection it came from
+            'chunk_index': metadata['chunk_index'],
+            'similarity_score': similarity_score,
+            **chunk_offsets(metadata)
+        })
+
+    # Sort by similarity score (highest first) for better relevance
+    similar_chunks.sort(key=lambda x: x['similarity_score'], reverse=True)
+    return similar_chunks
+
+def search_similar_chunks(query, user_id, top_k=5, selected_documents=None, filters=None, mode='dense'):
+    """
+    Optimized similarity search using cosine similarity.
+    Returns most relevant chunks for effective AI explanations.
+    If selected_documents is provided, only search within those documents; filters
+    restricts results to chunks whose metadata matches (see build_where).
+    For logged-in users, also searches in 'default_user' collection if no results found.
+    mode='hybrid' fuses these results with BM25 keyword matches (see hybrid_search).
+    """
+    if mode == 'hybrid':
+        return hybrid_search(query, user_id, top_k, selected_documents, filters)
+
+    collection_name = f"user_{user_id}"
+    query_embedding = embed_query(query)
 
     # First try searching in user's collection
-    results = search_collection(collection_name, query_embedding, top_k, selected_documents)
+    results = search_collection(collection_name, query_embedding, top_k, selected_documents, filters)
 
     # If no results and user is not default_user, also search in default_user collection
     if not results and user_id != 'default_user' and not selected_documents:
-        default_results = search_collection("user_default_user", query_embedding, top_k, selected_documents)
+        default_results = search_collection("user_default_user", query_embedding, top_k, selected_documents, filters)
         results = default_results
 
     return results
 
+_hybrid_executor = None
+_hybrid_executor_lock = threading.Lock()
+
+def _get_hybrid_executor():
+    global _hybrid_executor
+    with _hybrid_executor_lock:
+        if _hybrid_executor is None:
+            _hybrid_executor = ThreadPoolExecutor(max_workers=Config.HYBRID_SEARCH_WORKERS, thread_name_prefix='hybrid-search')
+        return _hybrid_executor
+
+def reciprocal_rank_fusion(result_lists, top_k, k=60):
+    """
+    Merge ranked result lists by reciprocal rank: each chunk scores the sum of
+    1 / (k + rank) over the lists it appears in. Chunks are identified by
+    (filename, chunk_index); the first list's entry is kept and scores from the
+    others (similarity_score, bm25_score) are merged onto it.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            key = (result['filename'], result['chunk_index'])
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {**result, 'rrf_score': 0.0}
+            else:
+                for field, value in result.items():
+                    entry.setdefault(field, value)
+            entry['rrf_score'] += 1 / (k + rank)
+
+    ranked = sorted(fused.values(), key=lambda x: x['rrf_score'], reverse=True)[:top_k]
+    for entry in ranked:
+        entry['rrf_score'] = round(entry['rrf_score'], 6)
+    return ranked
+
+def hybrid_search(query, user_id, top_k=5, selected_documents=None, filters=None):
+    """
+    Dense (vector) and lexical (BM25) retrieval run in parallel, merged with reciprocal
+    rank fusion. Exact terms like acronyms and identifiers that embed poorly still rank
+    through the keyword side. Each retriever contributes HYBRID_CANDIDATES results.
+    """
+    candidates = max(top_k, Config.HYBRID_CANDIDATES)
+    keyword_future = _get_hybrid_executor().submit(
+        keyword_search, query, user_id, candidates, selected_documents, filters
+    )
+    dense_results = search_similar_chunks(query, user_id, candidates, selected_documents, filters)
+    try:
+        keyword_results = keyword_future.result()
+    except Exception as e:
+        print(f"Error in keyword search for hybrid retrieval: {str(e)}")
+        keyword_results = []
+
+    return reciprocal_rank_fusion([dense_results, keyword_results], top_k, Config.HYBRID_RRF_K)
+
 def get_all_chunks(user_id):
     chunks = []
 
     # Get chunks from user's collection
     collection_name = f"user_{user_id}"
     try:
-        collection = client.get_collection(name=collection_name)
+        collection = get_client().get_collection(name=collection_name)
         results = collection.get(include=['documents', 'metadatas'])
         for i, doc in enumerate(results['documents']):
             chunks.append({
@@ -125,7 +628,7 @@ def get_all_chunks(user_id):
     # For logged-in users, also get chunks from 'default_user' collection
     if user_id != 'default_user':
         try:
-            default_collection = client.get_collection(name="user_default_user")
+            default_collection = get_client().get_collection(name="user_default_user")
             default_results = default_collection.get(include=['documents', 'metadatas'])
 
             # Avoid duplicates by filename and chunk_index
@@ -145,6 +648,36 @@ def get_all_chunks(user_id):
 
     return chunks
 
+def get_document_chunks(filename, user_id):
+    """
+    Stored chunks of one document in chunk order, read with a filename filter rather than
+    loading the whole collection. Falls back to 'default_user' for logged-in users, as in
+    get_all_chunks. Each chunk carries chunk_id and, when recorded, char offsets.
+    """
+    collection_names = [f"user_{user_id}"]
+    if user_id != 'default_user':
+        collection_names.append("user_default_user")
+
+    for collection_name in collection_names:
+        try:
+            collection = get_client().get_collection(name=collection_name)
+            results = collection.get(where={'filename': filename}, include=['documents', 'metadatas'])
+        except Exception:
+            continue
+        if results['ids']:
+            chunks = [
+                {
+                    'chunk': doc,
+                    'filename': filename,
+                    'chunk_index': metadata['chunk_index'],
+                    'chunk_id': chunk_id,
+                    **chunk_offsets(metadata)
+                }
+                for chunk_id, doc, metadata in zip(results['ids'], results['documents'], results['metadatas'])
+            ]
+            return sorted(chunks, key=lambda chunk: chunk['chunk_index'])
+    return []
+
 def get_documents(user_id):
     """
     Get all unique documents for a user with metadata.
@@ -155,7 +688,7 @@ def get_documents(user_id):
     # Get documents from user's collection
     collection_name = f"user_{user_id}"
     try:
-        collection = client.get_collection(name=collection_name)
+        collection = get_client().get_collection(name=collection_name)
         results = collection.get(include=['metadatas'])
 
         # Get unique filenames
@@ -179,7 +712,7 @@ def get_documents(user_id):
     # For logged-in users, also get documents from 'default_user' collection
     if user_id != 'default_user':
         try:
-            default_collection = client.get_collection(name="user_default_user")
+            default_collection = get_client().get_collection(name="user_default_user")
             default_results = default_collection.get(include=['metadatas'])
 
             # Get unique filenames from default collection
@@ -219,7 +752,7 @@ def get_similarity_groups(user_id, threshold=0.65):
         # Get data from user's collection
         collection_name = f"user_{user_id}"
         try:
-            collection = client.get_collection(name=collection_name)
+            collection = get_client().get_collection(name=collection_name)
             results = collection.get(include=['embeddings', 'metadatas'])
             if results['embeddings'] and results['metadatas']:
                 all_embeddings.extend(results['embeddings'])
@@ -230,7 +763,7 @@ def get_similarity_groups(user_id, threshold=0.65):
         # For logged-in users, also get data from 'default_user' collection
         if user_id != 'default_user':
             try:
-                default_collection = client.get_collection(name="user_default_user")
+                default_collection = get_client().get_collection(name="user_default_user")
                 default_results = default_collection.get(include=['embeddings', 'metadatas'])
                 if default_results['embeddings'] and default_results['metadatas']:
                     all_embeddings.extend(default_results['embeddings'])
@@ -0,0 +1,388 @@
+import io
+import os
+import signal
+import zipfile
+import posixpath
+import threading
+import multiprocessing
+from xml.etree import ElementTree
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import pdfplumber
+from config import Config
+
+_pdf_executor = None
+_pdf_worker_pids = None  # Queue the current pool's workers report their pids on
+_pdf_executor_lock = threading.Lock()
+
+
+class PageTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise PageTimeout()
+
+
+def _can_alarm():
+    # SIGALRM only works on Unix and in the main thread, which is where pool workers run tasks
+    return hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+
+
+def _extract_page(page, timeout):
+    use_alarm = timeout and _can_alarm()
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.alarm(int(timeout))
+    try:
+        return page.extract_text() or ''
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def extract_pdf_range(filepath, start, end, timeout=None):
+    """
+    Extract pages [start, end) of a PDF. Returns a list of (page_number, text), page numbers
+    starting at 1. A page that errors or exceeds timeout seconds comes back as ''.
+    Runs in pool workers, so it only takes and returns picklable values.
+    """
+    pages = []
+    with pdfplumber.open(filepath) as pdf:
+        for index in range(start, end):
+            page = pdf.pages[index]
+            try:
+                text = _extract_page(page, timeout)
+            except PageTimeout:
+                print(f"Page {index + 1} of {filepath} timed out after {timeout}s, skipping")
+                text = ''
+            except Exception as e:
+                print(f"Error extracting page {index + 1} of {filepath}: {str(e)}")
+                text = ''
+            pages.append((index + 1, text))
+            # Drop the parsed layout objects so memory stays bounded by the current page
+            page.flush_cache()
+    return pages
+
+
+def _report_pid(pid_queue):
+    pid_queue.put(os.getpid())
+
+
+def _get_pdf_executor():
+    global _pdf_executor, _pdf_worker_pids
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            # Spawned, not forked: this runs on job threads of a process with torch and the
+            # vector store client loaded, whose locks a forked child could inherit held
+            context = multiprocessing.get_context('spawn')
+            _pdf_worker_pids = context.SimpleQueue()
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=max(1, Config.PDF_EXTRACT_WORKERS), mp_context=context,
+                initializer=_report_pid, initargs=(_pdf_worker_pids,)
+            )
+        return _pdf_executor
+
+
+def _discard_pdf_executor(executor):
+    """
+    Kill the workers of a pool that broke or has a stuck worker, so the next
+    _get_pdf_executor call builds a fresh one. Other callers' tasks on it fail with
+    BrokenProcessPool and are retried on the new pool.
+    """
+    global _pdf_executor, _pdf_worker_pids
+    with _pdf_executor_lock:
+        if _pdf_executor is not executor:
+            return  # Another caller already replaced it
+        pid_queue = _pdf_worker_pids
+        _pdf_executor = _pdf_worker_pids = None
+    while not pid_queue.empty():
+        try:
+            os.kill(pid_queue.get(), getattr(signal, 'SIGKILL', signal.SIGTERM))
+        except OSError:
+            pass  # Already exited
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pdf_pages(filepath):
+    """
+    Yield (page_number, text) for each page of a PDF, in page order.
+    PDFs of at least PDF_POOL_MIN_PAGES pages are fanned out over a process pool in page
+    ranges, with at most two ranges per worker in flight, so peak memory is bounded by a
+    few ranges of pages rather than the document. Smaller ones (and all PDFs when
+    PDF_EXTRACT_WORKERS is 0) are extracted in-process, unless PDF_PAGE_TIMEOUT can't be
+    enforced there (off the main thread, e.g. on a job worker); then they go through the
+    pool (a single worker when PDF_EXTRACT_WORKERS is 0).
+    A range whose worker dies is retried once on a fresh pool; a range that times out, or
+    dies again, comes back as empty pages and the pool is replaced.
+    """
+    with pdfplumber.open(filepath) as pdf:
+        page_count = len(pdf.pages)
+
+    in_process = Config.PDF_EXTRACT_WORKERS <= 0 or page_count < Config.PDF_POOL_MIN_PAGES
+    if in_process and (not Config.PDF_PAGE_TIMEOUT or _can_alarm()):
+        for page_number, text in extract_pdf_range(filepath, 0, page_count, Config.PDF_PAGE_TIMEOUT):
+            yield page_number, text
+        return
+
+    step = Config.PDF_PAGES_PER_TASK
+    ranges = deque((start, min(start + step, page_count)) for start in range(0, page_count, step))
+    in_flight = deque()
+
+    def submit(page_range, attempt):
+        executor = _get_pdf_executor()
+        try:
+            future = executor.submit(extract_pdf_range, filepath, page_range[0], page_range[1], Config.PDF_PAGE_TIMEOUT)
+        except BrokenProcessPool:
+            _discard_pdf_executor(executor)
+            executor = _get_pdf_executor()
+            future = executor.submit(extract_pdf_range, filepath, page_range[0], page_range[1], Config.PDF_PAGE_TIMEOUT)
+        in_flight.append((page_range, attempt, executor, future))
+
+    def submit_next():
+        if ranges:
+            submit(ranges.popleft(), 0)
+
+    for _ in range(max(1, Config.PDF_EXTRACT_WORKERS) * 2):
+        submit_next()
+
+    while in_flight:
+        (start, end), attempt, executor, future = in_flight[0]
+        try:
+            # Backstop for a worker stuck somewhere the per-page alarm can't interrupt
+            pages = future.result(timeout=(end - start) * Config.PDF_PAGE_TIMEOUT + 10)
+        except BrokenProcessPool as e:
+            _discard_pdf_executor(executor)
+            if attempt == 0:
+                # Which range killed the worker is unknown: retry everything that was on the
+                # dead pool once, keeping ranges submitted to a newer pool as they are
+                queued = list(in_flight)
+                in_flight.clear()
+                for page_range, a, other, other_future in queued:
+                    finished = other_future.done() and not other_future.cancelled() and other_future.exception() is None
+                    if other is executor and not finished:
+                        submit(page_range, a + 1)
+                    else:
+                        in_flight.append((page_range, a, other, other_future))
+                continue
+            print(f"Error extracting pages {start + 1}-{end} of {filepath}: worker died twice ({str(e)})")
+            pages = [(index + 1, '') for index in range(start, end)]
+        except FutureTimeoutError:
+            print(f"Pages {start + 1}-{end} of {filepath} timed out, restarting the extraction pool")
+            _discard_pdf_executor(executor)
+            pages = [(index + 1, '') for index in range(start, end)]
+        except Exception as e:
+            print(f"Error extracting pages {start + 1}-{end} of {filepath}: {str(e)}")
+            pages = [(index + 1, '') for index in range(start, end)]
+        in_flight.popleft()
+        submit_next()
+        for page_number, text in pages:
+            yield page_number, text
+
+
+# --- OOXML (pptx/docx) ---
+
+A_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+P_NS = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+R_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+SLIDE_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide'
+NOTES_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide'
+
+
+def _read_rels(archive, part):
+    """
+    Map relationship id -> (type, zip path) for a part, resolving targets relative to it.
+    """
+    directory, name = posixpath.split(part)
+    rels_path = posixpath.join(directory, '_rels', f'{name}.rels')
+    if rels_path not in archive.namelist():
+        return {}
+    rels = {}
+    with archive.open(rels_path) as f:
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag == f'{REL_NS}Relationship':
+                target = posixpath.normpath(posixpath.join(directory, elem.get('Target')))
+                rels[elem.get('Id')] = (elem.get('Type'), target)
+    return rels
+
+
+def _iter_blocks(stream, ns, paragraph_tag, text_tag, break_tags, row_tag, cell_tag):
+    """
+    Incrementally parse an OOXML part and yield text blocks in document order:
+    one block per non-empty paragraph, and one ' | '-joined block per table row.
+    Elements are cleared as soon as they're consumed, so memory stays flat.
+    """
+    paragraph = []
+    rows = []  # Stack of open table rows (tables can nest); each row is a list of cells
+    cells = []  # Stack of open cells; each cell is a list of paragraph texts
+
+    for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == ns + row_tag:
+                rows.append([])
+            elif tag == ns + cell_tag:
+                cells.append([])
+            continue
+
+        if tag == ns + text_tag:
+            paragraph.append(elem.text or '')
+        elif tag in break_tags:
+            paragraph.append(break_tags[tag])
+        elif tag == ns + paragraph_tag:
+            text = ''.join(paragraph).strip()
+            paragraph = []
+            if cells:
+                if text:
+                    cells[-1].append(text)
+            elif text:
+                yield text
+            elem.clear()
+        elif tag == ns + cell_tag:
+            cell = ' '.join(cells.pop())
+            if rows:
+                rows[-1].append(cell)
+            elem.clear()
+        elif tag == ns + row_tag:
+            row = [cell for cell in rows.pop() if cell]
+            if row:
+                if cells:
+                    cells[-1].append(' | '.join(row))  # Nested table inside a cell
+                else:
+                    yield ' | '.join(row)
+            elem.clear()
+
+
+def _iter_drawing_blocks(stream):
+    return _iter_blocks(stream, A_NS, 'p', 't', {f'{A_NS}br': '\n', f'{A_NS}tab': '\t'}, 'tr', 'tc')
+
+
+def _iter_notes_blocks(stream):
+    """
+    Speaker notes live in the body placeholder of the notes slide; the other placeholders
+    hold the slide thumbnail, slide number and header/footer text.
+    """
+    in_body = False
+    depth = 0
+    body_xml = []
+    for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start' and elem.tag == f'{P_NS}sp':
+            depth += 1
+        elif event == 'end' and elem.tag == f'{P_NS}ph' and depth:
+            in_body = elem.get('type') == 'body'
+        elif event == 'end' and elem.tag == f'{P_NS}sp':
+            depth -= 1
+            if in_body:
+                body_xml.append(ElementTree.tostring(elem))
+            in_body = False
+            elem.clear()
+    for xml in body_xml:
+        yield from _iter_drawing_blocks(io.BytesIO(xml))
+
+
+def iter_pptx_slides(filepath):
+    """
+    Yield (slide_number, text) for each slide of a .pptx in presentation order, reading the
+    zip parts directly. Text covers shapes and groups, table rows (cells joined with ' | ')
+    and speaker notes (prefixed with 'Notes:').
+    """
+    with zipfile.ZipFile(filepath) as archive:
+        presentation = 'ppt/presentation.xml'
+        rels = _read_rels(archive, presentation)
+        slide_parts = []
+        with archive.open(presentation) as f:
+            for _, elem in ElementTree.iterparse(f):
+                if elem.tag == f'{P_NS}sldId':
+                    rel_type, target = rels[elem.get(R_ID)]
+                    if rel_type == SLIDE_REL:
+                        slide_parts.append(target)
+
+        for slide_number, part in enumerate(slide_parts, start=1):
+            with archive.open(part) as f:
+                blocks = list(_iter_drawing_blocks(f))
+
+            for rel_type, target in _read_rels(archive, part).values():
+                if rel_type == NOTES_REL:
+                    with archive.open(target) as f:
+                        notes = list(_iter_notes_blocks(f))
+                    if notes:
+                        blocks.append('Notes: ' + '\n'.join(notes))
+
+            yield slide_number, '\n'.join(blocks)
+
+
+def iter_docx_blocks(filepath):
+    """
+    Yield the text of each non-empty paragraph and table row of a .docx body, in document
+    order, reading word/document.xml directly.
+    """
+    break_tags = {f'{W_NS}br': '\n', f'{W_NS}cr': '\n', f'{W_NS}tab': '\t'}
+    with zipfile.ZipFile(filepath) as archive:
+        with archive.open('word/document.xml') as f:
+            yield from _iter_blocks(f, W_NS, 'p', 't', break_tags, 'tr', 'tc')
+
+
+def _extract_pptx_with_library(filepath):
+    from pptx import Presentation
+    prs = Presentation(filepath)
+    text = ''
+    for slide in prs.slides:
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                text += shape.text + '\n'
+    return text
+
+
+def _extract_docx_with_library(filepath):
+    from docx import Document
+    doc = Document(filepath)
+    return '\n'.join([para.text for para in doc.paragraphs])
+
+
+def extract_pptx_text(filepath):
+    """
+    Slide-by-slide text of a .pptx, each slide headed with its number. Falls back to
+    python-pptx (shape text only) if the package can't be read directly.
+    """
+    try:
+        return '\n'.join(f"Slide {number}:\n{text}" for number, text in iter_pptx_slides(filepath))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        print(f"Falling back to python-pptx for {filepath}: {str(e)}")
+        return _extract_pptx_with_library(filepath)
+
+
+def extract_docx_text(filepath):
+    """
+    Paragraph-by-paragraph text of a .docx, including table rows. Falls back to
+    python-docx (body paragraphs only) if the package can't be read directly.
+    """
+    try:
+        return '\n'.join(iter_docx_blocks(filepath))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        print(f"Falling back to python-docx for {filepath}: {str(e)}")
+        return _extract_docx_with_library(filepath)
+
+
+def extract_document_text(filepath):
+    """
+    Extract the plain text of a supported document, dispatching on its extension.
+    """
+    ext = filepath.split('.')[-1].lower()
+    if ext == 'pdf':
+        text = ''.join(page_text for _, page_text in iter_pdf_pages(filepath))
+    elif ext == 'docx':
+        text = extract_docx_text(filepath)
+    elif ext == 'pptx':
+        text = extract_pptx_text(filepath)
+    elif ext == 'txt':
+        with open(filepath, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        raise ValueError("Unsupported file type")
+    # Basic cleanup
+    text = text.replace('\n\n', '\n').strip()
+    return text
@@ -1,13 +1,10 @@
 from models import db, Flashcard
 from datetime import datetime, timedelta
-import openai
-import os
+from services.llm_gateway import chat_completion
 
 def generate_flashcards_from_summary(user_id, summary_text, topic=None, document_filename=None, num_cards=5):
     """Generate flashcards from document summary using LLM"""
     try:
-        client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
         prompt = f"""
         Create {num_cards} flashcards from the following document summary. Each flashcard should have a question and answer pair suitable for spaced repetition learning.
 
@@ -17,15 +14,17 @@ def generate_flashcards_from_summary(user_id, summary_text, topic=None, document
         Make sure the questions test key concepts and the answers are concise but complete.
         """
 
-        response = client.chat.completions.create(
+        content = chat_completion(
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": prompt}],
             max_tokens=1000,
-            temperature=0.7
+            temperature=0.7,
+            cache=False,  # Each request should produce new cards
+            call_type='flashcards'
         )
 
         import json
-        flashcards_data = json.loads(response.choices[0].message.content.strip())
+        flashcards_data = json.loads(content.strip())
 
         flashcards = []
         for card_data in flashcards_data[:num_cards]:
@@ -0,0 +1,97 @@
+import uuid
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+# Ingestion stages reported by /api/jobs/<job_id>, in pipeline order
+STAGES = ['extracting', 'chunking', 'embedding', 'summarizing']
+
+_executor = ThreadPoolExecutor(max_workers=Config.INGEST_MAX_WORKERS, thread_name_prefix='ingest')
+# Bounds queued + running jobs so a burst of uploads can't pile up unbounded work
+_slots = threading.BoundedSemaphore(Config.INGEST_MAX_WORKERS + Config.INGEST_QUEUE_SIZE)
+_jobs = {}
+_jobs_lock = threading.Lock()
+MAX_FINISHED_JOBS = 500
+
+
+def _update_job(job_id, **fields):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        job['updated_at'] = datetime.utcnow().isoformat()
+
+
+def _prune_finished_jobs():
+    # Caller holds _jobs_lock. dicts keep insertion order, so the first finished jobs are the oldest.
+    finished = [job_id for job_id, job in _jobs.items() if job['status'] in ('completed', 'failed')]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+
+def _set_stage(job_id, stage):
+    _update_job(job_id, stage=stage, progress=round(STAGES.index(stage) / len(STAGES), 2))
+
+
+def submit_job(func, args=(), metadata=None):
+    """
+    Enqueue an ingestion task on the bounded worker pool.
+    func is called as func(*args, on_stage=callback) and should return a result dict;
+    a dict containing 'error' marks the job as failed. metadata is copied into the job record
+    (it can't override id, status or the other job fields).
+    Returns the job id, or None if the queue is full.
+    """
+    if not _slots.acquire(blocking=False):
+        return None
+
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow().isoformat()
+    with _jobs_lock:
+        _prune_finished_jobs()
+        _jobs[job_id] = {
+            **(metadata or {}),  # First, so it can't overwrite the fields below
+            'id': job_id,
+            'status': 'queued',
+            'stage': None,
+            'progress': 0.0,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now
+        }
+
+    def run():
+        _update_job(job_id, status='running')
+        try:
+            result = func(*args, on_stage=lambda stage: _set_stage(job_id, stage))
+            if isinstance(result, dict) and 'error' in result:
+                _update_job(job_id, status='failed', error=result['error'], result=result)
+            else:
+                _update_job(job_id, status='completed', stage=None, progress=1.0, result=result)
+        except Exception as e:
+            print(f"Error in ingestion job {job_id}: {str(e)}")
+            _update_job(job_id, status='failed', error=str(e))
+        finally:
+            _slots.release()
+
+    try:
+        _executor.submit(run)
+    except Exception:
+        # e.g. the pool has shut down: don't leave a job that stays 'queued' forever
+        with _jobs_lock:
+            _jobs.pop(job_id, None)
+        _slots.release()
+        raise
+
+    return job_id
+
+
+def get_job(job_id):
+    """
+    Return a snapshot of a job's status, or None if the id is unknown.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
@@ -0,0 +1,299 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter
+from config import Config
+
+# BM25 parameters (the usual Okapi defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_CHARS = 240
+
+# SQLite caps bound parameters per statement (999 on older builds)
+_LOOKUP_BATCH = 500
+
+TOKEN_PATTERN = re.compile(r'\w+')
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have if in into is it its of on or that the '
+    'their then there these this to was were what when where which who why will with'.split()
+)
+
+_local = threading.local()
+# Per-user locks held by index builds and by every write, so a write that lands while a
+# build is reading the vector store waits and is applied on top of the built index
+_user_locks = {}
+_user_locks_guard = threading.Lock()
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(Config.KEYWORD_INDEX_PATH), exist_ok=True)
+        conn = sqlite3.connect(Config.KEYWORD_INDEX_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY, chunk_count INTEGER NOT NULL, total_length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                user_id TEXT NOT NULL, chunk_id TEXT NOT NULL, filename TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL, length INTEGER NOT NULL, text TEXT NOT NULL,
+                metadata TEXT NOT NULL, PRIMARY KEY (user_id, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS postings (
+                user_id TEXT NOT NULL, term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (user_id, term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_by_chunk ON postings (user_id, chunk_id);
+        ''')
+        _local.conn = conn
+    return conn
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def _user_lock(user_id):
+    with _user_locks_guard:
+        return _user_locks.setdefault(user_id, threading.RLock())
+
+
+def _is_built(conn, user_id):
+    return conn.execute('SELECT 1 FROM users WHERE user_id = ?', (user_id,)).fetchone() is not None
+
+
+def _remove(conn, user_id, ids):
+    removed_length = removed_count = 0
+    for start in range(0, len(ids), _LOOKUP_BATCH):
+        batch = ids[start:start + _LOOKUP_BATCH]
+        placeholders = ','.join('?' * len(batch))
+        row = conn.execute(
+            f'SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE user_id = ? AND chunk_id IN ({placeholders})',
+            [user_id, *batch]
+        ).fetchone()
+        removed_count += row[0]
+        removed_length += row[1]
+        conn.execute(f'DELETE FROM postings WHERE user_id = ? AND chunk_id IN ({placeholders})', [user_id, *batch])
+        conn.execute(f'DELETE FROM chunks WHERE user_id = ? AND chunk_id IN ({placeholders})', [user_id, *batch])
+    return removed_count, removed_length
+
+
+def _insert(conn, user_id, ids, chunks, metadatas):
+    total_length = 0
+    chunk_rows = []
+    posting_rows = []
+    for chunk_id, text, metadata in zip(ids, chunks, metadatas):
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        total_length += length
+        chunk_rows.append((
+            user_id, chunk_id, metadata['filename'], metadata['chunk_index'], length, text, json.dumps(metadata)
+        ))
+        posting_rows.extend((user_id, term, chunk_id, tf) for term, tf in counts.items())
+    conn.executemany('INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)', chunk_rows)
+    conn.executemany('INSERT INTO postings VALUES (?, ?, ?, ?)', posting_rows)
+    return len(chunk_rows), total_length
+
+
+def _adjust_stats(conn, user_id, count_delta, length_delta):
+    conn.execute(
+        'UPDATE users SET chunk_count = chunk_count + ?, total_length = total_length + ? WHERE user_id = ?',
+        (count_delta, length_delta, user_id)
+    )
+
+
+def index_chunks(user_id, ids, chunks, metadatas):
+    """
+    Add (or replace) chunks in the user's keyword index. Users whose index hasn't been
+    built yet are skipped; their first search builds it from the vector store.
+    """
+    user_id = str(user_id)
+    ids = list(ids)
+    conn = _connect()
+    with _user_lock(user_id), conn:
+        if not _is_built(conn, user_id):
+            return
+        removed_count, removed_length = _remove(conn, user_id, ids)
+        added_count, added_length = _insert(conn, user_id, ids, chunks, metadatas)
+        _adjust_stats(conn, user_id, added_count - removed_count, added_length - removed_length)
+
+
+def delete_indexed_chunks(user_id, ids):
+    user_id = str(user_id)
+    conn = _connect()
+    with _user_lock(user_id), conn:
+        if not _is_built(conn, user_id):
+            return
+        removed_count, removed_length = _remove(conn, user_id, list(ids))
+        _adjust_stats(conn, user_id, -removed_count, -removed_length)
+
+
+def _merge_metadata(conn, user_id, rows):
+    # rows: (chunk_id, fields) pairs; text and postings are unchanged
+    updates = []
+    for chunk_id, fields in rows:
+        row = conn.execute(
+            'SELECT metadata FROM chunks WHERE user_id = ? AND chunk_id = ?', (user_id, chunk_id)
+        ).fetchone()
+        if row:
+            metadata = {**json.loads(row[0]), **fields}
+            updates.append((metadata['filename'], metadata['chunk_index'], json.dumps(metadata), user_id, chunk_id))
+    conn.executemany(
+        'UPDATE chunks SET filename = ?, chunk_index = ?, metadata = ? WHERE user_id = ? AND chunk_id = ?', updates
+    )
+
+
+def update_indexed_metadata(user_id, ids, metadatas):
+    """
+    Merge new metadata into indexed chunks whose text is unchanged, mirroring collection.update.
+    """
+    user_id = str(user_id)
+    conn = _connect()
+    with _user_lock(user_id), conn:
+        if _is_built(conn, user_id):
+            _merge_metadata(conn, user_id, zip(ids, metadatas))
+
+
+def set_indexed_document_metadata(user_id, filename, fields):
+    user_id = str(user_id)
+    conn = _connect()
+    with _user_lock(user_id), conn:
+        if not _is_built(conn, user_id):
+            return
+        ids = [row[0] for row in conn.execute(
+            'SELECT chunk_id FROM chunks WHERE user_id = ? AND filename = ?', (user_id, filename)
+        )]
+        _merge_metadata(conn, user_id, [(chunk_id, fields) for chunk_id in ids])
+
+
+def build_keyword_index(user_id):
+    """
+    (Re)build a user's keyword index from the chunks in their vector collection.
+    Returns the number of chunks indexed.
+    """
+    from services.embedding_service import get_client
+
+    user_id = str(user_id)
+    conn = _connect()
+    # Held from the snapshot to the write, so no write to the index falls in between
+    with _user_lock(user_id):
+        try:
+            collection = get_client().get_collection(name=f"user_{user_id}")
+            stored = collection.get(include=['documents', 'metadatas'])
+        except Exception:
+            stored = {'ids': [], 'documents': [], 'metadatas': []}
+
+        with conn:
+            conn.execute('DELETE FROM postings WHERE user_id = ?', (user_id,))
+            conn.execute('DELETE FROM chunks WHERE user_id = ?', (user_id,))
+            count, total_length = _insert(conn, user_id, stored['ids'], stored['documents'], stored['metadatas'])
+            conn.execute('INSERT OR REPLACE INTO users VALUES (?, ?, ?)', (user_id, count, total_length))
+    return count
+
+
+def _ensure_built(conn, user_id):
+    if _is_built(conn, user_id):
+        return
+    with _user_lock(user_id):
+        if not _is_built(conn, user_id):
+            count = build_keyword_index(user_id)
+            print(f"Built keyword index for user {user_id}: {count} chunks")
+
+
+def _snippet(text, terms):
+    lowered = text.lower()
+    positions = []
+    for term in terms:
+        match = re.search(rf'\b{re.escape(term)}\b', lowered)
+        if match:
+            positions.append(match.start())
+    start = max(0, min(positions) - SNIPPET_CHARS // 4) if positions else 0
+    snippet = text[start:start + SNIPPET_CHARS].strip()
+    return ('...' if start > 0 else '') + snippet + ('...' if start + SNIPPET_CHARS < len(text) else '')
+
+
+def _matches(metadata, selected_documents, filters):
+    if selected_documents and metadata['filename'] not in selected_documents:
+        return False
+    return all(metadata.get(key) == value for key, value in (filters or {}).items())
+
+
+def _search_user(user_id, terms, top_k, selected_documents, filters):
+    conn = _connect()
+    _ensure_built(conn, user_id)
+
+    chunk_count, total_length = conn.execute(
+        'SELECT chunk_count, total_length FROM users WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    if not chunk_count:
+        return []
+    avg_length = total_length / chunk_count
+
+    placeholders = ','.join('?' * len(terms))
+    document_frequency = dict(conn.execute(
+        f'SELECT term, COUNT(*) FROM postings WHERE user_id = ? AND term IN ({placeholders}) GROUP BY term',
+        [user_id, *terms]
+    ))
+    if not document_frequency:
+        return []
+
+    # One pass over the postings of the query terms, joined to chunk lengths and metadata
+    scores = {}
+    candidates = {}
+    rows = conn.execute(
+        f'SELECT p.term, p.chunk_id, p.tf, c.length, c.metadata FROM postings p '
+        f'JOIN chunks c ON c.user_id = p.user_id AND c.chunk_id = p.chunk_id '
+        f'WHERE p.user_id = ? AND p.term IN ({placeholders})',
+        [user_id, *terms]
+    )
+    for term, chunk_id, tf, length, metadata in rows:
+        if chunk_id not in candidates:
+            candidates[chunk_id] = json.loads(metadata)
+        if not _matches(candidates[chunk_id], selected_documents, filters):
+            continue
+        df = document_frequency[term]
+        idf = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+        norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    results = []
+    for chunk_id, score in ranked:
+        text = conn.execute(
+            'SELECT text FROM chunks WHERE user_id = ? AND chunk_id = ?', (user_id, chunk_id)
+        ).fetchone()[0]
+        results.append({
+            'chunk': text,
+            'chunk_id': chunk_id,
+            'snippet': _snippet(text, terms),
+            'filename': candidates[chunk_id]['filename'],
+            'user_id': user_id,  # Whose collection it came from
+            'chunk_index': candidates[chunk_id]['chunk_index'],
+            'bm25_score': round(score, 4),
+            **{key: candidates[chunk_id][key] for key in ('char_start', 'char_end') if key in candidates[chunk_id]}
+        })
+    return results
+
+
+def keyword_search(query, user_id, top_k=5, selected_documents=None, filters=None):
+    """
+    BM25 search over the user's chunks. selected_documents and filters restrict results
+    the same way as search_similar_chunks, and, as there, logged-in users fall back to
+    'default_user' chunks when their own collection has no match.
+    Returns dicts with chunk, chunk_id, snippet, filename, chunk_index and bm25_score.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return []
+    selected = set(selected_documents) if selected_documents else None
+
+    user_id = str(user_id)
+    results = _search_user(user_id, terms, top_k, selected, filters)
+    if not results and user_id != 'default_user' and not selected_documents:
+        results = _search_user('default_user', terms, top_k, selected, filters)
+    return results
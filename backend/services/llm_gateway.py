@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from config import Config
+from services.openai_client import call_chat_completion, stream_chat_completion_chunks
+
+# Evict in batches so a full cache doesn't pay for a DELETE on every insert
+_EVICT_SLACK = 0.1
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'uncached': 0, 'evicted': 0, 'expired': 0}
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(Config.LLM_CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(Config.LLM_CACHE_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, model TEXT NOT NULL, content TEXT NOT NULL,
+                created_at REAL NOT NULL, last_used REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS responses_by_last_used ON responses (last_used);
+        ''')
+        _local.conn = conn
+    return conn
+
+
+def _count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def cache_key(model, messages, params):
+    """
+    Hash of everything that determines the completion: model, messages and sampling params.
+    """
+    payload = json.dumps({'model': model, 'messages': messages, 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _lookup(key, ttl):
+    try:
+        conn = _connect()
+        row = conn.execute('SELECT content, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        content, created_at = row
+        now = time.time()
+        with conn:
+            if now - created_at > ttl:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                _count('expired')
+                return None
+            conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+        return content
+    except Exception as e:
+        print(f"Error reading LLM cache: {str(e)}")
+        return None
+
+
+def _store(key, model, content):
+    try:
+        conn = _connect()
+        now = time.time()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)', (key, model, content, now, now))
+            count = conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            limit = Config.LLM_CACHE_MAX_ENTRIES
+            if count > limit:
+                # Least recently used first, down to a little under the limit
+                excess = count - int(limit * (1 - _EVICT_SLACK))
+                conn.execute(
+                    'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)',
+                    (excess,)
+                )
+                _count('evicted', excess)
+    except Exception as e:
+        print(f"Error writing LLM cache: {str(e)}")
+
+
+def _use_cache(cache):
+    return cache and Config.LLM_CACHE_ENABLED and Config.LLM_CACHE_MAX_ENTRIES > 0
+
+
+def chat_completion(messages, model="gpt-3.5-turbo", cache=True, ttl=None, call_type='default', **params):
+    """
+    Text of a chat completion. Identical (model, messages, params) requests are answered
+    from an on-disk cache for ttl seconds (default LLM_CACHE_TTL); pass cache=False for
+    calls that should produce a fresh completion every time. call_type selects the
+    request timeout and groups the call in the OpenAI client metrics.
+    """
+    use_cache = _use_cache(cache)
+    if use_cache:
+        key = cache_key(model, messages, params)
+        cached = _lookup(key, Config.LLM_CACHE_TTL if ttl is None else ttl)
+        if cached is not None:
+            _count('hits')
+            return cached
+        _count('misses')
+    else:
+        _count('uncached')
+
+    response = call_chat_completion(call_type, model=model, messages=messages, **params)
+    content = response.choices[0].message.content
+
+    if use_cache and content is not None:
+        _store(key, model, content)
+    return content
+
+
+def stream_chat_completion(messages, model="gpt-3.5-turbo", cache=True, ttl=None, call_type='stream', **params):
+    """
+    Streaming chat_completion: yields pieces of the completion text as they arrive.
+    A cached completion is yielded as a single piece; a fresh one is stored once the
+    stream finishes.
+    """
+    use_cache = _use_cache(cache)
+    if use_cache:
+        key = cache_key(model, messages, params)
+        cached = _lookup(key, Config.LLM_CACHE_TTL if ttl is None else ttl)
+        if cached is not None:
+            _count('hits')
+            yield cached
+            return
+        _count('misses')
+    else:
+        _count('uncached')
+
+    parts = []
+    for chunk in stream_chat_completion_chunks(call_type, model=model, messages=messages, **params):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    if use_cache:
+        _store(key, model, ''.join(parts))
+
+
+def get_llm_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    try:
+        stats['entries'] = _connect().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+    except Exception:
+        stats['entries'] = None
+    stats['max_entries'] = Config.LLM_CACHE_MAX_ENTRIES
+    return stats
+
+
+def clear_llm_cache():
+    conn = _connect()
+    with conn:
+        conn.execute('DELETE FROM responses')
@@ -0,0 +1,227 @@
+import time
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from config import Config
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class _FairLimiter:
+    """
+    Counting semaphore that grants slots in arrival order. A released slot is handed straight
+    to the longest waiter, so a thread that releases and immediately asks again can't barge
+    ahead of requests that are already queued (threading.Semaphore allows that).
+    """
+
+    def __init__(self, slots):
+        self.lock = threading.Lock()
+        self.available = slots
+        self.waiters = deque()
+
+    def acquire(self, timeout):
+        with self.lock:
+            if self.available and not self.waiters:
+                self.available -= 1
+                return True
+            granted = threading.Event()
+            self.waiters.append(granted)
+        if granted.wait(timeout):
+            return True
+        with self.lock:
+            if granted.is_set():  # Handed a slot just as the wait timed out
+                return True
+            self.waiters.remove(granted)
+            return False
+
+    def release(self):
+        with self.lock:
+            if self.waiters:
+                self.waiters.popleft().set()
+            else:
+                self.available += 1
+
+
+# Caps LLM requests in flight across all threads of the process
+_slots = _FairLimiter(Config.OPENAI_MAX_CONCURRENCY)
+
+_metrics_lock = threading.Lock()
+_metrics = {'in_flight': 0, 'peak_in_flight': 0, 'queued': 0, 'queue_seconds': 0.0, 'rejected': 0, 'call_types': {}}
+
+
+class OpenAIBusyError(Exception):
+    """
+    Raised when no request slot frees up within OPENAI_QUEUE_TIMEOUT seconds.
+    """
+    pass
+
+
+def get_openai_client():
+    """
+    Shared OpenAI client, created on first use so importing a service doesn't pull in the SDK.
+    One connection pool (kept alive between calls) serves every thread. The SDK's own retries
+    are off; call_chat_completion retries with jittered backoff instead.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import openai
+                # Pool limits in the HTTP library this SDK version is built on
+                limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+                    max_connections=Config.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.OPENAI_MAX_CONNECTIONS,
+                    keepalive_expiry=Config.OPENAI_KEEPALIVE_SECONDS
+                )
+                _client = openai.OpenAI(
+                    api_key=Config.OPENAI_API_KEY,
+                    base_url=Config.OPENAI_BASE_URL or None,
+                    max_retries=0,
+                    timeout=_timeout('default'),
+                    http_client=openai.DefaultHttpxClient(limits=limits)
+                )
+    return _client
+
+
+def _timeout(call_type):
+    import openai
+    read = Config.OPENAI_TIMEOUTS.get(call_type, Config.OPENAI_TIMEOUTS['default'])
+    return openai.Timeout(read, connect=Config.OPENAI_CONNECT_TIMEOUT)
+
+
+def _call_metrics(call_type):
+    # Caller holds _metrics_lock
+    return _metrics['call_types'].setdefault(call_type, {
+        'requests': 0, 'succeeded': 0, 'failed': 0, 'retries': 0, 'rate_limited': 0,
+        'server_errors': 0, 'timeouts': 0, 'total_seconds': 0.0
+    })
+
+
+def _record(call_type, **counts):
+    with _metrics_lock:
+        metrics = _call_metrics(call_type)
+        for name, value in counts.items():
+            metrics[name] += value
+
+
+@contextmanager
+def _request_slot(call_type):
+    """
+    Hold one of the OPENAI_MAX_CONCURRENCY request slots, waiting up to OPENAI_QUEUE_TIMEOUT.
+    """
+    started = time.perf_counter()
+    acquired = _slots.acquire(timeout=Config.OPENAI_QUEUE_TIMEOUT)
+    waited = time.perf_counter() - started
+    if not acquired:
+        with _metrics_lock:
+            _metrics['rejected'] += 1
+        raise OpenAIBusyError(f"No OpenAI request slot free after {Config.OPENAI_QUEUE_TIMEOUT}s ({call_type})")
+    with _metrics_lock:
+        if waited > 0.001:
+            _metrics['queued'] += 1
+            _metrics['queue_seconds'] += waited
+        _metrics['in_flight'] += 1
+        _metrics['peak_in_flight'] = max(_metrics['peak_in_flight'], _metrics['in_flight'])
+    try:
+        yield
+    finally:
+        with _metrics_lock:
+            _metrics['in_flight'] -= 1
+        _slots.release()
+
+
+def _retry_delay(error, attempt):
+    """
+    Full-jitter exponential backoff, stretched to the server's Retry-After if it sent one.
+    """
+    delay = random.uniform(0, min(Config.OPENAI_RETRY_MAX_DELAY, Config.OPENAI_RETRY_BASE_DELAY * 2 ** attempt))
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        delay = max(delay, min(float(retry_after), Config.OPENAI_RETRY_MAX_DELAY))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+def _create_with_retries(call_type, kwargs, slot_per_attempt=False):
+    """
+    client.chat.completions.create with retries. With slot_per_attempt, a request slot is
+    taken for each attempt and released before the backoff sleep, so callers waiting out a
+    429 burst don't hold slots others could use; otherwise the caller holds one throughout.
+    """
+    import openai
+    attempt = 0
+    while True:
+        try:
+            with _request_slot(call_type) if slot_per_attempt else nullcontext():
+                _record(call_type, requests=1)
+                return get_openai_client().chat.completions.create(timeout=_timeout(call_type), **kwargs)
+        except OpenAIBusyError:
+            # Counted as rejected by _request_slot; nothing was sent
+            raise
+        except openai.APITimeoutError:
+            # Not retried: a second full timeout would hold the worker twice as long
+            _record(call_type, failed=1, timeouts=1)
+            raise
+        except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+            if isinstance(e, openai.RateLimitError):
+                _record(call_type, rate_limited=1)
+            elif isinstance(e, openai.InternalServerError):
+                _record(call_type, server_errors=1)
+            if attempt >= Config.OPENAI_MAX_RETRIES:
+                _record(call_type, failed=1)
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"OpenAI {call_type} call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            _record(call_type, retries=1)
+            time.sleep(delay)
+            attempt += 1
+        except Exception:
+            _record(call_type, failed=1)
+            raise
+
+
+def call_chat_completion(call_type='default', **kwargs):
+    """
+    client.chat.completions.create under the shared concurrency limit, with the read timeout
+    configured for call_type and retries on 429, 5xx and connection errors.
+    """
+    started = time.perf_counter()
+    response = _create_with_retries(call_type, kwargs, slot_per_attempt=True)
+    _record(call_type, succeeded=1, total_seconds=time.perf_counter() - started)
+    return response
+
+
+def stream_chat_completion_chunks(call_type='stream', **kwargs):
+    """
+    Streaming call_chat_completion: yields completion chunks, holding the request slot until
+    the stream is exhausted or closed. Only opening the stream is retried.
+    """
+    started = time.perf_counter()
+    with _request_slot(call_type):
+        stream = _create_with_retries(call_type, {**kwargs, 'stream': True})
+        try:
+            for chunk in stream:
+                yield chunk
+        except Exception:
+            _record(call_type, failed=1)
+            raise
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+    _record(call_type, succeeded=1, total_seconds=time.perf_counter() - started)
+
+
+def get_openai_metrics():
+    with _metrics_lock:
+        call_types = {name: dict(metrics) for name, metrics in _metrics['call_types'].items()}
+        metrics = {key: value for key, value in _metrics.items() if key != 'call_types'}
+    for stats in call_types.values():
+        stats['avg_seconds'] = round(stats['total_seconds'] / stats['succeeded'], 3) if stats['succeeded'] else 0.0
+        stats['total_seconds'] = round(stats['total_seconds'], 3)
+    metrics['queue_seconds'] = round(metrics['queue_seconds'], 3)
+    return {**metrics, 'max_concurrency': Config.OPENAI_MAX_CONCURRENCY, 'call_types': call_types}
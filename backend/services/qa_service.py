@@ -1,45 +1,16 @@
-import openai
 import os
 import json
-from .embedding_service import search_similar_chunks, get_all_chunks, get_similarity_groups
+from .embedding_service import search_similar_chunks, get_all_chunks, get_document_chunks, get_similarity_groups, embed_query
+from .llm_gateway import chat_completion, stream_chat_completion
+from .context_builder import build_context, fit_history, count_tokens, MESSAGE_OVERHEAD_TOKENS
+from .answer_cache import context_key, lookup_answer, store_answer
+from .summary_service import summarize_document, document_fingerprint
+from .question_bank import sample_quiz
 from config import Config
 
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
+NO_ANSWER = 'No relevant information found in uploaded documents.'
 
-def ask_question(query, user_id, selected_documents=None, chat_history=None):
-    if chat_history is None:
-        chat_history = []
-
-    # Increase top_k to ensure we get more relevant chunks, especially for specific queries
-    similar_chunks = search_similar_chunks(query, user_id, top_k=10, selected_documents=selected_documents)
-
-    # If no chunks found for user and user_id is not default_user, try searching in default_user collection
-    if not similar_chunks and user_id != 'default_user' and not selected_documents:
-        similar_chunks = search_similar_chunks(query, 'default_user', top_k=5, selected_documents=selected_documents)
-
-    if not similar_chunks:
-        return {'answer': 'No relevant information found in uploaded documents.', 'sources': []}
-
-    context = '\n\n'.join([chunk['chunk'] for chunk in similar_chunks])
-
-    # Build messages array with chat history for context
-    messages = []
-
-    # Add recent chat history (limit to last 5 messages to save tokens)
-    recent_history = chat_history[-5:] if len(chat_history) > 5 else chat_history
-    for msg in recent_history:
-        # Map 'ai' role to 'assistant' for OpenAI API compatibility
-        role = msg.get('role', 'user')
-        if role == 'ai':
-            role = 'assistant'
-        messages.append({
-            "role": role,
-            "content": msg.get('content', '')
-        })
-
-    # Enhanced tutor-like prompt with diagram support
-    current_prompt = f"""You are an expert tutor explaining concepts from the provided documents. Answer the student's question in a clear, educational manner.
+TUTOR_PROMPT = """You are an expert tutor explaining concepts from the provided documents. Answer the student's question in a clear, educational manner.
 
 MANDATORY DIAGRAM REQUIREMENT:
 - You MUST generate exactly ONE Mermaid diagram for EVERY response
@@ -79,17 +50,101 @@ Context from documents:
 {context}
 
 Answer with explanation + Mermaid diagram + continued explanation:"""
-    messages.append({"role": "user", "content": current_prompt})
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",  # Use reliable model
-        messages=messages,
-        max_tokens=800,  # Increased for diagrams
-        temperature=0.3  # More consistent responses
+def prepare_question(query, user_id, selected_documents=None, chat_history=None, mode='dense'):
+    """
+    Retrieve context for a question and build the chat messages for it, within
+    QA_INPUT_TOKEN_BUDGET. Returns {messages, sources, token_usage, answer_key}, or None
+    if no relevant chunks were found. answer_key identifies the context and history the
+    answer will depend on, for the semantic answer cache.
+    """
+    if chat_history is None:
+        chat_history = []
+
+    # Dense-only retrieval misses exact terms, so it takes top_k=10 to be safe; hybrid
+    # retrieval ranks those terms directly and needs fewer chunks in the prompt
+    top_k = Config.HYBRID_QA_TOP_K if mode == 'hybrid' else 10
+    similar_chunks = search_similar_chunks(query, user_id, top_k=top_k, selected_documents=selected_documents, mode=mode)
+
+    # If no chunks found for user and user_id is not default_user, try searching in default_user collection
+    if not similar_chunks and user_id != 'default_user' and not selected_documents:
+        similar_chunks = search_similar_chunks(query, 'default_user', top_k=5, selected_documents=selected_documents, mode=mode)
+
+    if not similar_chunks:
+        return None
+
+    # Build messages array with chat history for context
+    history = []
+
+    # Add recent chat history (limit to last 5 messages to save tokens)
+    recent_history = chat_history[-5:] if len(chat_history) > 5 else chat_history
+    for msg in recent_history:
+        # Map 'ai' role to 'assistant' for OpenAI API compatibility
+        role = msg.get('role', 'user')
+        if role == 'ai':
+            role = 'assistant'
+        history.append({
+            "role": role,
+            "content": msg.get('content', '')
+        })
+
+    # Fit the request into QA_INPUT_TOKEN_BUDGET: the tutor prompt is fixed, history gets
+    # up to QA_HISTORY_BUDGET_SHARE of what's left, and retrieved chunks fill the rest
+    budget = Config.QA_INPUT_TOKEN_BUDGET
+    prompt_tokens = count_tokens(TUTOR_PROMPT.format(query=query, context='')) + MESSAGE_OVERHEAD_TOKENS
+    messages, history_tokens = fit_history(history, int(max(0, budget - prompt_tokens) * Config.QA_HISTORY_BUDGET_SHARE))
+    built = build_context(similar_chunks, max(0, budget - prompt_tokens - history_tokens))
+    context = built['context']
+
+    answer_key = context_key(
+        [chunk.get('chunk_id') or f"{chunk['filename']}:{chunk['chunk_index']}" for chunk in built['chunks']], messages
     )
 
-    answer = response.choices[0].message.content.strip()
+    # Enhanced tutor-like prompt with diagram support
+    current_prompt = TUTOR_PROMPT.format(query=query, context=context)
+    messages.append({"role": "user", "content": current_prompt})
 
+    sources = [{'filename': chunk['filename'], 'chunk_index': chunk['chunk_index']} for chunk in built['chunks']]
+    token_usage = {
+        'budget': budget,
+        'prompt': prompt_tokens,
+        'history': history_tokens,
+        'context': built['tokens'],
+        'total': prompt_tokens + history_tokens + built['tokens'],
+        'chunks_retrieved': len(similar_chunks),
+        'chunks_used': len(built['chunks']),
+        'dropped_duplicates': built['dropped_duplicates'],
+        'dropped_for_budget': built['dropped_for_budget'],
+        'trimmed_overlap_chars': built['trimmed_overlap_chars']
+    }
+
+    # Whose documents the answer draws on, so only re-indexing those invalidates its cache entry
+    answer_sources = sorted({(chunk.get('user_id', str(user_id)), chunk['filename']) for chunk in built['chunks']})
+
+    return {
+        'messages': messages, 'sources': sources, 'token_usage': token_usage,
+        'answer_key': answer_key, 'answer_sources': answer_sources
+    }
+
+def _cached_answer(query, prepared):
+    """
+    A cached answer to a paraphrase of this question asked with the same context, or None.
+    """
+    cached = lookup_answer(prepared['answer_key'], embed_query(query))
+    if cached:
+        # Entries are shared across users, so the matched question is only logged, never returned
+        print(f"Answer cache hit for '{query[:50]}' (matched '{cached['query'][:50]}', distance {cached['distance']})")
+    return cached
+
+def _cache_answer(query, prepared, answer):
+    tokens = prepared['token_usage']['total'] + count_tokens(answer)
+    store_answer(prepared['answer_key'], embed_query(query), query, answer, prepared['answer_sources'], tokens)
+
+def ensure_diagram(answer):
+    """
+    Apply the Mermaid fallback to a finished answer: substitute the built-in diagrams for
+    placeholder sentences, or append them if the answer has no diagram at all.
+    """
     # Ensure diagram is included - add fallback if missing or malformed
     if '```mermaid' not in answer or '```mermaid\n\n```' in answer or answer.count('```mermaid') < 2:
         # Create specific diagrams for DFS and DDBS
@@ -167,9 +222,118 @@ graph TD
         if '```mermaid' not in answer:
             answer = f"{answer}\n\nHere are visual representations of the key concepts:\n\n**Distributed File System:**\n{dfs_diagram}\n\n**Distributed Database System:**\n{ddbs_diagram}"
 
-    sources = [{'filename': chunk['filename'], 'chunk_index': chunk['chunk_index']} for chunk in similar_chunks]
+    return answer
 
-    return {'answer': answer, 'sources': sources}
+def ask_question(query, user_id, selected_documents=None, chat_history=None, mode='dense'):
+    prepared = prepare_question(query, user_id, selected_documents, chat_history, mode)
+    if prepared is None:
+        return {'answer': NO_ANSWER, 'sources': []}
+
+    cached = _cached_answer(query, prepared)
+    if cached:
+        return {
+            'answer': cached['answer'], 'sources': prepared['sources'], 'token_usage': prepared['token_usage'],
+            'cached': {'distance': cached['distance']}
+        }
+
+    content = chat_completion(
+        model="gpt-3.5-turbo",  # Use reliable model
+        messages=prepared['messages'],
+        max_tokens=800,  # Increased for diagrams
+        temperature=0.3,  # More consistent responses
+        call_type='qa'
+    )
+
+    answer = ensure_diagram(content.strip())
+    _cache_answer(query, prepared, answer)
+
+    return {'answer': answer, 'sources': prepared['sources'], 'token_usage': prepared['token_usage']}
+
+def stream_question(query, user_id, selected_documents=None, chat_history=None, mode='dense'):
+    """
+    Streaming variant of ask_question. Yields (event, data) pairs: 'sources' as soon as
+    retrieval is done, 'token' for each piece of the answer as the model produces it, then
+    'answer' with the complete answer after the Mermaid fallback, plus sources and token_usage.
+    """
+    prepared = prepare_question(query, user_id, selected_documents, chat_history, mode)
+    if prepared is None:
+        yield 'sources', {'sources': []}
+        yield 'answer', {'answer': NO_ANSWER, 'sources': []}
+        return
+
+    yield 'sources', {'sources': prepared['sources'], 'token_usage': prepared['token_usage']}
+
+    cached = _cached_answer(query, prepared)
+    if cached:
+        yield 'answer', {
+            'answer': cached['answer'], 'sources': prepared['sources'], 'token_usage': prepared['token_usage'],
+            'cached': {'distance': cached['distance']}
+        }
+        return
+
+    parts = []
+    for delta in stream_chat_completion(
+        model="gpt-3.5-turbo",
+        messages=prepared['messages'],
+        max_tokens=800,
+        temperature=0.3,
+        call_type='stream'
+    ):
+        parts.append(delta)
+        yield 'token', {'text': delta}
+
+    # The diagram fallback needs the whole answer, so it arrives as the final event
+    answer = ensure_diagram(''.join(parts).strip())
+    _cache_answer(query, prepared, answer)
+    yield 'answer', {'answer': answer, 'sources': prepared['sources'], 'token_usage': prepared['token_usage']}
+
+def summarize_chunks(chunks, filename):
+    """
+    Short (2-3 sentence) summary of a document from its chunk texts, sampling the first,
+    middle and last chunks. Raises if no summary could be generated.
+    """
+    from config import Config
+    if not Config.OPENAI_API_KEY:
+        raise ValueError("OpenAI API key missing")
+
+    # Smart sampling: Use first, middle, and last chunks for representative summary
+    total_chunks = len(chunks)
+    if total_chunks <= 3:
+        selected_chunks = chunks
+    else:
+        selected_chunks = [
+            chunks[0],  # Beginning
+            chunks[total_chunks // 2],  # Middle
+            chunks[-1]  # End
+        ]
+
+    combined_text = '\n\n'.join(selected_chunks)
+
+    # Aggressive text limiting for upload-time summaries
+    if len(combined_text) > 1500:  # Even more aggressive for upload speed
+        # Truncate at the last space to avoid cutting words
+        truncated = combined_text[:1500]
+        last_space = truncated.rfind(' ')
+        if last_space > 0:
+            combined_text = truncated[:last_space] + "..."
+        else:
+            combined_text = truncated + "..."
+
+    # Concise prompt for minimal token usage
+    prompt = f"Summarize this document in 2-3 sentences:\n\n{combined_text}"
+
+    print(f"DEBUG: Generating summary for {filename} with {len(prompt)} characters")
+
+    summary = chat_completion(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=150,  # Increased for better summaries
+        temperature=0.3,  # Consistent summaries
+        call_type='summary'
+    ).strip()
+
+    print(f"DEBUG: Successfully generated summary for {filename}: {summary[:50]}...")
+    return summary
 
 def generate_single_summary(chunks, filename):
     """
@@ -177,112 +341,33 @@ def generate_single_summary(chunks, filename):
     Optimized for minimal AI token usage and fast processing.
     """
     try:
-        # Check if OpenAI API key is available
-        from config import Config
-        if not Config.OPENAI_API_KEY:
-            print(f"DEBUG: OpenAI API key not found for summary generation of {filename}")
-            return f"Document '{filename}' uploaded successfully. AI summary temporarily unavailable (API key missing)."
-
-        # Smart sampling: Use first, middle, and last chunks for representative summary
-        total_chunks = len(chunks)
-        if total_chunks <= 3:
-            selected_chunks = chunks
-        else:
-            selected_chunks = [
-                chunks[0],  # Beginning
-                chunks[total_chunks // 2],  # Middle
-                chunks[-1]  # End
-            ]
-
-        combined_text = '\n\n'.join(selected_chunks)
-
-        # Aggressive text limiting for upload-time summaries
-        if len(combined_text) > 1500:  # Even more aggressive for upload speed
-            # Truncate at the last space to avoid cutting words
-            truncated = combined_text[:1500]
-            last_space = truncated.rfind(' ')
-            if last_space > 0:
-                combined_text = truncated[:last_space] + "..."
-            else:
-                combined_text = truncated + "..."
-
-        # Concise prompt for minimal token usage
-        prompt = f"Summarize this document in 2-3 sentences:\n\n{combined_text}"
-
-        print(f"DEBUG: Generating summary for {filename} with {len(prompt)} characters")
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=150,  # Increased for better summaries
-            temperature=0.3  # Consistent summaries
-        )
-
-        summary = response.choices[0].message.content.strip()
-        print(f"DEBUG: Successfully generated summary for {filename}: {summary[:50]}...")
-        return summary
-
+        return summarize_chunks(chunks, filename)
+    except ValueError:
+        print(f"DEBUG: OpenAI API key not found for summary generation of {filename}")
+        return f"Document '{filename}' uploaded successfully. AI summary temporarily unavailable (API key missing)."
     except Exception as e:
         print(f"DEBUG: Error generating summary for {filename}: {str(e)}")
         return f"Document '{filename}' uploaded successfully. AI summary temporarily unavailable."
 
-def get_detailed_summaries(user_id, filename):
+def get_detailed_summaries(user_id, filename, chunks=None):
     """
     Generate a detailed summary for a specific document when requested.
-    Retrieves chunks internally and provides comprehensive overview.
+    Reads only that document's chunks and summarizes all of them section by section
+    (see summary_service.summarize_document).
     """
     try:
         from config import Config
         if not Config.OPENAI_API_KEY:
             return "Detailed summary unavailable - API key missing."
 
-        # Get all chunks for the user
-        all_chunks = get_all_chunks(user_id)
-
-        # Filter chunks for the specific filename
-        chunks = [chunk for chunk in all_chunks if chunk['filename'] == filename]
-
+        if chunks is None:
+            chunks = get_document_chunks(filename, user_id)
         if not chunks:
             return f"No chunks found for document '{filename}'."
 
-        # Use more chunks for detailed summary
-        total_chunks = len(chunks)
-        if total_chunks <= 5:
-            selected_chunks = chunks
-        elif total_chunks <= 10:
-            selected_chunks = chunks[::2]  # Every other chunk
-        else:
-            # Sample more chunks for detailed summary
-            step = max(1, total_chunks // 15)
-            selected_chunks = chunks[::step][:15]
-
-        combined_text = '\n\n'.join([chunk['chunk'] for chunk in selected_chunks])
-
-        # Allow more text for detailed summary
-        if len(combined_text) > 4000:
-            combined_text = combined_text[:4000] + "..."
-
-        prompt = f"""Provide a comprehensive and detailed summary of this document. Include:
-1. Main topic and purpose
-2. Key concepts and ideas
-3. Important details and examples
-4. Structure and organization
-5. Any conclusions or recommendations
-
-Document content:
-{combined_text}
-
-Provide a detailed summary in 4-6 paragraphs:"""
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=800,
-            temperature=0.3
-        )
-
-        detailed_summary = response.choices[0].message.content.strip()
-        return detailed_summary
+        result = summarize_document(filename, chunks)
+        print(f"DEBUG: Detailed summary for {filename}: {result['sections']} sections, {result['sections_reused']} reused")
+        return result['summary']
 
     except Exception as e:
         print(f"Error generating detailed summary for {filename}: {str(e)}")
@@ -291,6 +376,7 @@ Provide a detailed summary in 4-6 paragraphs:"""
 def get_detailed_summaries_cached(user_id, filename):
     """
     Get detailed summary with caching to reduce loading time.
+    A cached summary is reused while the document's chunks are unchanged.
     """
     try:
         import os
@@ -306,17 +392,23 @@ def get_detailed_summaries_cached(user_id, filename):
             detailed_summaries = json.load(f)
 
         key = f"{user_id}_{filename}"
-        if key in detailed_summaries:
-            return detailed_summaries[key]
+        chunks = get_document_chunks(filename, user_id)
+        if not chunks:
+            return f"No chunks found for document '{filename}'."
+
+        fingerprint = document_fingerprint(chunks)
+        cached = detailed_summaries.get(key)
+        if isinstance(cached, dict) and cached.get('fingerprint') == fingerprint:
+            return cached['summary']
 
-        # Generate and cache
-        detailed_summary = get_detailed_summaries(user_id, filename)
-        detailed_summaries[key] = detailed_summary
+        # Generate and cache; entries from before fingerprints were kept are regenerated once
+        result = summarize_document(filename, chunks)
+        detailed_summaries[key] = {'summary': result['summary'], 'fingerprint': fingerprint}
 
         with open(Config.DETAILED_SUMMARIES_FILE, 'w') as f:
             json.dump(detailed_summaries, f, indent=2)
 
-        return detailed_summary
+        return result['summary']
 
     except Exception as e:
         print(f"Error in cached detailed summary for {filename}: {str(e)}")
@@ -336,7 +428,8 @@ def get_summaries(user_id):
 
         result = []
         for filename, data in summaries.items():
-            if data.get('user_id') == user_id:
+            # Entries still pending (or failed) on their first summary have none to show
+            if data.get('user_id') == user_id and data.get('summary') is not None:
                 result.append({
                     'filename': filename,
                     'summary': data['summary']
@@ -442,8 +535,23 @@ def generate_quiz(user_id, selected_documents=None, num_questions=5, topic="Gene
     Generate a practice quiz with multiple choice questions from uploaded documents.
     Enhanced for topic-based generation with more elaborate questions.
     Checks for existing quizzes first to avoid wasting tokens.
+    Quizzes are assembled from the documents' pre-generated question banks when they
+    hold enough questions, so only an unbanked selection waits on the LLM.
     """
     try:
+        banked = sample_quiz(user_id, selected_documents, num_questions)
+        if banked:
+            saved_quiz_id = save_quiz(user_id, topic, selected_documents or ['all'], banked)
+            return {
+                'quiz': banked,
+                'total_questions': len(banked),
+                'documents_used': selected_documents or ['all'],
+                'cached': False,
+                'from_bank': True,
+                'quiz_id': saved_quiz_id,
+                'topic': topic
+            }
+
         # Check if a quiz already exists for this topic and documents
         if selected_documents:
             quiz_id = f"{user_id}_{topic}_{'_'.join(sorted(selected_documents))}"
@@ -506,14 +614,14 @@ Format your response as a JSON array of objects with this structure:
 
 Ensure questions are challenging and educational, focusing on {topic} concepts."""
 
-        response = client.chat.completions.create(
+        quiz_content = chat_completion(
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": prompt}],
             max_tokens=2000,  # Increased for more detailed questions
-            temperature=0.7
-        )
-
-        quiz_content = response.choices[0].message.content.strip()
+            temperature=0.7,
+            cache=False,  # A new quiz each time
+            call_type='quiz'
+        ).strip()
 
         # Try to parse the JSON response
         try:
@@ -646,14 +754,13 @@ Return a JSON object with the following structure:
 
 Focus on the most important concepts and relationships. Limit to 10-15 nodes maximum."""
 
-        response = client.chat.completions.create(
+        graph_content = chat_completion(
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": prompt}],
             max_tokens=1500,
-            temperature=0.3
-        )
-
-        graph_content = response.choices[0].message.content.strip()
+            temperature=0.3,
+            call_type='knowledge_graph'
+        ).strip()
 
         # Try to parse the JSON response
         try:
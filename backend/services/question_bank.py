@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from services.context_builder import join_chunks
+from services.summary_store import summary_source_hash
+from services.llm_gateway import chat_completion
+
+QUESTION_PROMPT = """Based on the following excerpt from the document "{filename}", generate {count} high-quality multiple choice questions for a practice quiz, mixing easy, medium and hard questions. Each question should:
+
+1. Test understanding of a key concept from the excerpt
+2. Include scenario-based or application questions where appropriate
+3. Have 4 options (A, B, C, D) with one clearly correct answer
+4. Provide a detailed explanation that teaches the concept
+{avoid}
+Excerpt:
+{content}
+
+Format your response as a JSON array of objects with this structure:
+[
+  {{
+    "question": "Question that tests understanding of the excerpt?",
+    "options": ["A) Option 1", "B) Option 2", "C) Option 3", "D) Option 4"],
+    "correct_answer": "A",
+    "explanation": "Why this is correct and why the other options are wrong",
+    "difficulty": "easy|medium|hard",
+    "topic_area": "specific subtopic the question covers"
+  }}
+]"""
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'quizzes_sampled': 0, 'quizzes_short': 0, 'fills': 0, 'top_ups': 0, 'copied_banks': 0, 'questions_generated': 0}
+
+# Background fills and top-ups, and the documents they are running for
+_executor = ThreadPoolExecutor(max_workers=Config.QUESTION_BANK_WORKERS, thread_name_prefix='question-bank')
+_scheduled = set()
+_scheduled_lock = threading.Lock()
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(Config.QUESTION_BANK_PATH), exist_ok=True)
+        conn = sqlite3.connect(Config.QUESTION_BANK_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS banks (
+                user_id TEXT NOT NULL, filename TEXT NOT NULL, source_hash TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (user_id, filename)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, filename TEXT NOT NULL,
+                range_start INTEGER NOT NULL, range_end INTEGER NOT NULL, difficulty TEXT NOT NULL,
+                topic_area TEXT NOT NULL, data TEXT NOT NULL, served INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS questions_by_document ON questions (user_id, filename, served);
+        ''')
+        _local.conn = conn
+    return conn
+
+
+def _count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def _ranges(chunk_count):
+    # Consecutive chunk index ranges [start, end) that each get their own questions
+    size = max(1, Config.QUESTION_BANK_RANGE_CHUNKS)
+    return [(start, min(start + size, chunk_count)) for start in range(0, chunk_count, size)]
+
+
+def _choose_ranges(range_counts, needed):
+    """
+    The needed ranges with the fewest questions so far, spread evenly over the document
+    among equally covered ones.
+    """
+    chosen = []
+    remaining = sorted(range_counts)
+    while remaining and len(chosen) < needed:
+        lowest = min(range_counts[r] for r in remaining)
+        group = [r for r in remaining if range_counts[r] == lowest]
+        take = min(needed - len(chosen), len(group))
+        step = len(group) / take
+        picks = [group[int(i * step)] for i in range(take)]
+        chosen.extend(picks)
+        remaining = [r for r in remaining if r not in picks]
+    return chosen
+
+
+def parse_questions(content, default_topic_area):
+    """
+    Multiple choice questions from a model response (a JSON array, possibly in a code
+    fence). Malformed questions are dropped; difficulty and topic_area get defaults.
+    """
+    content = content.strip()
+    if content.startswith('```json'):
+        content = content[7:]
+    elif content.startswith('```'):
+        content = content[3:]
+    if content.endswith('```'):
+        content = content[:-3]
+
+    questions = []
+    for question in json.loads(content.strip()):
+        if not isinstance(question, dict) or not question.get('question'):
+            continue
+        options = question.get('options')
+        if not isinstance(options, list) or len(options) != 4 or str(question.get('correct_answer', ''))[:1] not in 'ABCD':
+            continue
+        question['correct_answer'] = str(question['correct_answer'])[:1]
+        if question.get('difficulty') not in DIFFICULTIES:
+            question['difficulty'] = 'medium'
+        if not question.get('topic_area'):
+            question['topic_area'] = default_topic_area
+        questions.append(question)
+    return questions
+
+
+def _generate_range(filename, chunks, range_start, range_end, existing):
+    """
+    Questions for chunks[range_start:range_end]; existing question texts from the same
+    range are listed so a top-up asks for different ones.
+    """
+    avoid = ''
+    if existing:
+        listed = '\n'.join(f"- {question}" for question in existing[:10])
+        avoid = f"\nDo not repeat or rephrase these questions, which already exist:\n{listed}\n"
+    prompt = QUESTION_PROMPT.format(
+        filename=filename,
+        count=Config.QUESTION_BANK_QUESTIONS_PER_RANGE,
+        avoid=avoid,
+        content=join_chunks(chunks[range_start:range_end])
+    )
+    content = chat_completion(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=300 * Config.QUESTION_BANK_QUESTIONS_PER_RANGE,
+        temperature=0.7,
+        cache=False,  # A top-up for the same range should produce new questions
+        call_type='question_bank'
+    )
+    return parse_questions(content, os.path.splitext(filename)[0])
+
+
+def _add_questions(user_id, filename, chunks, count):
+    """
+    Generate questions for up to count ranges of the document, least covered first,
+    in parallel. Returns the number of questions stored.
+    """
+    conn = _connect()
+    range_counts = {r: 0 for r in _ranges(len(chunks))}
+    existing = {}
+    for range_start, range_end, data in conn.execute(
+        'SELECT range_start, range_end, data FROM questions WHERE user_id = ? AND filename = ?', (user_id, filename)
+    ):
+        if (range_start, range_end) in range_counts:
+            range_counts[(range_start, range_end)] += 1
+            existing.setdefault((range_start, range_end), []).append(json.loads(data)['question'])
+
+    ranges = _choose_ranges(range_counts, count)
+    if not ranges:
+        return 0
+
+    def generate(selected_range):
+        try:
+            return _generate_range(filename, chunks, *selected_range, existing.get(selected_range, []))
+        except Exception as e:
+            print(f"Error generating questions for {filename} chunks {selected_range[0]}-{selected_range[1]}: {str(e)}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=min(len(ranges), Config.QUESTION_BANK_RANGE_WORKERS)) as executor:
+        generated = list(executor.map(generate, ranges))
+
+    now = time.time()
+    rows = [
+        (user_id, filename, range_start, range_end, question['difficulty'], question['topic_area'], json.dumps(question), now)
+        for (range_start, range_end), questions in zip(ranges, generated)
+        for question in questions
+    ]
+    with conn:
+        conn.executemany(
+            'INSERT INTO questions (user_id, filename, range_start, range_end, difficulty, topic_area, data, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+        )
+    _count('questions_generated', len(rows))
+    return len(rows)
+
+
+def _copy_bank(user_id, filename, source_hash):
+    # Questions already generated for identical content under another document
+    conn = _connect()
+    source = conn.execute(
+        'SELECT b.user_id, b.filename FROM banks b WHERE b.source_hash = ? AND NOT (b.user_id = ? AND b.filename = ?) '
+        'AND EXISTS (SELECT 1 FROM questions q WHERE q.user_id = b.user_id AND q.filename = b.filename) LIMIT 1',
+        (source_hash, user_id, filename)
+    ).fetchone()
+    if source is None:
+        return False
+    with conn:
+        conn.execute(
+            'INSERT INTO questions (user_id, filename, range_start, range_end, difficulty, topic_area, data, created_at) '
+            'SELECT ?, ?, range_start, range_end, difficulty, topic_area, data, ? FROM questions '
+            'WHERE user_id = ? AND filename = ?',
+            (user_id, filename, time.time(), source[0], source[1])
+        )
+    _count('copied_banks')
+    return True
+
+
+def fill_document_bank(filename, user_id, chunks):
+    """
+    Bring a document's question bank up to QUESTION_BANK_TARGET questions. chunks are its
+    chunk dicts in chunk order. When the content changed since the bank was built its
+    questions are replaced; a copy of identical content reuses that copy's questions.
+    """
+    from services.embedding_service import get_document_chunks  # Avoid a circular import at load time
+
+    user_id = str(user_id)
+    if chunks is None:
+        chunks = get_document_chunks(filename, user_id)
+    if not chunks:
+        return 0
+
+    conn = _connect()
+    source_hash = summary_source_hash([chunk['chunk'] for chunk in chunks])
+    bank = conn.execute('SELECT source_hash FROM banks WHERE user_id = ? AND filename = ?', (user_id, filename)).fetchone()
+    with conn:
+        if bank is None or bank[0] != source_hash:
+            conn.execute('DELETE FROM questions WHERE user_id = ? AND filename = ?', (user_id, filename))
+        conn.execute(
+            'INSERT OR REPLACE INTO banks VALUES (?, ?, ?, ?, ?)', (user_id, filename, source_hash, len(chunks), time.time())
+        )
+
+    have = conn.execute('SELECT COUNT(*) FROM questions WHERE user_id = ? AND filename = ?', (user_id, filename)).fetchone()[0]
+    if have == 0 and _copy_bank(user_id, filename, source_hash):
+        return 0
+
+    missing = Config.QUESTION_BANK_TARGET - have
+    if missing <= 0:
+        return 0
+    _count('fills')
+    per_range = max(1, Config.QUESTION_BANK_QUESTIONS_PER_RANGE)
+    return _add_questions(user_id, filename, chunks, -(-missing // per_range))
+
+
+def top_up_document_bank(filename, user_id):
+    """
+    Add QUESTION_BANK_TOP_UP_RANGES ranges' worth of new questions to a document whose
+    unserved questions ran low, up to QUESTION_BANK_MAX_QUESTIONS.
+    """
+    from services.embedding_service import get_document_chunks
+
+    user_id = str(user_id)
+    conn = _connect()
+    have = conn.execute('SELECT COUNT(*) FROM questions WHERE user_id = ? AND filename = ?', (user_id, filename)).fetchone()[0]
+    room = (Config.QUESTION_BANK_MAX_QUESTIONS - have) // max(1, Config.QUESTION_BANK_QUESTIONS_PER_RANGE)
+    if room <= 0:
+        return 0
+    chunks = get_document_chunks(filename, user_id)
+    if not chunks:
+        return 0
+    _count('top_ups')
+    return _add_questions(user_id, filename, chunks, min(room, Config.QUESTION_BANK_TOP_UP_RANGES))
+
+
+def _schedule(kind, filename, user_id, *args):
+    key = (str(user_id), filename)
+    with _scheduled_lock:
+        if key in _scheduled:
+            return False
+        _scheduled.add(key)
+
+    def run():
+        try:
+            if kind == 'fill':
+                fill_document_bank(filename, user_id, *args)
+            else:
+                top_up_document_bank(filename, user_id)
+        except Exception as e:
+            print(f"Error building question bank for {filename}: {str(e)}")
+        finally:
+            with _scheduled_lock:
+                _scheduled.discard(key)
+
+    _executor.submit(run)
+    return True
+
+
+def schedule_bank_fill(filename, user_id, chunks=None):
+    """
+    Build or refresh a document's question bank in the background (see fill_document_bank).
+    Returns False if the bank is disabled or work for the document is already queued.
+    """
+    if not Config.QUESTION_BANK_ENABLED:
+        return False
+    return _schedule('fill', filename, user_id, chunks)
+
+
+def _bank_documents(conn, user_id, filenames):
+    """
+    (owner, filename) of the banks of the given documents: the user's own, with
+    'default_user' banks filling in as in get_all_chunks.
+    """
+    owners = [str(user_id)] + (['default_user'] if str(user_id) != 'default_user' else [])
+    banks = {}
+    for owner in owners:
+        for (filename,) in conn.execute('SELECT filename FROM banks WHERE user_id = ?', (owner,)):
+            if filename in filenames and filename not in banks:
+                banks[filename] = owner
+    return [(owner, filename) for filename, owner in sorted(banks.items())]
+
+
+def sample_quiz(user_id, filenames, num_questions):
+    """
+    Assemble a quiz of num_questions from the question banks of the selected documents
+    (all of the user's documents if none are selected), taking the least served questions
+    round-robin across documents. Documents whose unserved questions drop below
+    QUESTION_BANK_MIN_FRESH are topped up in the background.
+    Returns the questions, or None if any of the documents has no questions yet (a fill
+    is scheduled for it) or the banks can't supply num_questions, so the caller
+    generates the quiz from all of them instead.
+    """
+    if not Config.QUESTION_BANK_ENABLED:
+        return None
+    try:
+        num_questions = int(num_questions)
+        filenames = set(filenames or [])
+        if not filenames:
+            from services.embedding_service import get_documents  # Avoid a circular import at load time
+            filenames = {document['filename'] for document in get_documents(user_id)}
+        if not filenames:
+            return None
+
+        conn = _connect()
+        documents = _bank_documents(conn, user_id, filenames)
+        candidates = []
+        banked = set()
+        for owner, filename in documents:
+            rows = conn.execute(
+                'SELECT id, data FROM questions WHERE user_id = ? AND filename = ? ORDER BY served, RANDOM() LIMIT ?',
+                (owner, filename, num_questions)
+            ).fetchall()
+            if rows:
+                candidates.append(rows)
+                banked.add(filename)
+
+        # A quiz over only some of the documents would misreport what it covers
+        unbanked = filenames - banked
+        if unbanked:
+            for filename in unbanked:
+                schedule_bank_fill(filename, user_id)
+            _count('quizzes_short')
+            return None
+
+        picked = []
+        while len(picked) < num_questions and any(candidates):
+            for rows in candidates:
+                if rows and len(picked) < num_questions:
+                    picked.append(rows.pop(0))
+
+        if len(picked) < num_questions:
+            _count('quizzes_short')
+            return None
+
+        with conn:
+            conn.executemany('UPDATE questions SET served = served + 1 WHERE id = ?', [(question_id,) for question_id, _ in picked])
+        _count('quizzes_sampled')
+
+        for owner, filename in documents:
+            fresh = conn.execute(
+                'SELECT COUNT(*) FROM questions WHERE user_id = ? AND filename = ? AND served = 0', (owner, filename)
+            ).fetchone()[0]
+            if fresh < Config.QUESTION_BANK_MIN_FRESH:
+                _schedule('top_up', filename, owner)
+
+        return [json.loads(data) for _, data in picked]
+    except Exception as e:
+        print(f"Error sampling question bank: {str(e)}")
+        return None
+
+
+def get_question_bank_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    try:
+        conn = _connect()
+        stats['banks'] = conn.execute('SELECT COUNT(*) FROM banks').fetchone()[0]
+        stats['questions'], stats['unserved'] = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(served = 0), 0) FROM questions'
+        ).fetchone()
+    except Exception:
+        stats['banks'] = stats['questions'] = stats['unserved'] = None
+    with _scheduled_lock:
+        stats['scheduled'] = len(_scheduled)
+    return stats
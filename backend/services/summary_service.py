@@ -0,0 +1,281 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from services.context_builder import count_tokens, truncate_to_tokens, join_chunks
+from services.llm_gateway import chat_completion
+
+SUMMARY_MODEL = "gpt-4o-mini"
+
+SECTION_PROMPT = """Summarize this section of a longer document in one paragraph. Keep the key concepts, definitions, examples and any conclusions it states.
+
+Section content:
+{content}
+
+Section summary:"""
+
+MERGE_PROMPT = """These are summaries of consecutive sections of a longer document. Combine them into one summary of the whole passage, keeping its key concepts, details and conclusions in order.
+
+Section summaries:
+{content}
+
+Combined summary:"""
+
+DETAILED_PROMPT = """Provide a comprehensive and detailed summary of this document. Include:
+1. Main topic and purpose
+2. Key concepts and ideas
+3. Important details and examples
+4. Structure and organization
+5. Any conclusions or recommendations
+
+{label}:
+{content}
+
+Provide a detailed summary in 4-6 paragraphs:"""
+
+# Most tokens of a section summary and of a merged summary
+SECTION_SUMMARY_TOKENS = 300
+MERGE_SUMMARY_TOKENS = 500
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_BREAK = re.compile(r'(?<=[.!?\n])\s+')
+
+# A section ends after a paragraph whose hash is divisible by this (once it has
+# DETAILED_SUMMARY_SECTION_TOKENS / 4 tokens), so boundaries depend on content, not position
+SECTION_CUT_MODULUS = 4
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'sections_summarized': 0, 'sections_reused': 0}
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(Config.SECTION_SUMMARY_CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(Config.SECTION_SUMMARY_CACHE_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS section_summaries (
+                key TEXT PRIMARY KEY, summary TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS section_summaries_by_last_used ON section_summaries (last_used);
+        ''')
+        _local.conn = conn
+    return conn
+
+
+def _count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def document_fingerprint(chunks):
+    """
+    Hash of a document's stored chunk ids, which are hashes of the chunk text, so it
+    changes whenever the document's content does.
+    """
+    return hashlib.sha256('\n'.join(chunk['chunk_id'] for chunk in chunks).encode('utf-8')).hexdigest()
+
+
+def _cached_section(key):
+    try:
+        conn = _connect()
+        row = conn.execute('SELECT summary FROM section_summaries WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            with conn:
+                conn.execute('UPDATE section_summaries SET last_used = ? WHERE key = ?', (time.time(), key))
+            return row[0]
+    except Exception as e:
+        print(f"Error reading section summary cache: {str(e)}")
+    return None
+
+
+def _store_section(key, summary):
+    try:
+        conn = _connect()
+        now = time.time()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO section_summaries VALUES (?, ?, ?, ?)', (key, summary, now, now))
+            excess = conn.execute('SELECT COUNT(*) FROM section_summaries').fetchone()[0] - Config.SECTION_SUMMARY_CACHE_MAX_ENTRIES
+            if excess > 0:
+                conn.execute(
+                    'DELETE FROM section_summaries WHERE key IN '
+                    '(SELECT key FROM section_summaries ORDER BY last_used LIMIT ?)', (excess,)
+                )
+    except Exception as e:
+        print(f"Error writing section summary cache: {str(e)}")
+
+
+def _units(text, max_tokens):
+    """
+    Paragraphs of text with their token counts; a paragraph over max_tokens is split at
+    sentence ends, and a sentence over max_tokens is cut by tokens.
+    """
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if tokens <= max_tokens:
+            yield paragraph, tokens
+            continue
+
+        piece, piece_tokens = '', 0
+        for sentence in SENTENCE_BREAK.split(paragraph):
+            sentence_tokens = count_tokens(sentence)
+            while sentence_tokens > max_tokens:
+                head = truncate_to_tokens(sentence, max_tokens)
+                yield head, count_tokens(head)
+                sentence = sentence[len(head):]
+                sentence_tokens = count_tokens(sentence)
+            if piece and piece_tokens + sentence_tokens > max_tokens:
+                yield piece, piece_tokens
+                piece, piece_tokens = '', 0
+            piece = f"{piece} {sentence}" if piece else sentence
+            piece_tokens += sentence_tokens
+        if piece:
+            yield piece, piece_tokens
+
+
+def split_sections(text, section_tokens=None):
+    """
+    Split a document into sections of at most section_tokens tokens along paragraph
+    boundaries. Where a section may end is decided by the paragraphs' own content, so an
+    edit changes only the sections around it and the rest keep their text (and cached
+    summaries).
+    """
+    section_tokens = section_tokens or Config.DETAILED_SUMMARY_SECTION_TOKENS
+    min_tokens = section_tokens // 4
+    sections = []
+    current, current_tokens = [], 0
+    for unit, tokens in _units(text, section_tokens):
+        if current and current_tokens + tokens > section_tokens:
+            sections.append('\n\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += tokens
+        digest = int(hashlib.sha1(unit.encode('utf-8')).hexdigest()[:8], 16)
+        if current_tokens >= min_tokens and digest % SECTION_CUT_MODULUS == 0:
+            sections.append('\n\n'.join(current))
+            current, current_tokens = [], 0
+    if current:
+        sections.append('\n\n'.join(current))
+    return sections
+
+
+def document_text(filename, chunks):
+    """
+    Text of a document to summarize. A chunk window cut back to a sentence end can leave
+    text between chunks unindexed, so the processed text file is used when it still
+    matches the stored chunks (each chunk found at its char offsets); otherwise the
+    chunks are joined.
+    """
+    path = os.path.join(Config.PROCESSED_FOLDER, f"{filename}.txt")
+    if chunks and os.path.exists(path) and all('char_start' in chunk for chunk in chunks):
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if all(text[chunk['char_start']:chunk['char_end']] == chunk['chunk'] for chunk in chunks):
+            return text
+    return join_chunks(chunks)
+
+
+def _summarize_cached(prompt, max_tokens):
+    """
+    Summary for a section (or group of section summaries), served from the section cache
+    when the same prompt (so the same content) was summarized before. Returns (summary, reused).
+    """
+    key = hashlib.sha256(f"{SUMMARY_MODEL}\n{max_tokens}\n{prompt}".encode('utf-8')).hexdigest()
+    summary = _cached_section(key)
+    if summary is not None:
+        _count('sections_reused')
+        return summary, True
+
+    summary = chat_completion(
+        model=SUMMARY_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=0.3,
+        cache=False,  # The section cache holds these
+        call_type='section_summary'
+    ).strip()
+    _store_section(key, summary)
+    _count('sections_summarized')
+    return summary, False
+
+
+def _map(prompts, max_tokens):
+    # Summaries in prompt order, and how many came from the cache
+    if len(prompts) == 1:
+        results = [_summarize_cached(prompts[0], max_tokens)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(Config.DETAILED_SUMMARY_MAP_WORKERS, len(prompts))) as executor:
+            results = list(executor.map(lambda prompt: _summarize_cached(prompt, max_tokens), prompts))
+    return [summary for summary, _ in results], sum(reused for _, reused in results)
+
+
+def _group(texts, max_tokens):
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def summarize_document(filename, chunks):
+    """
+    Detailed summary of a document from its stored chunks (in chunk order), map-reduce style.
+
+    The document's text (see document_text) is split into sections (split_sections) that
+    are summarized in parallel, each summary cached by the section's content. The section
+    summaries are then combined into the final summary; if they don't fit
+    DETAILED_SUMMARY_REDUCE_TOKENS (at least two merged summaries' worth) they are first
+    merged in groups, level by level, each level at least halving them. A document that
+    fits in one section is summarized in a single call.
+
+    Returns {'summary', 'sections', 'sections_reused'}.
+    """
+    reused = 0
+    sections = split_sections(document_text(filename, chunks))
+    if len(sections) <= 1:
+        label, content = "Document content", sections[0] if sections else ''
+    else:
+        summaries, reused = _map([SECTION_PROMPT.format(content=section) for section in sections], SECTION_SUMMARY_TOKENS)
+        # Room for at least two merged summaries per group, so each level can combine some
+        reduce_tokens = max(Config.DETAILED_SUMMARY_REDUCE_TOKENS, 2 * MERGE_SUMMARY_TOKENS)
+        while True:
+            groups = _group(summaries, reduce_tokens)
+            if len(groups) == 1:
+                break
+            if len(groups) == len(summaries):
+                # Summaries that came out longer than asked fill a group each: merge in pairs
+                # so every level still halves the count and the loop ends
+                groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+            summaries, _ = _map([MERGE_PROMPT.format(content='\n\n'.join(group)) for group in groups], MERGE_SUMMARY_TOKENS)
+        label = "Summaries of the document's sections, in order"
+        content = '\n\n'.join(summaries)
+
+    summary = chat_completion(
+        model=SUMMARY_MODEL,
+        messages=[{"role": "user", "content": DETAILED_PROMPT.format(label=label, content=content)}],
+        max_tokens=800,
+        temperature=0.3,
+        call_type='detailed_summary'
+    ).strip()
+    return {'summary': summary, 'sections': len(sections), 'sections_reused': reused}
+
+
+def get_summary_stats():
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from config import Config
+
+# Summary status of a document in summaries.json. Entries written before statuses were
+# recorded have none and count as completed.
+PENDING = 'pending'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+_summaries_lock = threading.Lock()
+# source_hash -> Event set once the summary being generated for that content is stored or fails
+_in_flight = {}
+
+
+def summary_source_hash(chunks):
+    """
+    Hash of the chunk texts a summary is generated from. Identical content gets the same
+    hash under any filename or owner, so its summary can be reused.
+    """
+    return hashlib.sha256('\n\n'.join(chunks).encode('utf-8')).hexdigest()
+
+
+def _load_summaries():
+    if not os.path.exists(Config.SUMMARIES_FILE):
+        return {}
+    with open(Config.SUMMARIES_FILE, 'r') as f:
+        return json.load(f)
+
+
+def _save_summaries(summaries):
+    # Write to a temp file and rename over summaries.json, so readers never see a partial file
+    directory = os.path.dirname(Config.SUMMARIES_FILE)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.summaries-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(summaries, f, indent=2)
+    os.replace(tmp_path, Config.SUMMARIES_FILE)
+
+
+def _is_completed(entry):
+    return entry.get('status', COMPLETED) == COMPLETED and entry.get('summary') is not None
+
+
+def claim_summary(filename, user_id, source_hash):
+    """
+    Decide, atomically, who produces the summary of this content for filename:
+    - ('completed', summary): it already exists, for this file or an identical copy
+      (which is recorded for filename as well);
+    - ('in_progress', event): another thread is generating it; wait on event, then claim again;
+    - ('claimed', None): the caller must generate it and then call complete_summary or
+      fail_summary. The entry is marked pending until then, so a restart can resume it.
+    """
+    user_id = str(user_id)
+    with _summaries_lock:
+        summaries = _load_summaries()
+        entry = summaries.get(filename)
+        if entry and entry.get('source_hash') == source_hash and entry.get('user_id') == user_id and _is_completed(entry):
+            return 'completed', entry['summary']
+
+        copy = next(
+            (other for other in summaries.values() if other.get('source_hash') == source_hash and _is_completed(other)),
+            None
+        )
+        if copy:
+            summaries[filename] = {
+                'summary': copy['summary'],
+                'timestamp': str(int(time.time())),
+                'user_id': user_id,
+                'source_hash': source_hash,
+                'status': COMPLETED
+            }
+            _save_summaries(summaries)
+            return 'completed', copy['summary']
+
+        if source_hash in _in_flight:
+            return 'in_progress', _in_flight[source_hash]
+
+        _in_flight[source_hash] = threading.Event()
+        # A previous summary (of an earlier version) stays visible until the new one is stored
+        entry = summaries.setdefault(filename, {})
+        entry.update({
+            'timestamp': str(int(time.time())),
+            'user_id': user_id,
+            'source_hash': source_hash,
+            'status': PENDING
+        })
+        entry.pop('error', None)
+        _save_summaries(summaries)
+        return 'claimed', None
+
+
+def _finish(filename, source_hash, **fields):
+    with _summaries_lock:
+        try:
+            summaries = _load_summaries()
+            entry = summaries.setdefault(filename, {})
+            entry.update(fields, timestamp=str(int(time.time())), source_hash=source_hash)
+            _save_summaries(summaries)
+        finally:
+            event = _in_flight.pop(source_hash, None)
+            if event:
+                event.set()
+
+
+def complete_summary(filename, source_hash, summary):
+    _finish(filename, source_hash, summary=summary, status=COMPLETED)
+
+
+def fail_summary(filename, source_hash, error):
+    _finish(filename, source_hash, status=FAILED, error=error)
+
+
+def get_summary_entries():
+    """
+    Snapshot of summaries.json: filename -> entry.
+    """
+    with _summaries_lock:
+        return _load_summaries()
+
+
+def get_pending_summaries():
+    """
+    (filename, user_id) of summaries that were claimed but never stored, e.g. because the
+    process stopped mid-ingest.
+    """
+    try:
+        with _summaries_lock:
+            summaries = _load_summaries()
+            return [
+                (filename, entry.get('user_id'))
+                for filename, entry in summaries.items()
+                if entry.get('status') == PENDING and entry.get('source_hash') not in _in_flight
+            ]
+    except Exception as e:
+        print(f"Error reading summaries: {str(e)}")
+        return []
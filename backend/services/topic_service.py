@@ -1,11 +1,9 @@
 import os
 import json
-import openai
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
-from .embedding_service import get_all_chunks
-
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
+from .embedding_service import get_all_chunks, set_document_metadata, topic_metadata_key, get_document_centroids, embed_query
+from .llm_gateway import chat_completion
 
 def get_user_topics(user_id):
     """
@@ -76,6 +74,8 @@ def add_document_to_topic(user_id, topic_name, filename):
                     topic['documents'].append(filename)
                     with open(Config.TOPICS_FILE, 'w') as f:
                         json.dump(topics, f, indent=2)
+                    # Keep the chunks' topic flag in step so topic-filtered search sees the change
+                    set_document_metadata(filename, user_id, {topic_metadata_key(topic_name): True})
                     return {'success': True}
                 else:
                     return {'error': 'Document already in topic'}
@@ -85,6 +85,34 @@ def add_document_to_topic(user_id, topic_name, filename):
         print(f"Error adding document to topic: {str(e)}")
         return {'error': f'Error adding document to topic: {str(e)}'}
 
+def remove_document_from_topic(user_id, topic_name, filename):
+    """
+    Remove a document from a topic.
+    """
+    try:
+        topics = {}
+        if os.path.exists(Config.TOPICS_FILE):
+            with open(Config.TOPICS_FILE, 'r') as f:
+                topics = json.load(f)
+
+        if user_id not in topics:
+            return {'error': 'User has no topics'}
+
+        for topic in topics[user_id]:
+            if topic['name'] == topic_name:
+                if filename not in topic['documents']:
+                    return {'error': 'Document not in topic'}
+                topic['documents'].remove(filename)
+                with open(Config.TOPICS_FILE, 'w') as f:
+                    json.dump(topics, f, indent=2)
+                set_document_metadata(filename, user_id, {topic_metadata_key(topic_name): False})
+                return {'success': True}
+
+        return {'error': 'Topic not found'}
+    except Exception as e:
+        print(f"Error removing document from topic: {str(e)}")
+        return {'error': f'Error removing document from topic: {str(e)}'}
+
 def get_topic_documents(user_id, topic_name):
     """
     Get all documents in a specific topic.
@@ -112,41 +140,94 @@ def delete_topic(user_id, topic_name):
         if user_id not in topics:
             return {'error': 'User has no topics'}
 
+        removed = [topic for topic in topics[user_id] if topic['name'] == topic_name]
         topics[user_id] = [topic for topic in topics[user_id] if topic['name'] != topic_name]
 
         with open(Config.TOPICS_FILE, 'w') as f:
             json.dump(topics, f, indent=2)
 
+        for topic in removed:
+            for filename in topic['documents']:
+                set_document_metadata(filename, user_id, {topic_metadata_key(topic_name): False})
+
         return {'success': True}
     except Exception as e:
         print(f"Error deleting topic: {str(e)}")
         return {'error': f'Error deleting topic: {str(e)}'}
 
-def categorize_document(user_id, filename):
+def add_documents_to_topics(user_id, assignments):
     """
-    Automatically categorize a document into the most appropriate topic.
+    Add many documents to topics in one read-modify-write of the topics file.
+    assignments maps filename -> topic name. Returns the filenames actually added.
     """
-    try:
-        # Get document content
-        processed_dir = Config.PROCESSED_DIR
-        processed_file = os.path.join(processed_dir, f"{filename}.txt")
+    topics = {}
+    if os.path.exists(Config.TOPICS_FILE):
+        with open(Config.TOPICS_FILE, 'r') as f:
+            topics = json.load(f)
 
-        if not os.path.exists(processed_file):
-            return {'error': 'Document not found or not processed'}
+    by_name = {topic['name']: topic for topic in topics.get(user_id, [])}
+    added = {}
+    for filename, topic_name in assignments.items():
+        topic = by_name.get(topic_name)
+        if topic is not None and filename not in topic['documents']:
+            topic['documents'].append(filename)
+            added[filename] = topic_name
 
-        with open(processed_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+    if added:
+        with open(Config.TOPICS_FILE, 'w') as f:
+            json.dump(topics, f, indent=2)
+        for filename, topic_name in added.items():
+            set_document_metadata(filename, user_id, {topic_metadata_key(topic_name): True})
+    return list(added)
 
-        # Get existing topics
-        topics = get_user_topics(user_id)
-        if not topics:
-            return {'error': 'No topics available for categorization'}
+def _topic_centroids(topics, document_centroids):
+    """
+    Unit-length centroid per topic: the mean of its documents' centroids, or, for a topic
+    with no embedded documents yet, the embedding of its name and description.
+    """
+    import numpy as np
+
+    centroids = {}
+    for topic in topics:
+        members = [document_centroids[filename] for filename in topic['documents'] if filename in document_centroids]
+        if members:
+            centroid = np.mean(members, axis=0)
+        else:
+            centroid = np.asarray(embed_query(f"{topic['name']}. {topic.get('description', '')}"), dtype=np.float32)
+        norm = np.linalg.norm(centroid)
+        centroids[topic['name']] = centroid / norm if norm else centroid
+    return centroids
+
+def _match_topic(centroid, topic_centroids):
+    """
+    Best topic for a document centroid and whether the match is confident: cosine
+    similarity of at least CATEGORIZE_MIN_SIMILARITY and CATEGORIZE_MIN_MARGIN above the runner-up.
+    Returns (topic name, similarity, confident).
+    """
+    import numpy as np
+
+    scored = sorted(
+        ((float(np.dot(centroid, topic_centroid)), name) for name, topic_centroid in topic_centroids.items()),
+        reverse=True
+    )
+    similarity, name = scored[0]
+    margin = similarity - scored[1][0] if len(scored) > 1 else similarity
+    confident = similarity >= Config.CATEGORIZE_MIN_SIMILARITY and margin >= Config.CATEGORIZE_MIN_MARGIN
+    return name, similarity, confident
+
+def _llm_choose_topic(filename, topics):
+    """
+    Ask the model which topic a document belongs to, from the start of its processed text.
+    Returns a topic name or "General".
+    """
+    processed_file = os.path.join(Config.PROCESSED_FOLDER, f"{filename}.txt")
+    with open(processed_file, 'r', encoding='utf-8') as f:
+        content = f.read(1000)
 
-        # Use AI to determine the best topic
-        topic_names = [topic['name'] for topic in topics]
-        topic_descriptions = [topic.get('description', '') for topic in topics]
+    topic_names = [topic['name'] for topic in topics]
+    topic_descriptions = [topic.get('description', '') for topic in topics]
 
-        prompt = f"""
+    prompt = f"""
         Given the following document content and available topics, determine which topic this document belongs to.
 
         Document content (first 1000 characters):
@@ -161,26 +242,80 @@ def categorize_document(user_id, filename):
         Return only the topic name that best fits this document. If none fit well, return "General".
         """
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=50,
-            temperature=0.3
-        )
+    best_topic = chat_completion(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=50,
+        temperature=0.3,
+        call_type='categorize'
+    ).strip()
 
-        best_topic = response.choices[0].message.content.strip()
+    # Validate the topic exists
+    if best_topic not in topic_names:
+        best_topic = "General"
+    return best_topic
 
-        # Validate the topic exists
-        if best_topic not in topic_names and best_topic != "General":
-            best_topic = "General"
+def categorize_documents(user_id, filenames):
+    """
+    Pick a topic for each document and record all assignments in one batch.
 
-        # Add document to the topic
-        if best_topic != "General":
-            result = add_document_to_topic(user_id, best_topic, filename)
-            if result.get('error'):
-                return result
+    Each document's centroid embedding is compared with topic centroids built from the
+    documents already in each topic; confident matches are assigned directly. Only
+    low-confidence documents (and ones without stored embeddings) go to the LLM, at most
+    CATEGORIZE_LLM_CONCURRENCY at a time. Returns one result dict per document with
+    topic, method ('centroid' or 'llm') and, for centroid matches, similarity.
+    """
+    topics = get_user_topics(user_id)
+    if not topics:
+        return [{'error': 'No topics available for categorization', 'filename': filename} for filename in filenames]
+
+    member_documents = {filename for topic in topics for filename in topic['documents']}
+    document_centroids = get_document_centroids(user_id, set(filenames) | member_documents)
+    topic_centroids = _topic_centroids(topics, document_centroids)
+
+    results = {}
+    needs_llm = []
+    for filename in filenames:
+        if filename not in document_centroids:
+            needs_llm.append(filename)
+            continue
+        topic_name, similarity, confident = _match_topic(document_centroids[filename], topic_centroids)
+        if confident:
+            results[filename] = {'success': True, 'topic': topic_name, 'filename': filename,
+                                 'method': 'centroid', 'similarity': round(similarity, 4)}
+        else:
+            needs_llm.append(filename)
+
+    def llm_result(filename):
+        if not os.path.exists(os.path.join(Config.PROCESSED_FOLDER, f"{filename}.txt")):
+            return {'error': 'Document not found or not processed', 'filename': filename}
+        try:
+            return {'success': True, 'topic': _llm_choose_topic(filename, topics), 'filename': filename, 'method': 'llm'}
+        except Exception as e:
+            print(f"Error categorizing document {filename}: {str(e)}")
+            return {'error': f'Error categorizing document: {str(e)}', 'filename': filename}
+
+    if needs_llm:
+        with ThreadPoolExecutor(max_workers=Config.CATEGORIZE_LLM_CONCURRENCY) as executor:
+            for filename, result in zip(needs_llm, executor.map(llm_result, needs_llm)):
+                results[filename] = result
+
+    assignments = {
+        filename: result['topic'] for filename, result in results.items()
+        if result.get('success') and result['topic'] != "General"
+    }
+    added = set(add_documents_to_topics(user_id, assignments))
+    for filename in assignments:
+        if filename not in added:
+            results[filename] = {'error': 'Document already in topic', 'filename': filename}
+    return [results[filename] for filename in filenames]
 
-        return {'success': True, 'topic': best_topic, 'filename': filename}
+def categorize_document(user_id, filename):
+    """
+    Automatically categorize a document into the most appropriate topic.
+    """
+    try:
+        return categorize_documents(user_id, [filename])[0]
     except Exception as e:
         print(f"Error categorizing document: {str(e)}")
         return {'error': f'Error categorizing document: {str(e)}'}
@@ -191,7 +326,7 @@ def auto_categorize_all_documents(user_id):
     """
     try:
         # Get all documents
-        documents_dir = Config.DOCUMENTS_DIR
+        documents_dir = Config.DOCUMENTS_FOLDER
         if not os.path.exists(documents_dir):
             return {'error': 'Documents directory not found'}
 
@@ -213,18 +348,15 @@ def auto_categorize_all_documents(user_id):
         if not uncategorized:
             return {'success': True, 'message': 'All documents are already categorized', 'categorized_count': 0}
 
-        # Categorize each document
-        results = []
-        for filename in uncategorized:
-            result = categorize_document(user_id, filename)
-            results.append(result)
-
+        results = categorize_documents(user_id, sorted(uncategorized))
         success_count = sum(1 for r in results if r.get('success'))
+        llm_count = sum(1 for r in results if r.get('method') == 'llm')
 
         return {
             'success': True,
             'message': f'Categorized {success_count} out of {len(uncategorized)} documents',
             'categorized_count': success_count,
+            'llm_count': llm_count,
             'results': results
         }
     except Exception as e: